@@ -0,0 +1,369 @@
+import importlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Iterator, Mapping, Sequence
+
+from pathier import Pathier, Pathish
+
+from hassle import utilities
+from hassle.formatting import hash_content
+
+# `isolated` is `python -m build`, a new environment for each build
+BUILD_MODES = ["cached", "isolated", "in-process"]
+# Backends that don't write into the source tree, so the sdist and wheel can be built at the same time
+CONCURRENT_BACKENDS = [
+    "flit_core.buildapi",
+    "hatchling.build",
+    "pdm.backend",
+    "poetry.core.masonry.api",
+]
+# Written once an environment has everything installed
+ENV_MARKER = "hassle_build_env.json"
+# Held while an environment's extra requirements are installed
+ENV_LOCK = "hassle_build_env.lock"
+# Used for `SOURCE_DATE_EPOCH` outside of git repositories, the earliest time zip files support
+DEFAULT_EPOCH = "315532800"
+# Lists the files in an artifact cache entry, its modification time is when the entry was last used
+ARTIFACTS_MANIFEST = "artifacts.json"
+LIST_VERSIONS = "import importlib.metadata, json; print(json.dumps({d.metadata['Name']: d.version for d in importlib.metadata.distributions()}))"
+
+
+def get_envsdir() -> Pathier:
+    return utilities.get_cachedir() / "build_envs"
+
+
+def get_env_key(requires: list[str]) -> str:
+    """Returns a key for a build environment with `requires` installed for this Python."""
+    return hash_content(
+        json.dumps([sorted(requires), sys.version, sys.executable]).encode()
+    )[:16]
+
+
+def get_env_python(envdir: Pathier) -> Pathier:
+    return envdir / ("Scripts/python.exe" if os.name == "nt" else "bin/python")
+
+
+def install(python: Pathier, requirements: list[str]):
+    """Install `requirements` into the environment of `python` with this environment's pip."""
+    subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "pip",
+            "--python",
+            str(python),
+            "install",
+            "--disable-pip-version-check",
+            "--quiet",
+            *requirements,
+        ],
+        check=True,
+    )
+
+
+def get_build_env(requires: list[str], envsdir: Pathish | None = None) -> Pathier:
+    """Returns the directory of a virtual environment with `requires` installed,
+    creating it in `envsdir` (defaults to `get_envsdir()`) the first time.
+
+    The same environment is returned for the same `requires` until it's deleted.
+
+    The environment is created in a temporary directory and renamed into place once it's complete,
+    so processes creating it at the same time never share a half installed environment.
+    If another process finishes first, its environment is used.
+    Its scripts aren't usable after the rename, so everything in it is run with `python -m`.
+    """
+    envsdir = Pathier(envsdir or get_envsdir())
+    envdir = envsdir / get_env_key(requires)
+    if (envdir / ENV_MARKER).exists():
+        return envdir
+    import tempfile
+    import venv
+
+    envsdir.mkdir()
+    tempdir = Pathier(tempfile.mkdtemp(prefix=f".{envdir.name}.", dir=envsdir))
+    try:
+        venv.create(tempdir, symlinks=os.name != "nt")
+        if requires:
+            install(get_env_python(tempdir), requires)
+        (tempdir / ENV_MARKER).dumps(
+            {"requires": requires, "extras": [], "versions": get_env_versions(tempdir)}
+        )
+        try:
+            os.replace(tempdir, envdir)
+        except OSError:
+            if not (envdir / ENV_MARKER).exists():
+                # Left by a process that was interrupted before environments were created this way
+                envdir.delete()
+                os.replace(tempdir, envdir)
+    finally:
+        # Only still here if another process created the environment first
+        tempdir.delete()
+    return envdir
+
+
+def get_env_versions(envdir: Pathier) -> dict[str, str]:
+    """Returns the version of each distribution installed in `envdir`."""
+    output = subprocess.run(
+        [get_env_python(envdir), "-c", LIST_VERSIONS],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output)
+
+
+def install_extras(envdir: Pathier, requirements: list[str]):
+    """Install any of `requirements` that haven't already been installed into `envdir`.
+
+    Holds a lock on `envdir` so builds sharing it don't install into it or update its marker at the same time.
+    """
+    marker = envdir / ENV_MARKER
+    with utilities.file_lock(envdir / ENV_LOCK):
+        state = marker.loads()
+        missing = [
+            requirement
+            for requirement in requirements
+            if requirement not in state["requires"] + state["extras"]
+        ]
+        if missing:
+            install(get_env_python(envdir), missing)
+            state["extras"] += missing
+            state["versions"] = get_env_versions(envdir)
+            utilities.atomic_dumps(marker, state)
+
+
+def get_backend_versions(
+    requires: list[str], backend: str, mode: str, envsdir: Pathish | None = None
+) -> dict[str, str]:
+    """Returns the version of each distribution that a build in `mode` (except `isolated`) would use.
+
+    For `cached`, that's everything installed in the build environment, which is created if it doesn't exist.
+    For `in-process`, that's the distribution `backend` is imported from."""
+    if mode == "cached":
+        envdir = get_build_env(requires, envsdir)
+        state = (envdir / ENV_MARKER).loads()
+        # Environments created before versions were recorded
+        if "versions" not in state:
+            with utilities.file_lock(envdir / ENV_LOCK):
+                state = (envdir / ENV_MARKER).loads()
+                state.setdefault("versions", get_env_versions(envdir))
+                utilities.atomic_dumps(envdir / ENV_MARKER, state)
+        return state["versions"]
+    import importlib.metadata
+
+    module = backend.partition(":")[0].partition(".")[0]
+    return {
+        distribution: importlib.metadata.version(distribution)
+        for distribution in importlib.metadata.packages_distributions().get(module, [])
+    }
+
+
+def get_source_date_epoch(projectdir: Pathish) -> str:
+    """Returns `$SOURCE_DATE_EPOCH` if it's set, otherwise the time of the last commit in `projectdir`,
+    or `DEFAULT_EPOCH` if it isn't a git repository."""
+    if epoch := os.environ.get("SOURCE_DATE_EPOCH"):
+        return epoch
+    result = subprocess.run(
+        ["git", "log", "-1", "--format=%ct"],
+        cwd=projectdir,
+        capture_output=True,
+        text=True,
+    )
+    return (
+        result.stdout.strip()
+        if result.returncode == 0 and result.stdout.strip()
+        else DEFAULT_EPOCH
+    )
+
+
+@contextmanager
+def source_date_epoch(epoch: str):
+    """Set `$SOURCE_DATE_EPOCH` to `epoch` so build backends use it for the timestamps in the artifacts."""
+    previous = os.environ.get("SOURCE_DATE_EPOCH")
+    os.environ["SOURCE_DATE_EPOCH"] = epoch
+    try:
+        yield
+    finally:
+        if previous is None:
+            del os.environ["SOURCE_DATE_EPOCH"]
+        else:
+            os.environ["SOURCE_DATE_EPOCH"] = previous
+
+
+def get_build_key(
+    hashes: dict[str, str], versions: dict[str, str], epoch: str, mode: str
+) -> str:
+    """Returns a key for the artifacts built from files with `hashes` (keyed by their path in the project)
+    with the distributions in `versions` at `epoch` in `mode`."""
+    return hash_content(
+        json.dumps(
+            [sorted(hashes.items()), sorted(versions.items()), epoch, mode]
+        ).encode()
+    )
+
+
+class ArtifactCache:
+    """Sdists and wheels in `path`, stored by the key of the build that made them."""
+
+    def __init__(self, path: Pathish):
+        self.path = Pathier(path)
+
+    def restore(self, key: str, distdir: Pathish) -> list[str] | None:
+        """Copy the artifacts stored under `key` to `distdir` and return their names,
+        or return `None` if there aren't any."""
+        manifest = self.path / key / ARTIFACTS_MANIFEST
+        if not manifest.exists():
+            return None
+        distdir = Pathier(distdir)
+        distdir.mkdir()
+        names = manifest.loads()["files"]
+        for name in names:
+            shutil.copy2(self.path / key / name, distdir / name)
+        # Keeps recently used artifacts from being pruned
+        os.utime(manifest)
+        return names
+
+    def store(self, key: str, distdir: Pathish):
+        """Copy the artifacts in `distdir` into this cache under `key`."""
+        distdir = Pathier(distdir)
+        entry = self.path / key
+        temp = self.path / f"{key}.tmp"
+        temp.delete()
+        temp.mkdir()
+        names = sorted(path.name for path in distdir.iterdir() if path.is_file())
+        for name in names:
+            shutil.copy2(distdir / name, temp / name)
+        # Written last so an interrupted store isn't mistaken for a complete one
+        (temp / ARTIFACTS_MANIFEST).dumps({"files": names})
+        entry.delete()
+        os.replace(temp, entry)
+
+    def prune(self, keep: int, max_age_days: float) -> list[str]:
+        """Remove everything except the `keep` most recently used entries
+        that have been used in the last `max_age_days` days and return the keys that were removed.
+        """
+        if not self.path.exists():
+            return []
+        entries = sorted(
+            (entry for entry in self.path.iterdir() if entry.is_dir()),
+            key=lambda entry: (
+                (entry / ARTIFACTS_MANIFEST).stat().st_mtime
+                if (entry / ARTIFACTS_MANIFEST).exists()
+                else 0
+            ),
+            reverse=True,
+        )
+        cutoff = time.time() - max_age_days * 24 * 60 * 60
+        removed: list[str] = []
+        for i, entry in enumerate(entries):
+            manifest = entry / ARTIFACTS_MANIFEST
+            if i >= keep or not manifest.exists() or manifest.stat().st_mtime < cutoff:
+                entry.delete()
+                removed.append(entry.name)
+        return removed
+
+
+def run_hook(
+    cmd: Sequence[str],
+    cwd: str | None = None,
+    extra_environ: Mapping[str, str] | None = None,
+):
+    """Runs a build backend hook and prints its output once it's finished,
+    so the output of hooks running at the same time isn't interleaved."""
+    result = subprocess.run(
+        cmd,
+        cwd=cwd,
+        env=os.environ | dict(extra_environ or {}),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+    print(result.stdout, end="")
+    result.check_returncode()
+
+
+def load_backend(name: str) -> Any:
+    """Import and return the build backend object `name` refers to, e.g. `hatchling.build`
+    or `setuptools.build_meta:__legacy__`."""
+    module, _, attributes = name.partition(":")
+    backend = importlib.import_module(module)
+    for attribute in filter(None, attributes.split(".")):
+        backend = getattr(backend, attribute)
+    return backend
+
+
+def build_in_process(projectdir: Pathier, distdir: Pathier, backend: str) -> list[str]:
+    """Build the sdist and wheel for `projectdir` into `distdir` by calling the hooks of `backend` in this process.
+
+    The backend has to be importable from the environment hassle is running in."""
+    hooks = load_backend(backend)
+    previous_cwd = os.getcwd()
+    # The hooks expect the project to be the current directory,
+    # which is shared by every thread, so these run one at a time
+    os.chdir(projectdir)
+    try:
+        return [hooks.build_sdist(str(distdir)), hooks.build_wheel(str(distdir))]
+    finally:
+        os.chdir(previous_cwd)
+
+
+def build_in_env(
+    projectdir: Pathier, distdir: Pathier, envdir: Pathier, backend: str
+) -> list[str]:
+    """Build the sdist and wheel for `projectdir` into `distdir` with the Python in `envdir`.
+
+    If `backend` is one of `CONCURRENT_BACKENDS`, they're built at the same time."""
+    from build import ProjectBuilder
+
+    builder = ProjectBuilder(projectdir, str(get_env_python(envdir)), run_hook)
+    distributions = ["sdist", "wheel"]
+    for distribution in distributions:
+        install_extras(envdir, sorted(builder.get_requires_for_build(distribution)))
+    if backend not in CONCURRENT_BACKENDS:
+        return [builder.build(distribution, distdir) for distribution in distributions]
+    with ThreadPoolExecutor(len(distributions)) as executor:
+        return list(
+            executor.map(
+                lambda distribution: builder.build(distribution, distdir), distributions
+            )
+        )
+
+
+def build(
+    projectdir: Pathish,
+    distdir: Pathish,
+    requires: list[str],
+    backend: str,
+    mode: str = "cached",
+    envsdir: Pathish | None = None,
+    epoch: str | None = None,
+):
+    """Build the sdist and wheel for `projectdir` into `distdir`
+    with `$SOURCE_DATE_EPOCH` set to `epoch` (defaults to `get_source_date_epoch()`).
+
+    `mode` is one of `BUILD_MODES`:
+    * `cached` runs the `backend` hooks in a build environment with `requires` installed that's reused
+    for every build with the same `requires` (see `get_build_env()`).
+    Unlike `python -m build`, the wheel is built from the source tree instead of the sdist.
+    * `isolated` runs `python -m build`.
+    * `in-process` calls the `backend` hooks in this process."""
+    projectdir = Pathier(projectdir).resolve()
+    distdir = Pathier(distdir).resolve()
+    with source_date_epoch(epoch or get_source_date_epoch(projectdir)):
+        if mode == "isolated":
+            utilities.run_and_print([sys.executable, "-m", "build", projectdir])
+            return
+        if mode == "in-process":
+            distdir.mkdir()
+            names = build_in_process(projectdir, distdir, backend)
+        else:
+            names = build_in_env(
+                projectdir, distdir, get_build_env(requires, envsdir), backend
+            )
+    print(f"Successfully built {' and '.join(Pathier(name).name for name in names)}")
@@ -0,0 +1,155 @@
+import os
+import re
+import shutil
+import subprocess
+from dataclasses import dataclass
+from datetime import date
+
+from pathier import Pathier, Pathish
+from typing_extensions import Self
+
+# Section titles for conventional commit types, in the order they're written.
+TYPES = {
+    "feat": "New Features",
+    "fix": "Fixes",
+    "perf": "Performance improvements",
+    "refactor": "Refactorings",
+    "docs": "Docs",
+    "test": "Tests",
+    "build": "Build",
+    "ci": "Continuous integration",
+    "style": "Code style",
+}
+OTHERS = "Others"
+HEADER = "# Changelog\n"
+# Commits hassle makes itself during `update`
+IGNORE = re.compile(r"^chore: (build |update changelog$)")
+CONVENTIONAL_COMMIT = re.compile(
+    r"^(?P<type>[a-zA-Z]+)(?:\((?P<scope>[^)]*)\))?(?P<breaking>!)?: (?P<description>.+)$"
+)
+# Unit and record separators so commit subjects can contain anything
+FIELD, RECORD = "\x1f", "\x1e"
+
+
+@dataclass
+class Commit:
+    hash: str
+    subject: str
+    type: str
+    description: str
+    scope: str = ""
+    breaking: bool = False
+
+    @classmethod
+    def parse(cls, hash: str, subject: str) -> Self:
+        """Parse a conventional commit `subject`.
+
+        Subjects that aren't conventional commits get an empty `type`."""
+        match = CONVENTIONAL_COMMIT.match(subject.strip())
+        if not match:
+            return cls(hash, subject.strip(), "", subject.strip())
+        return cls(
+            hash,
+            subject.strip(),
+            match["type"].lower(),
+            match["description"],
+            match["scope"] or "",
+            bool(match["breaking"]),
+        )
+
+    @property
+    def section(self) -> str:
+        return TYPES.get(self.type, OTHERS)
+
+    def format(self) -> str:
+        """Returns this commit as a changelog entry."""
+        entry = (
+            f"* **{self.scope}:** {self.description}"
+            if self.scope
+            else f"* {self.description}"
+        )
+        return f"{entry} (BREAKING)" if self.breaking else entry
+
+
+def git(projectdir: Pathish, *args: str) -> subprocess.CompletedProcess[str]:
+    return subprocess.run(
+        ["git", *args], cwd=projectdir, capture_output=True, text=True
+    )
+
+
+def get_last_tag(projectdir: Pathish, tag_prefix: str = "") -> str | None:
+    """Returns the most recent tag reachable from `HEAD` that looks like `{tag_prefix}{version}`, if there is one."""
+    result = git(
+        projectdir, "describe", "--tags", "--abbrev=0", "--match", f"{tag_prefix}[0-9]*"
+    )
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def get_commits(projectdir: Pathish, since: str | None = None) -> list[Commit]:
+    """Returns the non-merge commits after `since` (or all of them if `None`), newest first."""
+    revisions = f"{since}..HEAD" if since else "HEAD"
+    result = git(
+        projectdir, "log", "--no-merges", f"--format=%H{FIELD}%s{RECORD}", revisions
+    )
+    result.check_returncode()
+    commits: list[Commit] = []
+    for record in result.stdout.split(RECORD):
+        if record.strip():
+            hash, subject = record.strip().split(FIELD, 1)
+            commits.append(Commit.parse(hash, subject))
+    return commits
+
+
+def render_section(title: str, commits: list[Commit], day: date | None = None) -> str:
+    """Render `commits` as a changelog section with the heading `## {title} ({day})`.
+
+    Returns an empty string if none of `commits` belong in the changelog."""
+    sections: dict[str, list[str]] = {name: [] for name in [*TYPES.values(), OTHERS]}
+    for commit in commits:
+        if not IGNORE.match(commit.subject):
+            sections[commit.section].append(commit.format())
+    if not any(sections.values()):
+        return ""
+    lines = [f"## {title} ({(day or date.today()).isoformat()})\n", "\n"]
+    for name, entries in sections.items():
+        if entries:
+            lines.append(f"#### {name}\n\n")
+            lines.extend(f"{entry}\n" for entry in entries)
+    lines.append("\n\n")
+    return "".join(lines)
+
+
+def prepend_section(path: Pathish, section: str):
+    """Insert `section` after the header of the changelog at `path`, creating it if it doesn't exist.
+
+    The existing content is streamed into a temporary file behind the new section,
+    which then replaces `path`."""
+    path = Pathier(path)
+    temp_path = path.with_name(f"{path.name}.tmp")
+    with temp_path.open("w", encoding="utf-8") as output:
+        output.write(f"{HEADER}\n{section}")
+        if path.exists():
+            with path.open(encoding="utf-8") as changelog:
+                line = changelog.readline()
+                # Skip the existing header and the blank lines after it
+                if line == HEADER:
+                    line = changelog.readline()
+                    while line == "\n":
+                        line = changelog.readline()
+                output.write(line)
+                shutil.copyfileobj(changelog, output)
+    os.replace(temp_path, path)
+
+
+def update_changelog(
+    path: Pathish, projectdir: Pathish, tag: str, tag_prefix: str = ""
+) -> bool:
+    """Add a section for `tag` to the changelog at `path` with the commits made since the last tag.
+
+    Returns `False` if there were no commits worth adding."""
+    commits = get_commits(projectdir, get_last_tag(projectdir, tag_prefix))
+    section = render_section(tag, commits)
+    if not section:
+        return False
+    prepend_section(path, section)
+    return True
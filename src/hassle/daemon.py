@@ -0,0 +1,385 @@
+import json
+import os
+import socket
+import socketserver
+import struct
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, BinaryIO, Iterator, Mapping
+
+if TYPE_CHECKING:
+    from hassle.models import HassleProject
+
+# Commands that prompt for input, which the daemon can't forward, or that manage the daemon
+LOCAL_COMMANDS = ["daemon", "new", "publish", "update"]
+# Imported when the daemon starts so the first command doesn't pay for them
+WARM_MODULES = [
+    "hassle.hassle_cli",
+    "hassle.models",
+    "hassle.formatting",
+    "hassle.testing",
+    "hassle.pipeline",
+    "black",
+    "isort",
+    "coverage",
+    "hassle.release",
+    "requests",
+]
+# Frames sent to the client are a type, a payload length, and the payload
+HEADER = struct.Struct(">cI")
+OUTPUT = b"o"
+EXIT = b"x"
+CHUNK_SIZE = 64 * 1024
+# How long to wait for processes started by a command to close its output after it finishes
+LINGER_SECONDS = 5
+# The only environment variables sent to the daemon, so secrets like `$TWINE_PASSWORD` never leave the client
+FORWARDED_ENV = [
+    "COLUMNS",
+    "CONDA_PREFIX",
+    "FORCE_COLOR",
+    "HOME",
+    "LANG",
+    "LINES",
+    "LOGNAME",
+    "NO_COLOR",
+    "PATH",
+    "PYTHONHASHSEED",
+    "PYTHONIOENCODING",
+    "PYTHONPATH",
+    "PYTHONUTF8",
+    "SHELL",
+    "SOURCE_DATE_EPOCH",
+    "TERM",
+    "TMPDIR",
+    "TZ",
+    "USER",
+    "VIRTUAL_ENV",
+]
+FORWARDED_ENV_PREFIXES = ["COVERAGE_", "GIT_", "HASSLE_", "LC_", "PYTEST_", "XDG_"]
+
+
+def get_socket_dir() -> str:
+    """Returns a directory only this user can access for the daemon's socket,
+    `$XDG_RUNTIME_DIR/hassle` or a per user directory in the temp directory, creating it if needed.
+
+    Raises `PermissionError` if it exists but belongs to another user or other users can access it.
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    directory = (
+        os.path.join(runtime_dir, "hassle")
+        if runtime_dir
+        else os.path.join(tempfile.gettempdir(), f"hassle-{os.getuid()}")
+    )
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        ...
+    stat = os.lstat(directory)
+    if stat.st_uid != os.getuid() or stat.st_mode & 0o077 or os.path.islink(directory):
+        raise PermissionError(
+            f"{directory} has to be a directory that only you can access."
+        )
+    return directory
+
+
+def get_socket_path() -> str:
+    """Returns `$HASSLE_SOCKET` if it's set, otherwise a socket file in `get_socket_dir()`."""
+    return os.environ.get("HASSLE_SOCKET") or os.path.join(
+        get_socket_dir(), "hassle.sock"
+    )
+
+
+def get_forwarded_env(env: Mapping[str, str]) -> dict[str, str]:
+    """Returns the variables in `env` that are in `FORWARDED_ENV` or start with one of `FORWARDED_ENV_PREFIXES`."""
+    return {
+        name: value
+        for name, value in env.items()
+        if name in FORWARDED_ENV or name.startswith(tuple(FORWARDED_ENV_PREFIXES))
+    }
+
+
+def get_peer_uid(connection: socket.socket) -> int:
+    """Returns the id of the user on the other end of the unix socket `connection`."""
+    if hasattr(socket, "SO_PEERCRED"):
+        credentials = struct.Struct("3i")
+        _, uid, _ = credentials.unpack(
+            connection.getsockopt(
+                socket.SOL_SOCKET, socket.SO_PEERCRED, credentials.size
+            )
+        )
+        return uid
+    # Platforms without `SO_PEERCRED` fall back to whoever owns the socket file
+    return os.stat(connection.getpeername()).st_uid
+
+
+def send_frame(connection: socket.socket, kind: bytes, payload: bytes):
+    connection.sendall(HEADER.pack(kind, len(payload)) + payload)
+
+
+def receive_frames(file: BinaryIO) -> Iterator[tuple[bytes, bytes]]:
+    """Yield the type and payload of each frame read from `file` until it's closed."""
+    while len(header := file.read(HEADER.size)) == HEADER.size:
+        kind, size = HEADER.unpack(header)
+        yield kind, file.read(size)
+
+
+def connect(path: str) -> socket.socket:
+    """Returns a connection to the daemon listening on `path`.
+
+    Raises `ConnectionError` or `FileNotFoundError` if there isn't one
+    and `PermissionError` if it's being run by another user."""
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+        if get_peer_uid(connection) != os.getuid():
+            raise PermissionError(f"{path} belongs to another user.")
+    except Exception:
+        connection.close()
+        raise
+    return connection
+
+
+def request(connection: socket.socket, message: dict, output: BinaryIO) -> int:
+    """Send `message` to the daemon on the other end of `connection`,
+    write its output to `output` as it arrives, and return the exit code it finishes with.
+    """
+    with connection, connection.makefile("rb") as file:
+        connection.sendall(json.dumps(message).encode() + b"\n")
+        for kind, payload in receive_frames(file):
+            if kind == EXIT:
+                return int(payload)
+            output.write(payload)
+            output.flush()
+    raise RuntimeError("The hassle daemon closed the connection before finishing.")
+
+
+def is_running(path: str) -> bool:
+    """Returns whether a daemon run by this user is listening on `path`."""
+    try:
+        connect(path).close()
+    except (ConnectionError, FileNotFoundError, PermissionError):
+        return False
+    return True
+
+
+@contextmanager
+def forward_output(connection: socket.socket):
+    """Send everything written to stdout and stderr to `connection` in `OUTPUT` frames,
+    including the output of any subprocesses, until the context exits.
+
+    Stdin is redirected to `os.devnull`, so anything that prompts gets an `EOFError`.
+    If the client disconnects, output is discarded so the command can still finish.
+    Output from processes still running `LINGER_SECONDS` after the context exits isn't sent.
+    """
+    read_fd, write_fd = os.pipe()
+    connected = True
+
+    def forward():
+        nonlocal connected
+        with open(read_fd, "rb", buffering=0) as pipe:
+            while chunk := pipe.read(CHUNK_SIZE):
+                if connected:
+                    try:
+                        send_frame(connection, OUTPUT, chunk)
+                    except OSError:
+                        connected = False
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = [os.dup(fd) for fd in (0, 1, 2)]
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(write_fd, 1)
+    os.dup2(write_fd, 2)
+    os.close(devnull)
+    os.close(write_fd)
+    thread = threading.Thread(target=forward, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        for fd, saved_fd in enumerate(saved):
+            os.dup2(saved_fd, fd)
+            os.close(saved_fd)
+        # Finishes once every process with the write end has closed it
+        thread.join(LINGER_SECONDS)
+        connected = False
+
+
+def get_pyproject_key(projectdir: str) -> tuple[int, int] | None:
+    """Returns the modification time and size of `projectdir/pyproject.toml`, or `None` if it doesn't exist."""
+    try:
+        stat = os.stat(os.path.join(projectdir, "pyproject.toml"))
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    server: "Daemon"
+
+    def handle(self):
+        if get_peer_uid(self.request) != os.getuid():
+            return
+        line = self.rfile.readline()
+        # `is_running()` connects without sending anything
+        if not line:
+            return
+        message = json.loads(line)
+        if message.get("control") == "stop":
+            self.server.stopping = True
+            send_frame(self.request, OUTPUT, b"Stopping the hassle daemon.\n")
+            exit_code = 0
+        elif message.get("control") == "status":
+            send_frame(self.request, OUTPUT, f"{self.server.status}\n".encode())
+            exit_code = 0
+        else:
+            exit_code = self.server.run(
+                message["argv"], message["cwd"], message["env"], self.request
+            )
+        send_frame(self.request, EXIT, str(exit_code).encode())
+
+
+class Daemon(socketserver.UnixStreamServer):
+    """Runs the hassle commands sent by `request()` in this process, one at a time,
+    so hassle and its dependencies are only imported once.
+
+    Each command runs in the client's working directory and the part of its environment `get_forwarded_env()` sends.
+    The project loaded by a command is reused by the next command in the same directory,
+    unless that directory's `pyproject.toml` has changed or the command failed.
+    Only the user running the daemon can connect to it."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.stopping = False
+        self.started_at = time.time()
+        self.commands_run = 0
+        self.projects: dict[str, tuple[tuple[int, int] | None, "HassleProject"]] = {}
+        if os.path.exists(path):
+            # Left by a daemon that didn't shut down cleanly
+            os.unlink(path)
+        super().__init__(path, RequestHandler)
+        os.chmod(path, 0o600)
+
+    @property
+    def status(self) -> str:
+        started = time.strftime("%Y-%m-%d %H:%M", time.localtime(self.started_at))
+        return f"hassle daemon {os.getpid()} listening on {self.path} since {started}, {self.commands_run} commands run, {len(self.projects)} projects loaded."
+
+    def warm(self):
+        """Import `WARM_MODULES`, skipping any that aren't installed,
+        and start the process `multiprocessing` uses to clean up after worker processes.
+
+        It outlives every command, so it would hold on to the output of whichever started it.
+        """
+        import importlib
+        from multiprocessing import resource_tracker
+
+        resource_tracker.ensure_running()
+        for module in WARM_MODULES:
+            try:
+                importlib.import_module(module)
+            except ImportError:
+                ...
+
+    def get_project(self, projectdir: str) -> "HassleProject | None":
+        """Returns the project loaded for `projectdir` if its `pyproject.toml` hasn't changed since."""
+        key, project = self.projects.get(projectdir, (None, None))
+        if project and key == get_pyproject_key(projectdir):
+            return project
+        self.projects.pop(projectdir, None)
+        return None
+
+    def run(self, argv: list[str], cwd: str, env: dict[str, str], connection) -> int:
+        """Run the hassle command in `argv` with `cwd` as the working directory and `env` as the environment,
+        forwarding its output to `connection`.
+
+        Returns the command's exit code."""
+        from hassle.formatting import get_formatters
+        from hassle.hassle_cli import HassleShell
+        from hassle.hassle_cli import run as run_command
+
+        # Formatter settings come from `pyproject.toml` and would otherwise be cached for good
+        get_formatters.cache_clear()
+        start = time.perf_counter()
+        previous_cwd = os.getcwd()
+        previous_env = dict(os.environ)
+        shell = HassleShell()
+        try:
+            os.chdir(cwd)
+            os.environ.clear()
+            os.environ.update(env)
+            if project := self.get_project(cwd):
+                shell.project = project
+            with forward_output(connection):
+                try:
+                    exit_code = run_command(argv, shell)
+                except SystemExit as e:
+                    exit_code = e.code if isinstance(e.code, int) else int(bool(e.code))
+                except Exception:
+                    traceback.print_exc()
+                    exit_code = 1
+        finally:
+            os.chdir(previous_cwd)
+            os.environ.clear()
+            os.environ.update(previous_env)
+        if exit_code == 0 and "project" in shell.__dict__:
+            self.projects[cwd] = (get_pyproject_key(cwd), shell.project)
+        else:
+            self.projects.pop(cwd, None)
+        self.commands_run += 1
+        print(
+            f"{cwd}: hassle {' '.join(argv)} exited with {exit_code} in {time.perf_counter() - start:.2f}s"
+        )
+        return exit_code
+
+    def serve(self):
+        """Handle requests until a client asks the daemon to stop."""
+        try:
+            while not self.stopping:
+                self.handle_request()
+        finally:
+            os.unlink(self.path)
+
+
+def serve(path: str | None = None):
+    """Start a daemon listening on `path` (defaults to `get_socket_path()`) and serve until it's stopped."""
+    path = path or get_socket_path()
+    with Daemon(path) as daemon:
+        daemon.warm()
+        print(f"Listening on {path}")
+        daemon.serve()
+
+
+def client():
+    """Entry point for `hassle-client`.
+
+    Forwards the command line to a running daemon and streams its output back,
+    or runs the command in this process if no daemon is running
+    or the command is one of `LOCAL_COMMANDS`.
+
+    Nothing is sent to a daemon run by another user."""
+    argv = sys.argv[1:]
+    if not argv or argv[0] not in LOCAL_COMMANDS:
+        try:
+            connection = connect(get_socket_path())
+        except PermissionError as e:
+            print(f"Not using the hassle daemon: {e}", file=sys.stderr)
+        except (ConnectionError, FileNotFoundError):
+            ...
+        else:
+            message = {
+                "argv": argv,
+                "cwd": os.getcwd(),
+                "env": get_forwarded_env(os.environ),
+            }
+            sys.exit(request(connection, message, sys.stdout.buffer))
+    from hassle.hassle_cli import main
+
+    main()
@@ -0,0 +1,323 @@
+import ast
+import importlib.metadata
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Any, Iterable, Iterator
+
+from pathier import Pathier, Pathish
+from typing_extensions import Self
+
+from hassle import utilities
+from hassle.formatting import hash_content
+
+# Below this many changed files, parsing happens in the calling process.
+MIN_PARALLEL_FILES = 32
+
+
+@dataclass
+class Dependency:
+    """A third party distribution imported by a project."""
+
+    import_name: str
+    distribution_name: str
+    version: str
+
+    def get_formatted_requirement(self, version_conditional: str | None = None) -> str:
+        """Returns `{distribution_name}{version_conditional}{version}`,
+        or just the distribution name if `version_conditional` isn't given."""
+        if version_conditional:
+            return f"{self.distribution_name}{version_conditional}{self.version}"
+        return self.distribution_name
+
+
+class RequirementSet:
+    """An ordered set of PEP 508 requirement strings, indexed by their PEP 503 normalized distribution name."""
+
+    def __init__(self, requirements: Iterable[str] = []):
+        self._requirements: dict[str, str] = {}
+        for requirement in requirements:
+            self.add(requirement)
+
+    @staticmethod
+    def get_name(requirement: str) -> str:
+        """Return the normalized distribution name of `requirement`."""
+        from packaging.requirements import InvalidRequirement, Requirement
+
+        try:
+            name = Requirement(requirement).name
+        except InvalidRequirement:
+            # Fall back to whatever leads the string so hand written entries still merge
+            match = re.match(r"\s*([A-Za-z0-9][A-Za-z0-9._-]*)", requirement)
+            name = match.group(1) if match else requirement.strip()
+        return utilities.normalize_name(name)
+
+    def add(self, requirement: str, replace: bool = False) -> bool:
+        """Add `requirement` if its distribution isn't already in this set, or if `replace` is `True`.
+
+        Returns whether `requirement` was added."""
+        name = self.get_name(requirement)
+        if name in self._requirements and not replace:
+            return False
+        self._requirements[name] = requirement
+        return True
+
+    def get(self, name: str) -> str | None:
+        """Return the requirement for distribution `name`, if there is one."""
+        return self._requirements.get(utilities.normalize_name(name))
+
+    def __contains__(self, name: str) -> bool:
+        return utilities.normalize_name(name) in self._requirements
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._requirements.values())
+
+    def __len__(self) -> int:
+        return len(self._requirements)
+
+
+def get_site_dirs() -> list[str]:
+    """Returns the existing directories distributions get installed to for the current interpreter.
+
+    Unlike `sys.path`, this doesn't include the current directory or a project's source directory.
+    """
+    import site
+    import sysconfig
+
+    paths = [sysconfig.get_path("purelib"), sysconfig.get_path("platlib")]
+    paths.extend(site.getsitepackages())
+    if site.ENABLE_USER_SITE:
+        paths.append(site.getusersitepackages())
+    return [path for path in dict.fromkeys(paths) if os.path.isdir(path)]
+
+
+def get_site_packages_key() -> str:
+    """Return a hash of the current interpreter and the modification times of its site directories.
+
+    Installing or removing a distribution changes the mtime of the directory it's in."""
+    parts = [sys.executable]
+    for path in get_site_dirs():
+        parts.append(f"{path}:{os.stat(path).st_mtime_ns}")
+    return hash_content("\n".join(parts).encode())
+
+
+@dataclass
+class DistributionIndex:
+    """Which installed distributions provide each importable top level name, and the version of each distribution.
+
+    Building this means reading the metadata of every installed distribution,
+    so it's saved to disk and only rebuilt when `get_site_packages_key()` changes."""
+
+    key: str = ""
+    packages: dict[str, list[str]] = field(default_factory=dict)
+    versions: dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def build(cls) -> Self:
+        """Build an index from the currently installed distributions."""
+        versions: dict[str, str] = {}
+        for distribution in importlib.metadata.distributions():
+            name = distribution.metadata["Name"]
+            if name:
+                versions.setdefault(
+                    utilities.normalize_name(name), distribution.version
+                )
+        return cls(
+            get_site_packages_key(),
+            importlib.metadata.packages_distributions(),
+            versions,
+        )
+
+    @classmethod
+    def load(cls, path: Pathish | None = None) -> Self:
+        """Load the index saved at `path`, rebuilding and saving it if it's missing or out of date.
+
+        `path` defaults to a file in hassle's cache directory that's specific to the current interpreter.
+        """
+        path = Pathier(
+            path
+            or utilities.get_cachedir()
+            / "distributions"
+            / f"{hash_content(sys.executable.encode())[:16]}.json"
+        )
+        key = get_site_packages_key()
+        if path.exists():
+            try:
+                index = cls(**path.loads())
+                if index.key == key:
+                    return index
+            except Exception:
+                ...
+        index = cls.build()
+        path.dumps(asdict(index))
+        return index
+
+    def get_distribution(self, import_name: str) -> str | None:
+        """Return the name of the distribution that provides `import_name`, if it's installed."""
+        distributions = self.packages.get(import_name)
+        return distributions[0] if distributions else None
+
+    def get_version(self, distribution_name: str) -> str:
+        """Return the installed version of `distribution_name` or an empty string if it isn't installed."""
+        return self.versions.get(utilities.normalize_name(distribution_name), "")
+
+
+def get_imports(source: str) -> list[str]:
+    """Return the sorted top level names of every absolute import in `source`.
+
+    e.g. `import os.path` and `from os import path` both give `os`."""
+    names: set[str] = set()
+    for node in ast.walk(ast.parse(source)):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split(".")[0] for alias in node.names)
+        # Relative imports are always local to the project
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module.split(".")[0])
+    return sorted(names)
+
+
+@dataclass
+class ScannedFile:
+    path: str
+    hash: str = ""
+    imports: list[str] = field(default_factory=list)
+    error: str | None = None
+
+
+def scan_file(path: str) -> ScannedFile:
+    """Read and parse the file at `path` for its imports."""
+    try:
+        content = Pathier(path).read_bytes()
+        return ScannedFile(path, hash_content(content), get_imports(content.decode()))
+    except Exception as e:
+        return ScannedFile(path, error=f"{type(e).__name__}: {e}")
+
+
+@dataclass
+class ImportCache:
+    """The imports of previously scanned files, keyed by path.
+
+    Each entry has the `mtime` and `size` the file had when scanned,
+    its content `hash`, and its `imports`."""
+
+    python: str = ""
+    files: dict[str, dict[str, Any]] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: Pathish) -> Self:
+        """Load the cache at `path`.
+
+        An empty cache is returned if `path` doesn't exist, can't be read,
+        or was written by a different Python version (which may parse differently)."""
+        path = Pathier(path)
+        python = ".".join(str(part) for part in sys.version_info[:2])
+        if path.exists():
+            try:
+                cache = cls(**path.loads())
+                if cache.python == python:
+                    return cache
+            except Exception:
+                ...
+        return cls(python)
+
+    def dump(self, path: Pathish):
+        """Write this cache to `path`."""
+        Pathier(path).dumps(asdict(self))
+
+
+def scan_imports(
+    files: list[Pathier], cache_path: Pathish, workers: int | None = None
+) -> dict[str, list[str]]:
+    """Return a mapping of each of `files` to the top level names it imports.
+
+    Files whose mtime and size haven't changed since they were cached aren't read.
+    Otherwise, files are only parsed if their content hash differs from the cached one.
+    Enough of those are parsed across `workers` processes (defaults to cpu count)."""
+    cache = ImportCache.load(cache_path)
+    imports: dict[str, list[str]] = {}
+    entries: dict[str, dict[str, Any]] = {}
+    to_parse: list[str] = []
+    for file in files:
+        path = str(file)
+        stat = file.stat()
+        mtime, size = stat.st_mtime_ns, stat.st_size
+        entry = cache.files.get(path)
+        if entry and (entry["mtime"] != mtime or entry["size"] != size):
+            # Touched, but possibly not changed
+            if entry["hash"] == hash_content(file.read_bytes()):
+                entry = entry | {"mtime": mtime, "size": size}
+            else:
+                entry = None
+        if entry:
+            imports[path] = entry["imports"]
+            entries[path] = entry
+        else:
+            to_parse.append(path)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(to_parse) < MIN_PARALLEL_FILES:
+        results = [scan_file(path) for path in to_parse]
+    else:
+        with ProcessPoolExecutor(min(workers, len(to_parse))) as executor:
+            results = list(
+                executor.map(
+                    scan_file,
+                    to_parse,
+                    chunksize=max(1, len(to_parse) // (workers * 4)),
+                )
+            )
+    for result in results:
+        if result.error:
+            print(f"Could not scan {result.path} for imports: {result.error}")
+            continue
+        stat = os.stat(result.path)
+        imports[result.path] = result.imports
+        entries[result.path] = {
+            "mtime": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "hash": result.hash,
+            "imports": result.imports,
+        }
+    # Only keep files that still exist
+    cache.files = entries
+    cache.dump(cache_path)
+    return imports
+
+
+def get_local_names(srcdir: Pathier) -> set[str]:
+    """Return the names that refer to `srcdir` itself or the modules and packages directly in it."""
+    names = {srcdir.name}
+    for path in srcdir.iterdir():
+        if path.is_dir() or path.suffix == ".py":
+            names.add(path.stem)
+    return names
+
+
+def get_dependencies(
+    srcdir: Pathish,
+    cache_path: Pathish,
+    workers: int | None = None,
+    files: list[Pathier] | None = None,
+) -> list[Dependency]:
+    """Scan the `.py` files in `srcdir`, or `files` if given, and return the installed third party distributions
+    they import, sorted by import name.
+
+    Standard library modules, modules local to `srcdir`,
+    and imports without an installed distribution are left out."""
+    srcdir = Pathier(srcdir)
+    if files is None:
+        files = list(srcdir.rglob("*.py"))
+    imports = scan_imports(files, cache_path, workers)
+    local_names = get_local_names(srcdir)
+    index = DistributionIndex.load()
+    dependencies: list[Dependency] = []
+    for name in sorted({name for names in imports.values() for name in names}):
+        if name in sys.stdlib_module_names or name in local_names:
+            continue
+        distribution = index.get_distribution(name)
+        if distribution:
+            dependencies.append(
+                Dependency(name, distribution, index.get_version(distribution))
+            )
+    return dependencies
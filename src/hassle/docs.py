@@ -0,0 +1,249 @@
+import ast
+import math
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Collection
+
+from pathier import Pathier, Pathish
+from typing_extensions import Self
+
+from hassle.formatting import hash_content
+
+# Each worker imports every module so links resolve, so don't bother splitting up fewer pages than this.
+MIN_PAGES_PER_WORKER = 4
+# Written alongside the module pages
+INDEX_FILES = ["index.html", "search.js"]
+
+
+def get_docs_key() -> str:
+    """Pages rendered under a different key are out of date."""
+    import importlib.metadata
+
+    return f"pdoc {importlib.metadata.version('pdoc')}, python {sys.version_info[:2]}"
+
+
+def get_modules(srcdir: Pathish) -> dict[str, Pathier]:
+    """Return the names of the modules pdoc documents for the package at `srcdir`, mapped to their source files.
+
+    Like pdoc, private modules (ones starting with `_`) are skipped."""
+    modules: dict[str, Pathier] = {}
+
+    def walk(package: Pathier, name: str):
+        modules[name] = package / "__init__.py"
+        for path in sorted(package.iterdir()):
+            if path.name.startswith("_"):
+                continue
+            if path.is_dir() and (path / "__init__.py").is_file():
+                walk(path, f"{name}.{path.name}")
+            elif path.is_file() and path.suffix == ".py":
+                modules[f"{name}.{path.stem}"] = path
+
+    srcdir = Pathier(srcdir)
+    walk(srcdir, srcdir.name)
+    return modules
+
+
+def get_project_imports(
+    source: str, name: str, is_package: bool, modules: Collection[str]
+) -> set[str]:
+    """Return which of `modules` the source of module `name` imports from (and so may re-export from)."""
+    package = name if is_package else name.rpartition(".")[0]
+    imported: set[str] = set()
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return imported
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            targets = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            base = node.module or ""
+            if node.level:
+                parts = package.split(".")
+                parent = ".".join(parts[: len(parts) - node.level + 1])
+                base = f"{parent}.{base}" if base else parent
+            # `from package import module` imports a module, not a member of `package`
+            targets = [base] + [f"{base}.{alias.name}" for alias in node.names]
+        else:
+            continue
+        imported.update(target for target in targets if target in modules)
+    imported.discard(name)
+    return imported
+
+
+def get_page(name: str) -> str:
+    """Return the path of the page for module `name`, relative to the docs directory."""
+    return f"{name.replace('.', '/')}.html"
+
+
+@dataclass
+class DocsManifest:
+    """Source hashes of the modules as they were when their pages were last rendered."""
+
+    key: str = ""
+    modules: dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: Pathish, key: str) -> Self:
+        """Load the manifest at `path`.
+
+        An empty manifest is returned if `path` doesn't exist, can't be read,
+        or was written under a different `key`."""
+        path = Pathier(path)
+        if path.exists():
+            try:
+                manifest = cls(**path.loads())
+                if manifest.key == key:
+                    return manifest
+            except Exception:
+                ...
+        return cls(key)
+
+    def dump(self, path: Pathish):
+        """Write this manifest to `path`."""
+        Pathier(path).dumps(asdict(self))
+
+
+@dataclass
+class DocsReport:
+    rendered: int
+    total: int
+    removed: int
+    seconds: float
+
+    def __str__(self) -> str:
+        if not self.rendered and not self.removed:
+            return f"Docs for all {self.total} modules are up to date."
+        return (
+            f"Rendered docs for {self.rendered} of {self.total} modules in {self.seconds:.2f}s "
+            f"({self.removed} stale pages removed)."
+        )
+
+
+def render_pages(
+    srcdir: str, docsdir: str, names: list[str], pages: list[str], index: bool
+) -> list[str]:
+    """Render the pages for the modules in `pages` into `docsdir`,
+    along with `index.html` and `search.js` if `index` is `True`.
+
+    Every module in `names` is loaded so links between them resolve.
+    This imports the project, so it's meant to run in a fresh worker process."""
+    import pdoc.doc
+    import pdoc.extract
+    import pdoc.render
+
+    # Puts the directory containing the package on `sys.path`
+    pdoc.extract.parse_spec(Pathier(srcdir))
+    all_modules = {name: pdoc.doc.Module.from_name(name) for name in names}
+    written: dict[str, str] = {}
+    for name in pages:
+        written[get_page(name)] = pdoc.render.html_module(
+            all_modules[name], all_modules
+        )
+    if index:
+        written["index.html"] = pdoc.render.html_index(all_modules)
+        written["search.js"] = pdoc.render.search_index(all_modules)
+    for page, content in written.items():
+        if content:
+            (Pathier(docsdir) / page).write_text(content, encoding="utf-8")
+    return list(written)
+
+
+def remove_stale_pages(docsdir: Pathier, pages: Collection[str]) -> int:
+    """Delete html pages in `docsdir` that aren't in `pages`, and any directories that leaves empty.
+
+    Returns the number of pages deleted."""
+    removed = 0
+    for root, dirs, files in os.walk(docsdir, topdown=False):
+        for file in files:
+            path = Pathier(root) / file
+            page = path.relative_to(docsdir).as_posix()
+            if path.suffix == ".html" and page not in pages:
+                path.unlink()
+                removed += 1
+        if root != str(docsdir) and not os.listdir(root):
+            os.rmdir(root)
+    return removed
+
+
+def generate_docs(
+    srcdir: Pathish,
+    docsdir: Pathish,
+    manifest_path: Pathish,
+    workers: int | None = None,
+) -> DocsReport:
+    """Render pdoc pages for the package at `srcdir` into `docsdir`.
+
+    Only the pages of modules whose source changed since `manifest_path` was written are rendered,
+    along with the pages of modules that import from them (which may re-export what changed).
+    If the set of modules changes, every page is rendered since they all link to each other.
+    Pages are rendered across up to `workers` fresh processes (defaults to the cpu count),
+    then pages for modules that no longer exist are deleted."""
+    start = time.perf_counter()
+    srcdir = Pathier(srcdir)
+    docsdir = Pathier(docsdir)
+    modules = get_modules(srcdir)
+    manifest = DocsManifest.load(manifest_path, get_docs_key())
+    sources = {name: path.read_bytes() for name, path in modules.items()}
+    hashes = {name: hash_content(source) for name, source in sources.items()}
+    if set(manifest.modules) != set(modules):
+        stale = set(modules)
+    else:
+        stale = {
+            name
+            for name in modules
+            if manifest.modules[name] != hashes[name]
+            or not (docsdir / get_page(name)).exists()
+        }
+        # Modules that import from a stale module are stale too
+        importers: dict[str, set[str]] = {}
+        for name, source in sources.items():
+            is_package = modules[name].name == "__init__.py"
+            for imported in get_project_imports(
+                source.decode(), name, is_package, modules
+            ):
+                importers.setdefault(imported, set()).add(name)
+        queue = list(stale)
+        while queue:
+            for importer in importers.get(queue.pop(), set()):
+                if importer not in stale:
+                    stale.add(importer)
+                    queue.append(importer)
+    index_missing = any(not (docsdir / file).exists() for file in INDEX_FILES)
+    pages = [name for name in modules if name in stale]
+    if pages or index_missing:
+        docsdir.mkdir()
+        for name in pages:
+            (docsdir / get_page(name)).parent.mkdir()
+        workers = min(
+            workers or os.cpu_count() or 1,
+            max(1, math.ceil(len(pages) / MIN_PAGES_PER_WORKER)),
+        )
+        chunks = [pages[i::workers] for i in range(workers)]
+        # Spawn, rather than fork, so the project is imported fresh from its current source
+        with ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            futures = [
+                executor.submit(
+                    render_pages,
+                    str(srcdir),
+                    str(docsdir),
+                    list(modules),
+                    chunk,
+                    i == 0,
+                )
+                for i, chunk in enumerate(chunks)
+            ]
+            for future in futures:
+                future.result()
+    removed = remove_stale_pages(
+        docsdir, {get_page(name) for name in modules} | set(INDEX_FILES)
+    )
+    manifest.modules = hashes
+    manifest.dump(manifest_path)
+    return DocsReport(len(pages), len(modules), removed, time.perf_counter() - start)
@@ -0,0 +1,218 @@
+import mmap
+import os
+import re
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Iterable, Iterator
+
+from pathier import Pathier, Pathish
+
+from hassle import utilities
+from hassle.formatting import hash_content
+
+if TYPE_CHECKING:
+    import pathspec
+
+
+@dataclass
+class FileEntry:
+    path: Pathier
+    size: int
+    mtime_ns: int
+    _hash: str | None = field(default=None, repr=False)
+
+    @property
+    def hash(self) -> str:
+        """The sha256 hex digest of this file's content, computed on first access."""
+        if self._hash is None:
+            self._hash = hash_content(self.path.read_bytes())
+        return self._hash
+
+
+@dataclass
+class SearchMatch:
+    path: Pathier
+    line: int
+    offset: int
+    text: str
+
+
+@dataclass
+class DirectoryListing:
+    mtime_ns: int
+    files: list[str]
+    dirs: list[str]
+
+
+class FileIndex:
+    """The files in `projectdir` that aren't ignored, keyed by their path relative to `projectdir`,
+    with their size, modification time, and content hash.
+
+    See `hassle.utilities.get_ignore_spec` for what gets ignored.
+    Ignored directories and virtual environments are pruned instead of walked."""
+
+    def __init__(self, projectdir: Pathish):
+        self.projectdir = Pathier(projectdir)
+        self.entries: dict[str, FileEntry] = {}
+        self._listings: dict[str, DirectoryListing] = {}
+        self._gitignore_key: tuple[int, int] | None = None
+        self.refresh()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.entries
+
+    def __getitem__(self, name: str) -> FileEntry:
+        return self.entries[name]
+
+    def _get_gitignore_key(self) -> tuple[int, int] | None:
+        gitignore = self.projectdir / ".gitignore"
+        return utilities.get_file_key(gitignore) if gitignore.exists() else None
+
+    def refresh(self) -> set[str]:
+        """Bring the index up to date with the file system and return the names of the files
+        that were added, removed, or modified since the last refresh.
+
+        Only directories whose modification time changed are listed again,
+        and a file's hash is only recomputed if its size or modification time changed.
+        Everything is listed again if `.gitignore` changed."""
+        gitignore_key = self._get_gitignore_key()
+        if gitignore_key != self._gitignore_key:
+            self._listings.clear()
+            self._gitignore_key = gitignore_key
+        spec = None
+        entries: dict[str, FileEntry] = {}
+        listings: dict[str, DirectoryListing] = {}
+        changed: set[str] = set()
+        pending = [""]
+        while pending:
+            reldir = pending.pop()
+            directory = os.path.join(self.projectdir, reldir)
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            listing = self._listings.get(reldir)
+            if not listing or listing.mtime_ns != mtime_ns:
+                if spec is None:
+                    spec = utilities.get_ignore_spec(self.projectdir)
+                listing = self._list(directory, reldir, mtime_ns, spec)
+            listings[reldir] = listing
+            for filename in listing.files:
+                name = f"{reldir}/{filename}" if reldir else filename
+                path = self.projectdir / name
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entry = self.entries.get(name)
+                if not entry or (entry.mtime_ns, entry.size) != (
+                    stat.st_mtime_ns,
+                    stat.st_size,
+                ):
+                    entry = FileEntry(path, stat.st_size, stat.st_mtime_ns)
+                    changed.add(name)
+                entries[name] = entry
+            # Reversed so directories are visited in order
+            pending.extend(
+                f"{reldir}/{dirname}" if reldir else dirname
+                for dirname in reversed(listing.dirs)
+            )
+        changed.update(self.entries.keys() - entries.keys())
+        self.entries = entries
+        self._listings = listings
+        return changed
+
+    def _list(
+        self,
+        directory: str,
+        reldir: str,
+        mtime_ns: int,
+        spec: "pathspec.GitIgnoreSpec",
+    ) -> DirectoryListing:
+        files: list[str] = []
+        dirs: list[str] = []
+        with os.scandir(directory) as scan:
+            for item in scan:
+                name = f"{reldir}/{item.name}" if reldir else item.name
+                if item.is_dir(follow_symlinks=False):
+                    if not spec.match_file(f"{name}/") and not os.path.exists(
+                        os.path.join(item.path, "pyvenv.cfg")
+                    ):
+                        dirs.append(item.name)
+                elif item.is_file() and not spec.match_file(name):
+                    files.append(item.name)
+        return DirectoryListing(mtime_ns, sorted(files), sorted(dirs))
+
+    def select_entries(
+        self, suffix: str = "", directory: Pathish = "", exclude: list[str] = []
+    ) -> dict[str, FileEntry]:
+        """Returns the indexed files ending in `suffix` that are in `directory`
+        and don't match a gitignore style pattern in `exclude` (e.g. the sdist `exclude` list in `pyproject.toml`).
+
+        `directory` can be in `projectdir` or relative to it."""
+        import pathspec
+
+        directory = Pathier(directory)
+        if directory.is_relative_to(self.projectdir):
+            directory = directory.relative_to(self.projectdir)
+        prefix = "" if directory == Pathier(".") else f"{directory.as_posix()}/"
+        spec = pathspec.GitIgnoreSpec.from_lines(exclude)
+        return {
+            name: entry
+            for name, entry in self.entries.items()
+            if name.endswith(suffix)
+            and name.startswith(prefix)
+            and not (exclude and spec.match_file(name))
+        }
+
+    def select(
+        self, suffix: str = "", directory: Pathish = "", exclude: list[str] = []
+    ) -> list[Pathier]:
+        """Returns the paths of the files `select_entries()` returns for the same arguments."""
+        return [
+            entry.path
+            for entry in self.select_entries(suffix, directory, exclude).values()
+        ]
+
+
+def iter_text(paths: Iterable[Pathish]) -> Iterator[tuple[Pathier, str]]:
+    """Yield each of `paths` with its text, reading one file at a time."""
+    for path in paths:
+        path = Pathier(path)
+        yield path, path.read_text(encoding="utf-8")
+
+
+def search(
+    paths: Iterable[Pathish], pattern: str | bytes | re.Pattern, flags: int = 0
+) -> Iterator[SearchMatch]:
+    """Yield every match of the regular expression `pattern` in each of `paths`.
+
+    Each file is memory mapped and searched as utf-8 bytes, so only the matches are ever decoded.
+    A `str` pattern is encoded, which means `.` and character classes match bytes, not characters.
+    """
+    if isinstance(pattern, re.Pattern):
+        flags |= pattern.flags & ~re.UNICODE
+        pattern = pattern.pattern
+    if isinstance(pattern, str):
+        pattern = pattern.encode()
+    regex = re.compile(pattern, flags)
+    for path in paths:
+        path = Pathier(path)
+        with path.open("rb") as file:
+            # Empty files can't be mapped
+            if not os.fstat(file.fileno()).st_size:
+                continue
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                line = 1
+                position = 0
+                for match in regex.finditer(content):
+                    line += content[position : match.start()].count(b"\n")
+                    position = match.start()
+                    yield SearchMatch(
+                        path,
+                        line,
+                        match.start(),
+                        match.group().decode(errors="replace"),
+                    )
@@ -0,0 +1,236 @@
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from functools import cache
+from itertools import repeat
+from typing import TYPE_CHECKING
+
+from pathier import Pathier, Pathish
+from typing_extensions import Self
+
+if TYPE_CHECKING:
+    import black
+    import isort
+
+# Files, other than `pyproject.toml`, that `isort` or `black` can read settings from.
+CONFIG_FILES = [".isort.cfg", "setup.cfg", "tox.ini", ".editorconfig"]
+# Below this many files, formatting happens in the calling process.
+MIN_PARALLEL_FILES = 8
+
+
+def hash_content(content: bytes) -> str:
+    """Return the sha256 hex digest of `content`."""
+    return hashlib.sha256(content).hexdigest()
+
+
+def get_formatter_key(projectdir: Pathish) -> str:
+    """Return a hash of the installed `isort` and `black` versions and any of their configuration in `projectdir`.
+
+    Formatting results cached under a different key are invalid."""
+    import black
+    import isort
+
+    projectdir = Pathier(projectdir)
+    parts = [isort.__version__, black.__version__]
+    pyproject = projectdir / "pyproject.toml"
+    if pyproject.exists():
+        # Only the formatter tables matter, otherwise every version bump would invalidate the cache
+        tool = pyproject.loads().get("tool", {})
+        parts.extend([str(tool.get("isort")), str(tool.get("black"))])
+    for name in CONFIG_FILES:
+        file = projectdir / name
+        if file.exists():
+            parts.append(file.read_text())
+    return hash_content("\n".join(parts).encode())
+
+
+@dataclass
+class FormatCache:
+    """Content hashes of files as they were after they were last formatted."""
+
+    key: str = ""
+    files: dict[str, str] = field(default_factory=dict)
+    seconds_per_file: float = 0.0
+
+    @classmethod
+    def load(cls, path: Pathish, key: str) -> Self:
+        """Load the cache at `path`.
+
+        An empty cache is returned if `path` doesn't exist, can't be read,
+        or was saved under a different `key`."""
+        path = Pathier(path)
+        if path.exists():
+            try:
+                cache = cls(**path.loads())
+                if cache.key == key:
+                    return cache
+            except Exception:
+                ...
+        return cls(key)
+
+    def dump(self, path: Pathish):
+        """Write this cache to `path`."""
+        Pathier(path).dumps(asdict(self), indent=2)
+
+    def is_formatted(self, name: str, content: bytes) -> bool:
+        """Returns `True` if `content` is what `name` looked like after it was last formatted."""
+        return self.files.get(name) == hash_content(content)
+
+
+@dataclass
+class FileResult:
+    """The outcome of formatting a single file."""
+
+    path: str
+    changed: bool = False
+    hash: str | None = None
+    error: str | None = None
+
+
+@dataclass
+class FormatReport:
+    formatted: int
+    skipped: int
+    changed: int
+    seconds: float
+    seconds_per_file: float
+    errors: dict[str, str] = field(default_factory=dict)
+
+    @property
+    def total(self) -> int:
+        return self.formatted + self.skipped
+
+    @property
+    def hit_rate(self) -> float:
+        """The fraction of files that were skipped."""
+        return self.skipped / self.total if self.total else 0.0
+
+    @property
+    def speedup(self) -> float:
+        """Estimated speed-up over formatting every file."""
+        estimated_uncached = self.seconds + (self.skipped * self.seconds_per_file)
+        return estimated_uncached / self.seconds if self.seconds else 1.0
+
+    def __str__(self) -> str:
+        lines = [
+            f"Formatted {self.formatted} of {self.total} files in {self.seconds:.2f}s ({self.changed} changed). "
+            f"Cache hit rate: {self.hit_rate:.1%} (~{self.speedup:.1f}x faster than formatting everything)."
+        ]
+        if self.errors:
+            lines.append(f"Failed to format {len(self.errors)} files:")
+            lines.extend(f"  {name}: {error}" for name, error in self.errors.items())
+        return "\n".join(lines)
+
+
+@cache
+def get_formatters(projectdir: str) -> tuple["isort.Config", "black.Mode"]:
+    """Return the `isort` config and `black` mode for `projectdir`.
+
+    Cached so each worker process only reads the configuration once."""
+    import black
+    import isort
+    from black.files import parse_pyproject_toml
+
+    pyproject = Pathier(projectdir) / "pyproject.toml"
+    config = parse_pyproject_toml(str(pyproject)) if pyproject.exists() else {}
+    mode = black.Mode(
+        target_versions={
+            black.TargetVersion[version.upper()]
+            for version in config.get("target_version", [])
+        },
+        line_length=config.get("line_length", black.DEFAULT_LINE_LENGTH),
+        string_normalization=not config.get("skip_string_normalization", False),
+        magic_trailing_comma=not config.get("skip_magic_trailing_comma", False),
+        preview=config.get("preview", False),
+    )
+    return isort.Config(settings_path=projectdir), mode
+
+
+def format_file(path: str, projectdir: str) -> FileResult:
+    """Sort imports and format the file at `path` in memory with `isort` and `black`.
+
+    The file is only written to if formatting changed its content."""
+    import black
+    import isort
+
+    isort_config, black_mode = get_formatters(projectdir)
+    file = Pathier(path)
+    try:
+        source = file.read_text(encoding="utf-8")
+        try:
+            formatted = isort.code(source, config=isort_config)
+        # `# isort: skip_file` only opts out of sorting imports
+        except isort.exceptions.FileSkipComment:
+            formatted = source
+        try:
+            formatted = black.format_file_contents(
+                formatted, fast=False, mode=black_mode
+            )
+        except black.NothingChanged:
+            ...
+    except Exception as e:
+        return FileResult(path, error=f"{type(e).__name__}: {e}")
+    changed = formatted != source
+    if changed:
+        file.write_text(formatted, encoding="utf-8")
+    return FileResult(path, changed, hash_content(formatted.encode("utf-8")))
+
+
+def format_files(
+    projectdir: Pathish,
+    files: list[Pathier],
+    cache_path: Pathish,
+    workers: int | None = None,
+) -> FormatReport:
+    """Format `files` with `isort` and `black`, skipping any that haven't changed since they were last formatted.
+
+    Files are formatted across a pool of `workers` processes (defaults to the cpu count).
+    The content hash of each file after formatting is saved to `cache_path`."""
+    start = time.perf_counter()
+    projectdir = Pathier(projectdir)
+    cache = FormatCache.load(cache_path, get_formatter_key(projectdir))
+    names = {str(file): str(file.relative_to(projectdir)) for file in files}
+    stale = [
+        path
+        for path, name in names.items()
+        if not cache.is_formatted(name, Pathier(path).read_bytes())
+    ]
+    workers = workers or os.cpu_count() or 1
+    # Spinning up processes that each import black isn't worth it for a handful of files
+    if workers == 1 or len(stale) < MIN_PARALLEL_FILES:
+        results = [format_file(path, str(projectdir)) for path in stale]
+    else:
+        with ProcessPoolExecutor(min(workers, len(stale))) as executor:
+            results = list(
+                executor.map(
+                    format_file,
+                    stale,
+                    repeat(str(projectdir)),
+                    chunksize=max(1, len(stale) // (workers * 4)),
+                )
+            )
+    # Rebuild the file map so deleted files don't linger in the cache
+    stale_names = {names[path] for path in stale}
+    cache.files = {
+        name: cache.files[name] for name in names.values() if name not in stale_names
+    }
+    errors: dict[str, str] = {}
+    for result in results:
+        if result.error:
+            errors[names[result.path]] = result.error
+        elif result.hash:
+            cache.files[names[result.path]] = result.hash
+    seconds = time.perf_counter() - start
+    if stale:
+        cache.seconds_per_file = seconds / len(stale)
+    cache.dump(cache_path)
+    return FormatReport(
+        len(stale),
+        len(files) - len(stale),
+        sum(result.changed for result in results),
+        seconds,
+        cache.seconds_per_file,
+        errors,
+    )
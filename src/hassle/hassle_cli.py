@@ -1,45 +1,86 @@
 import shlex
-import subprocess
 import sys
-from typing import Any
+from functools import cached_property
+from typing import TYPE_CHECKING
 
 import argshell
-import pip
-from gitbetter import Git
 from pathier import Pathier
 
 from hassle import parsers, utilities
-from hassle.models import HassleConfig, HassleProject, Pyproject
+
+if TYPE_CHECKING:
+    from hassle.models import HassleProject
+    from hassle.release import Repository
+    from hassle.stats import StageTimer
 
 root = Pathier(__file__).parent
 
 
 class HassleShell(argshell.ArgShell):
     prompt = "hassle>"
+    # Exit code for `main()`, set by commands that can fail without raising
+    exit_code = 0
 
-    def __init__(self, command: str, *args: Any, **kwargs: Any):
-        super().__init__(*args, **kwargs)
-        if command == "new":
-            # load a blank HassleProject
-            self.project = HassleProject(Pyproject.from_template(), Pathier.cwd(), [])
-        elif command not in ["check_pypi", "help"]:
-            try:
-                self.project = HassleProject.load(Pathier.cwd())
-            except Exception as e:
-                self.console.print(
-                    f"{Pathier.cwd().stem} does not appear to be a Hassle project."
-                )
-                self.console.print(e)
+    @cached_property
+    def project(self) -> "HassleProject":
+        """The project in the current working directory.
 
-    def _build(self, args: argshell.Namespace):
-        self.project.format_source_files()
-        self.project.update_dependencies(
-            args.overwrite_dependencies, args.include_versions
-        )
-        self.project.generate_docs()
-        self.project.distdir.delete()
-        self.project.save()
-        subprocess.run([sys.executable, "-m", "build", Pathier.cwd()])
+        Loaded on first access so commands that don't need it don't pay for it."""
+        from hassle.models import HassleProject
+
+        try:
+            return HassleProject.load(Pathier.cwd())
+        except Exception as e:
+            self.console.print(
+                f"{Pathier.cwd().stem} does not appear to be a Hassle project."
+            )
+            raise e
+
+    @cached_property
+    def repository(self) -> "Repository":
+        """The git repository in the current working directory.
+
+        Its branch and remote are cached until the command that first used it finishes.
+        """
+        from hassle.release import Repository
+
+        return Repository(Pathier.cwd())
+
+    def postcmd(self, stop: bool, line: str) -> bool:
+        # The branch can change between commands in an interactive session
+        self.__dict__.pop("repository", None)
+        return stop
+
+    def _build(self, args: argshell.Namespace, timer: "StageTimer"):
+        from hassle.pipeline import Pipeline, Stage
+
+        project = self.project
+        results = Pipeline(
+            [
+                Stage("format", lambda: project.format_source_files(args.workers)),
+                Stage(
+                    "dependencies",
+                    lambda: project.update_dependencies(
+                        args.overwrite_dependencies, args.include_versions
+                    ),
+                    ["format"],
+                ),
+                Stage("docs", lambda: project.generate_docs(args.workers), ["format"]),
+                Stage("save", project.save, ["dependencies"]),
+                Stage(
+                    "build",
+                    lambda: project.build(args.build_mode, args.rebuild),
+                    ["save", "docs"],
+                ),
+            ]
+        ).run()
+        for result in results:
+            timer.add(result.name, result.seconds)
+
+    def _record_timings(self, command: str, timer: "StageTimer"):
+        from hassle.stats import BuildHistory
+
+        BuildHistory(self.project.history_path).record(command, timer.durations)
 
     @argshell.with_parser(parsers.get_add_script_parser)
     def do_add_script(self, args: argshell.Namespace):
@@ -50,19 +91,43 @@ class HassleShell(argshell.ArgShell):
     @argshell.with_parser(parsers.get_build_parser)
     def do_build(self, args: argshell.Namespace):
         """Build this project."""
-        if not args.skip_tests and not utilities.run_tests():
+        from hassle.stats import StageTimer
+        from hassle.testing import run_tests
+
+        timer = StageTimer()
+        if not args.skip_tests and not run_tests(
+            timer=timer, jobs=args.jobs, affected=not args.all_tests
+        ):
             raise RuntimeError(
                 f"ERROR: {Pathier.cwd().stem} failed testing.\nAbandoning build."
             )
-        self._build(args)
+        self._build(args, timer)
+        self._record_timings("build", timer)
 
-    def do_check_pypi(self, name: str):
-        """Check if the given package name is taken on pypi.org or not."""
-        name = name.strip('"')
-        if utilities.check_pypi(name):
-            self.console.print(f"{name} is already taken.")
-        else:
-            self.console.print(f"{name} is available.")
+    @argshell.with_parser(parsers.get_check_pypi_parser, [parsers.add_names_from_file])
+    def do_check_pypi(self, args: argshell.Namespace):
+        """Check if the given package names are taken on pypi.org or not."""
+        # Preserve order, but don't check a name twice
+        names = list(dict.fromkeys(args.names))
+        if not names:
+            self.console.print("No package names given.")
+            return
+        results = utilities.check_pypi_many(names, args.online, args.concurrency)
+        if len(names) == 1:
+            name, taken = names[0], results[names[0]]
+            if isinstance(taken, Exception):
+                raise taken
+            self.console.print(
+                f"{name} is already taken." if taken else f"{name} is available."
+            )
+            return
+        width = max(len(name) for name in names)
+        for name, taken in results.items():
+            if isinstance(taken, Exception):
+                status = f"error: {taken}"
+            else:
+                status = "taken" if taken else "available"
+            self.console.print(f"{name:<{width}}  {status}", highlight=False)
 
     def do_config(self, _: str = ""):
         """Print hassle config to terminal."""
@@ -75,13 +140,71 @@ class HassleShell(argshell.ArgShell):
     @argshell.with_parser(parsers.get_edit_config_parser)
     def do_configure(self, args: argshell.Namespace):
         """Edit or create `hassle_config.toml`."""
+        from hassle.models import HassleConfig
+
         HassleConfig.configure(
-            args.name, args.email, args.github_username, args.docs_url, args.tag_prefix
+            args.name,
+            args.email,
+            args.github_username,
+            args.docs_url,
+            args.tag_prefix,
+            keep_artifacts=args.keep_artifacts,
+            max_artifact_age_days=args.max_artifact_age,
         )
 
-    def do_format(self, _: str = ""):
+    @argshell.with_parser(parsers.get_daemon_parser)
+    def do_daemon(self, args: argshell.Namespace):
+        """Keep hassle loaded in the background so `hassle-client` commands start instantly,
+        or stop or check on a running daemon."""
+        from hassle import daemon
+
+        path = args.socket or daemon.get_socket_path()
+        if args.action == "start":
+            if daemon.is_running(path):
+                self.console.print(f"A hassle daemon is already listening on {path}.")
+                return
+            daemon.serve(path)
+            return
+        try:
+            connection = daemon.connect(path)
+        except PermissionError as e:
+            self.console.print(str(e))
+            self.exit_code = 1
+            return
+        except (ConnectionError, FileNotFoundError):
+            self.console.print(f"No hassle daemon is listening on {path}.")
+            self.exit_code = 0 if args.action == "stop" else 1
+            return
+        daemon.request(connection, {"control": args.action}, sys.stdout.buffer)
+
+    @argshell.with_parser(parsers.get_format_parser)
+    def do_format(self, args: argshell.Namespace):
         """Format all `.py` files with `isort` and `black`."""
-        self.project.format_source_files()
+        self.project.format_source_files(args.workers)
+
+    @argshell.with_parser(parsers.get_index_parser)
+    def do_index(self, args: argshell.Namespace):
+        """Sync or show info about the local index of pypi.org package names."""
+        import time
+
+        from hassle.pypi import NameIndex, PypiClient
+
+        index = NameIndex.default()
+        if args.action == "sync":
+            start = time.perf_counter()
+            count = index.sync(PypiClient(args.url))
+            self.console.print(
+                f"Synced {count} package names in {time.perf_counter() - start:.1f}s."
+            )
+        elif not index.exists():
+            self.console.print(
+                "The package name index hasn't been synced. Run `hassle index sync`."
+            )
+        else:
+            synced_at = time.strftime("%Y-%m-%d %H:%M", time.localtime(index.synced_at))
+            self.console.print(
+                f"{len(index)} package names in {index.path}, last synced {synced_at}."
+            )
 
     def do_is_published(self, _: str = ""):
         """Check if the most recent version of this package is published to PYPI."""
@@ -97,8 +220,12 @@ class HassleShell(argshell.ArgShell):
     )
     def do_new(self, args: argshell.Namespace):
         """Create a new project."""
+        from gitbetter import Git
+
+        from hassle.models import HassleConfig, HassleProject
+
         # Check if this name is taken.
-        if not args.not_package and utilities.check_pypi(args.name):
+        if not args.not_package and utilities.check_pypi(args.name, args.online):
             self.console.print(f"{args.name} already exists on pypi.org")
             if not utilities.get_answer("Continue anyway?"):
                 sys.exit()
@@ -138,35 +265,115 @@ class HassleShell(argshell.ArgShell):
         git = Git()
         git.new_repo()
 
-    def do_publish(self, _: str = ""):
+    @argshell.with_parser(parsers.get_publish_parser)
+    def do_publish(self, args: argshell.Namespace):
         """Publish this package.
-        You must have 'twine' installed and set up to use this command."""
-        if not utilities.on_primary_branch():
+        You must have a `.pypirc` file set up to use this command."""
+        if not self.repository.on_primary_branch():
             self.console.print(
                 "WARNING: You are trying to publish a project that does not appear to be on its main branch."
             )
-            self.console.print(f"You are on branch '{Git().current_branch}'")
+            self.console.print(f"You are on branch '{self.repository.branch}'")
             if not utilities.get_answer("Continue anyway?"):
                 return
-        subprocess.run(["twine", "upload", self.project.distdir / "*"])
+        if not self.project.distdir.exists():
+            self.console.print("Nothing to publish, run `hassle build` first.")
+            self.exit_code = 1
+            return
+        results = self.project.publish(args.repository, args.jobs)
+        for result in results:
+            if result.error:
+                self.console.print(
+                    f"Failed to upload {result.path.name}: {result.error}"
+                )
+            else:
+                self.console.print(f"{result.status.capitalize()} {result.path.name}")
+        self.exit_code = 0 if all(not result.error for result in results) else 1
+
+    @argshell.with_parser(parsers.get_stats_parser)
+    def do_stats(self, args: argshell.Namespace):
+        """Show how long each stage of previous builds and updates took."""
+        from hassle.stats import BuildHistory, format_stats
+
+        if not self.project.history_path.exists():
+            self.console.print("No build history found.")
+            return
+        history = BuildHistory(self.project.history_path)
+        commands = [args.command] if args.command else history.get_commands()
+        for command in commands:
+            stats = history.get_stats(command)
+            if not stats:
+                self.console.print(f"No history for `{command}`.")
+                continue
+            self.console.print(f"{command}:")
+            self.console.print(
+                format_stats(stats, args.threshold / 100),
+                highlight=False,
+                soft_wrap=True,
+            )
+            self.console.print()
 
     def do_test(self, args: str):
-        """Invoke `pytest -s` with `Coverage`.
+        """Run tests with `pytest -s` and `coverage`.
+
+        Optionally, provide any other cli args pytest can accept.
+        Use `--html` for an html coverage report and `--summary xml|json` for a machine readable one.
+        """
+        from hassle.testing import run_tests
+
+        parser = parsers.get_test_parser()
+        arglist = shlex.split(args)
+        if "-h" in arglist or "--help" in arglist:
+            parser.print_help()
+            return
+        test_args, pytest_args = parser.parse_known_args(arglist)
+        passed = run_tests(
+            pytest_args=pytest_args,
+            html=test_args.html,
+            summary=test_args.summary,
+            jobs=test_args.jobs,
+            affected=test_args.affected,
+        )
+        self.exit_code = 0 if passed else 1
 
-        Optionally, provide any other cli args pytest can accept."""
-        utilities.run_tests(shlex.split(args))
+    @argshell.with_parser(parsers.get_workspace_parser)
+    def do_workspace(self, args: argshell.Namespace):
+        """Run `test`, `format`, or `build` in every hassle project under a directory, several at a time."""
+        from hassle import workspace
+
+        root = Pathier(args.directory).resolve()
+        projects = workspace.discover_projects(root)
+        if not projects:
+            self.console.print(f"No hassle projects found in {root}.")
+            return
+        self.console.print(f"Found {len(projects)} projects in {root}.")
+        results = workspace.run_workspace(
+            root,
+            projects,
+            [args.command, *args.args],
+            args.logdir or root / ".hassle" / "workspace",
+            args.processes,
+        )
+        self.console.print(workspace.format_summary(root, results), soft_wrap=True)
+        self.exit_code = 0 if all(result.passed for result in results) else 1
 
     @argshell.with_parser(parsers.get_update_parser)
     def do_update(self, args: argshell.Namespace):
         """Update this package."""
-        if not args.skip_tests and not utilities.run_tests():
+        from hassle.models import HassleConfig
+        from hassle.stats import StageTimer
+        from hassle.testing import run_tests
+
+        timer = StageTimer()
+        if not args.skip_tests and not run_tests(
+            timer=timer, jobs=args.jobs, affected=not args.all_tests
+        ):
             raise RuntimeError(
                 f"ERROR: {Pathier.cwd().stem} failed testing.\nAbandoning build."
             )
         self.project.bump_version(args.update_type)
         self.project.save()
-        self._build(args)
-        git = Git()
+        self._build(args, timer)
         if HassleConfig.exists():
             tag_prefix = HassleConfig.load().git.tag_prefix
         else:
@@ -174,44 +381,66 @@ class HassleShell(argshell.ArgShell):
             self.console.print("Assuming no tag prefix.")
             tag_prefix = ""
         tag = f"{tag_prefix}{self.project.version}"
-        git.add_files([self.project.distdir, self.project.docsdir])
-        git.add(". -u")
-        git.commit(f'-m "chore: build {tag}"')
-        # 'auto-changelog' generates based off of commits between tags
-        # So to include the changelog in the tagged commit,
-        # we have to tag the code, update/commit the changelog, delete the tag, and then retag
-        # (One of these days I'll just write my own changelog generator)
-        git.tag(tag)
-        self.project.update_changelog()
-        with git.capturing_output():
-            git.tag(f"-d {tag}")
+        # The changelog covers the commits since the last tag,
+        # so it's updated before the build and the changelog are committed and tagged together
+        with timer.time("changelog"):
+            self.project.update_changelog()
         input("Press enter to continue after editing the changelog...")
-        git.add_files([self.project.changelog_path])
-        git.commit_files([self.project.changelog_path], "chore: update changelog")
-        with git.capturing_output():
-            git.tag(tag)
-        # Sync with remote
-        sync = f"origin {git.current_branch} --tags"
-        git.pull(sync)
-        git.push(sync)
+        repository = self.repository
+        with timer.time("git commit"):
+            repository.commit(
+                f"chore: build {tag}",
+                [
+                    self.project.distdir,
+                    self.project.docsdir,
+                    self.project.changelog_path,
+                ],
+            )
+        with timer.time("git tag"):
+            repository.tag(tag)
+        with timer.time("git push"):
+            repository.push([tag])
+        self._record_timings("update", timer)
         if args.publish:
-            self.do_publish()
+            self.do_publish("")
         if args.install:
+            import pip
+
             pip.main(["install", "."])
 
 
-def main():
-    """ """
-    command = "" if len(sys.argv) < 2 else sys.argv[1]
-    shell = HassleShell(command)
-    if command == "help" and len(sys.argv) == 3:
-        input_ = f"help {sys.argv[2]}"
+def run(argv: list[str], shell: HassleShell | None = None) -> int:
+    """Run the hassle command in `argv` with `shell` (a new one if not given) and return its exit code."""
+    argv = list(argv)
+    # `--profile` can go anywhere and is removed before the command is parsed
+    profile = "--profile" in argv
+    if profile:
+        argv.remove("--profile")
+    command = "" if not argv else argv[0]
+    shell = shell or HassleShell()
+    if command == "help" and len(argv) == 2:
+        input_ = f"help {argv[1]}"
     # Doing this so args that are multi-word strings don't get interpreted as separate args.
     elif command:
-        input_ = f"{command} " + " ".join([f'"{arg}"' for arg in sys.argv[2:]])
+        input_ = f"{command} " + " ".join([f'"{arg}"' for arg in argv[1:]])
     else:
         input_ = "help"
-    shell.onecmd(input_)
+    if profile:
+        from hassle.profiling import PROFILES_DIR, profile_call
+
+        profile_call(
+            shell.onecmd,
+            input_,
+            output_stem=Pathier.cwd() / PROFILES_DIR / f"hassle_{command or 'help'}",
+        )
+    else:
+        shell.onecmd(input_)
+    return shell.exit_code
+
+
+def main():
+    """ """
+    sys.exit(run(sys.argv[1:]))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,192 @@
+import sqlite3
+from contextlib import closing
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+from pathier import Pathier, Pathish
+
+from hassle.files import FileIndex
+
+if TYPE_CHECKING:
+    from coverage import CoverageData
+
+# Run every test after this many runs that only ran the affected ones.
+FULL_RUN_INTERVAL = 10
+# Files that can change the behaviour of any test when they change
+GLOBAL_FILES = ["conftest.py", "pyproject.toml", "setup.cfg", "tox.ini", "pytest.ini"]
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS tests (test TEXT PRIMARY KEY);",
+    # `lines` is a comma separated list of line numbers
+    "CREATE TABLE IF NOT EXISTS footprints (test TEXT, file TEXT, lines TEXT);",
+    "CREATE INDEX IF NOT EXISTS footprints_file ON footprints (file);",
+    "CREATE TABLE IF NOT EXISTS files (file TEXT PRIMARY KEY, hash TEXT);",
+    "CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT);",
+]
+
+
+def hash_files(projectdir: Pathish) -> dict[str, str]:
+    """Returns the content hash of every `.py` file in `projectdir` and any of `GLOBAL_FILES` at its top level,
+    keyed by their paths relative to `projectdir`."""
+    index = FileIndex(projectdir)
+    # `conftest.py` files anywhere are included as `.py` files
+    return {
+        name: entry.hash
+        for name, entry in index.entries.items()
+        if name.endswith(".py") or name in GLOBAL_FILES
+    }
+
+
+def get_footprints(
+    data: "CoverageData", projectdir: Pathish
+) -> dict[str, dict[str, list[int]]]:
+    """Returns the lines each test executed in each file in `projectdir`, from coverage `data`
+    recorded with a context per test."""
+    projectdir = Pathier(projectdir)
+    footprints: dict[str, dict[str, list[int]]] = {}
+    for file in data.measured_files():
+        path = Pathier(file)
+        if not path.is_relative_to(projectdir):
+            continue
+        name = path.relative_to(projectdir).as_posix()
+        for line, contexts in sorted(data.contexts_by_lineno(file).items()):
+            # Code that runs outside a test, e.g. during collection, has an empty context.
+            # Files that only run then aren't in any footprint, see `ImpactDatabase.select()`
+            for context in filter(None, contexts):
+                footprints.setdefault(context, {}).setdefault(name, []).append(line)
+    return footprints
+
+
+@dataclass
+class Selection:
+    """Which tests need to run."""
+
+    full: bool
+    reason: str = ""
+    changed: set[str] = field(default_factory=set)
+    skip: set[str] = field(default_factory=set)
+
+    def __str__(self) -> str:
+        if self.full:
+            return f"Running all tests: {self.reason}."
+        return f"{len(self.changed)} files changed since the last passing run, skipping {len(self.skip)} unaffected tests."
+
+
+class ImpactDatabase:
+    """SQLite backed record of the files and lines each test executes,
+    and the content of the project files as of the last passing test run."""
+
+    def __init__(self, path: Pathish):
+        self.path = Pathier(path)
+        self.path.parent.mkdir()
+        with closing(sqlite3.connect(self.path)) as connection, connection:
+            for statement in SCHEMA:
+                connection.execute(statement)
+
+    def get_state(self, key: str) -> str | None:
+        with closing(sqlite3.connect(self.path)) as connection:
+            row = connection.execute(
+                "SELECT value FROM state WHERE key = ?;", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def get_previous_hashes(self) -> dict[str, str]:
+        """Returns the hashes saved by the last passing run."""
+        with closing(sqlite3.connect(self.path)) as connection:
+            return dict(connection.execute("SELECT file, hash FROM files;"))
+
+    def get_changed_files(self, hashes: dict[str, str]) -> set[str]:
+        """Returns the files that were added, removed, or modified since the last passing run."""
+        previous = self.get_previous_hashes()
+        return {
+            file
+            for file in previous.keys() | hashes.keys()
+            if previous.get(file) != hashes.get(file)
+        }
+
+    def select(self, hashes: dict[str, str], dependency_key: str) -> Selection:
+        """Work out which tests are affected by the differences between `hashes` and the last passing run.
+
+        Tests with a recorded footprint that doesn't include any changed file are skipped.
+        Tests without a recorded footprint (e.g. new ones) always run.
+        Every test runs if there hasn't been a passing run, `dependency_key` is different,
+        one of `GLOBAL_FILES` changed, or it's been `FULL_RUN_INTERVAL` partial runs.
+
+        Every test also runs if a file that existed in the last passing run changed
+        but isn't in any footprint, because footprints only have the lines run during a test.
+        A module that only runs when it's imported, like one with just constants or dataclasses,
+        could affect any test that imports it."""
+        runs = self.get_state("runs_since_full")
+        if runs is None:
+            return Selection(True, "no previous passing run")
+        if self.get_state("dependency_key") != dependency_key:
+            return Selection(True, "installed packages changed")
+        if int(runs) >= FULL_RUN_INTERVAL:
+            return Selection(True, f"{runs} runs since all tests ran")
+        changed = self.get_changed_files(hashes)
+        if any(Pathier(file).name in GLOBAL_FILES for file in changed):
+            return Selection(True, "test configuration changed", changed)
+        with closing(sqlite3.connect(self.path)) as connection:
+            tests = {row[0] for row in connection.execute("SELECT test FROM tests;")}
+            placeholders = ", ".join("?" * len(changed))
+            rows = connection.execute(
+                f"SELECT DISTINCT test, file FROM footprints WHERE file IN ({placeholders});",
+                list(changed),
+            ).fetchall()
+        # New files can only affect existing tests through files that changed to use them
+        previous = self.get_previous_hashes()
+        untracked = sorted(
+            file for file in changed - {file for _, file in rows} if file in previous
+        )
+        if untracked:
+            return Selection(
+                True,
+                f"{untracked[0]} changed and isn't in any test's footprint",
+                changed,
+            )
+        affected = {test for test, _ in rows}
+        return Selection(False, changed=changed, skip=tests - affected)
+
+    def record_footprints(
+        self,
+        tests: list[str],
+        footprints: dict[str, dict[str, list[int]]],
+        replace_all: bool = False,
+    ):
+        """Replace the footprints of `tests` with the ones in `footprints`.
+
+        If `replace_all` is `True`, any test not in `tests` is forgotten."""
+        with closing(sqlite3.connect(self.path)) as connection, connection:
+            if replace_all:
+                connection.execute("DELETE FROM tests;")
+                connection.execute("DELETE FROM footprints;")
+            connection.executemany(
+                "DELETE FROM footprints WHERE test = ?;", [(test,) for test in tests]
+            )
+            connection.executemany(
+                "INSERT OR IGNORE INTO tests VALUES (?);", [(test,) for test in tests]
+            )
+            connection.executemany(
+                "INSERT INTO footprints VALUES (?, ?, ?);",
+                [
+                    (test, file, ",".join(str(line) for line in lines))
+                    for test in tests
+                    for file, lines in footprints.get(test, {}).items()
+                ],
+            )
+
+    def record_passing_run(
+        self, hashes: dict[str, str], dependency_key: str, full: bool
+    ):
+        """Save `hashes` as the state of the project as of a passing run.
+
+        If `full` is `True`, every test was run."""
+        runs = 0 if full else int(self.get_state("runs_since_full") or 0) + 1
+        with closing(sqlite3.connect(self.path)) as connection, connection:
+            connection.execute("DELETE FROM files;")
+            connection.executemany(
+                "INSERT INTO files VALUES (?, ?);", list(hashes.items())
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO state VALUES (?, ?);",
+                [("runs_since_full", str(runs)), ("dependency_key", dependency_key)],
+            )
@@ -1,23 +1,89 @@
-import subprocess
+import copy
+import re
+from abc import ABC, abstractmethod
 from dataclasses import asdict, dataclass, field
 from datetime import datetime
 from functools import cached_property
-from typing import Any
-
-import black
-import dacite
-import isort
-import requests
-from bs4 import BeautifulSoup, Tag
-from packagelister import packagelister
+from typing import TYPE_CHECKING, Any, Iterator
+
 from pathier import Pathier, Pathish
 from typing_extensions import Self
 
 from hassle import utilities
 
+if TYPE_CHECKING:
+    from hassle.files import FileIndex, SearchMatch
+    from hassle.upload import UploadResult
+
 root = Pathier(__file__).parent
 
 
+class TomlModel(ABC):
+    """Base for the dataclasses that are stored in toml files.
+
+    Loading is cached for the life of the process by path, modification time, and size,
+    and returns a copy so changes to one loaded instance don't affect the next.
+    Dumping is atomic and `is_saved()` tells if dumping would change anything.
+
+    Subclasses have to implement `from_data()` and `to_data()`, or defining them raises a `TypeError`.
+    """
+
+    # Resolved path and data as of the last load from or dump to it
+    _snapshot: tuple[Pathier, dict[str, Any]] | None = None
+    # Keyed by class and resolved path
+    _cache: dict[tuple[type, Pathier], tuple[tuple[int, int], "TomlModel"]] = {}
+
+    def __init_subclass__(cls, **kwargs: Any):
+        super().__init_subclass__(**kwargs)
+        # `ABC` alone would only complain when an instance is made,
+        # and `from_data()` is called on the class to make one
+        missing = [
+            name
+            for name in TomlModel.__abstractmethods__
+            if getattr(getattr(cls, name), "__isabstractmethod__", False)
+        ]
+        if missing:
+            raise TypeError(
+                f"{cls.__name__} doesn't implement {', '.join(sorted(missing))}."
+            )
+
+    @classmethod
+    @abstractmethod
+    def from_data(cls, data: dict[str, Any]) -> Self:
+        """Returns an instance populated from the data in a toml file."""
+
+    @abstractmethod
+    def to_data(self) -> dict[str, Any]:
+        """Returns the data to write to a toml file."""
+
+    @classmethod
+    def load_cached(cls, path: Pathish) -> Self:
+        """Returns an instance populated from `path`, parsing it only if it's changed since it was last loaded or dumped."""
+        path = Pathier(path).resolve()
+        key = utilities.get_file_key(path)
+        cached = TomlModel._cache.get((cls, path))
+        if not cached or cached[0] != key:
+            cached = (key, cls.from_data(path.loads()))
+            TomlModel._cache[(cls, path)] = cached
+        model = copy.deepcopy(cached[1])
+        model._snapshot = (path, asdict(model))  # type: ignore
+        return model  # type: ignore
+
+    def dump(self, path: Pathish):
+        """Write this instance to `path`."""
+        path = Pathier(path).resolve()
+        utilities.atomic_dumps(path, self.to_data())
+        self._snapshot = (path, asdict(self))  # type: ignore
+        TomlModel._cache[(type(self), path)] = (
+            utilities.get_file_key(path),
+            copy.deepcopy(self),
+        )
+
+    def is_saved(self, path: Pathish) -> bool:
+        """Returns whether this instance is unchanged since it was last loaded from or dumped to `path`."""
+        return self._snapshot == (Pathier(path).resolve(), asdict(self))  # type: ignore
+
+
 @dataclass
 class Sdist:
     exclude: list[str]
@@ -57,6 +123,12 @@ class Git:
     tag_prefix: str = ""
 
 
+@dataclass
+class Artifacts:
+    keep: int = 5
+    max_age_days: int = 30
+
+
 @dataclass
 class IniOptions:
     addopts: list[str]
@@ -95,7 +167,7 @@ class Project:
 
 
 @dataclass
-class Pyproject:
+class Pyproject(TomlModel):
     build_system: BuildSystem
     project: Project
     tool: Tool
@@ -138,18 +210,23 @@ class Pyproject:
 
         return data
 
+    @classmethod
+    def from_data(cls, data: dict[str, Any]) -> Self:
+        import dacite
+
+        return dacite.from_dict(cls, cls._swap_keys(data))
+
+    def to_data(self) -> dict[str, Any]:
+        return self._swap_keys(asdict(self))
+
     @classmethod
     def load(cls, path: Pathish = Pathier("pyproject.toml")) -> Self:
         """Return a `datamodel` object populated from `path`."""
-        data = Pathier(path).loads()
-        data = cls._swap_keys(data)
-        return dacite.from_dict(cls, data)
+        return cls.load_cached(path)
 
     def dump(self, path: Pathish = Pathier("pyproject.toml")):
         """Write the contents of this `datamodel` object to `path`."""
-        data = asdict(self)
-        data = self._swap_keys(data)
-        Pathier(path).dumps(data)
+        super().dump(path)
 
     @classmethod
     def from_template(cls) -> Self:
@@ -158,10 +235,27 @@ class Pyproject:
 
 
 @dataclass
-class HassleConfig:
+class HassleConfig(TomlModel):
     authors: list[Author] = field(default_factory=list)
     project_urls: Urls = field(default_factory=Urls)
     git: Git = field(default_factory=Git)
+    artifacts: Artifacts = field(default_factory=Artifacts)
+
+    @classmethod
+    def from_data(cls, data: dict[str, Any]) -> Self:
+        import dacite
+
+        data["project_urls"] = utilities.swap_keys(
+            data["project_urls"], ("Source_code", "Source code")
+        )
+        return dacite.from_dict(cls, data)
+
+    def to_data(self) -> dict[str, Any]:
+        data = asdict(self)
+        data["project_urls"] = utilities.swap_keys(
+            data["project_urls"], ("Source_code", "Source code")
+        )
+        return data
 
     @classmethod
     def load(
@@ -173,19 +267,11 @@ class HassleConfig:
             raise FileNotFoundError(
                 f"Could not find hassle config at {path}.\nRun hassle_config in a terminal to set it."
             )
-        data = path.loads()
-        data["project_urls"] = utilities.swap_keys(
-            data["project_urls"], ("Source_code", "Source code")
-        )
-        return dacite.from_dict(cls, data)
+        return cls.load_cached(path)
 
     def dump(self, path: Pathish = Pathier(__file__).parent / "hassle_config.toml"):
         """Write the contents of this `datamodel` object to `path`."""
-        data = asdict(self)
-        data["project_urls"] = utilities.swap_keys(
-            data["project_urls"], ("Source_code", "Source code")
-        )
-        Pathier(path).dumps(data)
+        super().dump(path)
 
     @staticmethod
     def warn():
@@ -206,6 +292,8 @@ class HassleConfig:
         docs_url: str | None = None,
         tag_prefix: str | None = None,
         config_path: Pathish = Pathier(__file__).parent / "hassle_config.toml",
+        keep_artifacts: int | None = None,
+        max_artifact_age_days: int | None = None,
     ):
         """Create or edit `hassle_config.toml` from given params."""
         print(f"Manual edits can be made at {config_path}")
@@ -229,6 +317,10 @@ class HassleConfig:
                 config.project_urls.Documentation = docs_url
         if tag_prefix:
             config.git.tag_prefix = tag_prefix
+        if keep_artifacts is not None:
+            config.artifacts.keep = keep_artifacts
+        if max_artifact_age_days is not None:
+            config.artifacts.max_age_days = max_artifact_age_days
         config.dump(config_path)
 
 
@@ -239,12 +331,60 @@ class HassleProject:
     source_files: list[str]
     templatedir: Pathier = root / "templates"
 
+    # The key and text of the last `source_code`
+    _source_cache = None
+
     @property
     def source_code(self) -> str:
         """Join and return all code from any `.py` files in `self.srcdir`.
 
-        Useful if a tool needs to scan all the source code for something."""
-        return "\n".join(file.read_text() for file in self.srcdir.rglob("*.py"))
+        Useful if a tool needs to scan all the source code for something.
+        The result is cached until a file is added, removed, or modified.
+        Use `iter_source()` or `search_source()` to avoid holding all of it in memory.
+        """
+        from hassle.files import iter_text
+
+        entries = self.files.select_entries(".py", self.srcdir)
+        key = [(name, entry.mtime_ns, entry.size) for name, entry in entries.items()]
+        if not self._source_cache or self._source_cache[0] != key:
+            self._source_cache = (
+                key,
+                "\n".join(
+                    text
+                    for _, text in iter_text(entry.path for entry in entries.values())
+                ),
+            )
+        return self._source_cache[1]
+
+    def iter_source(self) -> Iterator[tuple[Pathier, str]]:
+        """Yield the path and text of each `.py` file in `self.srcdir`, reading one file at a time."""
+        from hassle.files import iter_text
+
+        return iter_text(self.files.select(".py", self.srcdir))
+
+    def search_source(
+        self, pattern: str | bytes | re.Pattern, flags: int = 0
+    ) -> Iterator["SearchMatch"]:
+        """Yield every match of the regular expression `pattern` in the `.py` files in `self.srcdir`.
+
+        Files are memory mapped rather than read, see `hassle.files.search()`."""
+        from hassle.files import search
+
+        return search(self.files.select(".py", self.srcdir), pattern, flags)
+
+    @cached_property
+    def file_index(self) -> "FileIndex":
+        from hassle.files import FileIndex
+
+        return FileIndex(self.projectdir)
+
+    @property
+    def files(self) -> "FileIndex":
+        """Index of the files in this project that aren't ignored, refreshed on each access.
+
+        See `hassle.files.FileIndex`."""
+        self.file_index.refresh()
+        return self.file_index
 
     @cached_property
     def srcdir(self) -> Pathier:
@@ -274,6 +414,25 @@ class HassleProject:
     def distdir(self) -> Pathier:
         return self.projectdir / "dist"
 
+    @cached_property
+    def hassledir(self) -> Pathier:
+        """Directory for hassle's local state in this project."""
+        return self.projectdir / ".hassle"
+
+    @cached_property
+    def cachedir(self) -> Pathier:
+        return self.hassledir / "cache"
+
+    @cached_property
+    def history_path(self) -> Pathier:
+        """SQLite database of stage durations for this project's builds and updates."""
+        return self.hassledir / "history.db"
+
+    @cached_property
+    def uploads_path(self) -> Pathier:
+        """Record of the files `publish()` has uploaded, so an interrupted upload can be resumed."""
+        return self.hassledir / "uploads.json"
+
     @property
     def name(self) -> str:
         """This package's name."""
@@ -293,16 +452,15 @@ class HassleProject:
         """Load a project given `projectdir`."""
         projectdir = Pathier(projectdir)
         pyproject = Pyproject.load(projectdir / "pyproject.toml")
-        name = pyproject.project.name
-        # Convert source files to path stems relative to projectdir/src/name
+        project = cls(pyproject, projectdir, [])
+        # Convert source files to paths relative to projectdir/src/name
         # e.g `C:/python/projects/hassle/src/hassle/templates/pyproject.toml`
         # becomes `templates/pyproject.toml`
-        source_files = [
-            str(file.separate(name))
-            for file in (projectdir / "src" / name).rglob("*")
-            if file.is_file()
+        project.source_files = [
+            str(file.relative_to(project.srcdir))
+            for file in project.file_index.select(directory=project.srcdir)
         ]
-        return cls(pyproject, projectdir, source_files)
+        return project
 
     @classmethod
     def new(
@@ -348,34 +506,38 @@ class HassleProject:
         return (self.templatedir / file_name).read_text()
 
     def save(self):
-        """Dump `self.pyproject` to `{self.projectdir}/pyproject.toml`."""
-        self.pyproject.dump(self.pyproject_path)
+        """Dump `self.pyproject` to `{self.projectdir}/pyproject.toml` if it's changed since it was loaded or last saved."""
+        if not self.pyproject.is_saved(self.pyproject_path):
+            self.pyproject.dump(self.pyproject_path)
 
-    def format_source_files(self):
-        """Use isort and black to format files"""
-        for file in self.projectdir.rglob("*.py"):
-            isort.file(file)
-        try:
-            black.main([str(self.projectdir)])
-        except SystemExit as e:
-            ...
-        except Exception as e:
-            raise e
+    def format_source_files(self, workers: int | None = None):
+        """Use isort and black to format files.
+
+        Files that haven't changed since they were last formatted are skipped.
+        The rest are formatted across `workers` processes (defaults to the cpu count).
+
+        Files ignored by `.gitignore` or excluded from the sdist aren't formatted,
+        with the exception of the `tests` directory."""
+        from hassle.formatting import format_files
+
+        exclude = [
+            pattern
+            for pattern in self.pyproject.tool.hatch.build.targets.sdist.exclude
+            if pattern.strip("/") != "tests"
+        ]
+        report = format_files(
+            self.projectdir,
+            self.files.select(".py", exclude=exclude),
+            self.cachedir / "format.json",
+            workers,
+        )
+        print(report)
 
     def latest_version_is_published(self) -> bool:
         """Check if the current version of this project has been published to pypi.org."""
-        pypi_url = f"https://pypi.org/project/{self.name}"
-        response = requests.get(pypi_url)
-        if response.status_code != 200:
-            raise RuntimeError(
-                f"{pypi_url} returned status code {response.status_code} :/"
-            )
-        soup = BeautifulSoup(response.text, "html.parser")
-        header = soup.find("h1", class_="package-header__name")
-        assert isinstance(header, Tag)
-        text = header.text.strip()
-        pypi_version = text[text.rfind(" ") + 1 :]
-        return self.version == pypi_version
+        from hassle import pypi
+
+        return pypi.get_client().version_exists(self.name, self.version)
 
     # ====================================================================================
     # Updaters ===========================================================================
@@ -421,89 +583,41 @@ class HassleProject:
         If `overwrite_existing_packages` is `False`, this function will only add a package if it isn't already listed,
         but won't remove anything currently in the list.
         Use this option to preserve manually added dependencies."""
-        project = packagelister.scan_dir(self.srcdir)
+        from hassle.dependencies import RequirementSet, get_dependencies
+
+        dependencies = get_dependencies(
+            self.srcdir,
+            self.cachedir / "imports.json",
+            files=self.files.select(".py", self.srcdir),
+        )
         version_conditional = ">=" if include_versions else None
-        if overwrite_existing_packages:
-            self.pyproject.project.dependencies = project.get_formatted_requirements(
-                version_conditional
-            )
-        else:
-            # Only add a package if it isn't already in the dependency list
-            self.pyproject.project.dependencies.extend(
-                [
-                    (
-                        package.get_formatted_requirement(version_conditional)
-                        if version_conditional
-                        else package.distribution_name
-                    )
-                    for package in project.requirements
-                    if all(
-                        package.distribution_name not in existing_dependency
-                        for existing_dependency in self.pyproject.project.dependencies
-                    )
-                ]
-            )
+        requirements = RequirementSet(
+            [] if overwrite_existing_packages else self.pyproject.project.dependencies
+        )
+        # Only adds a package if it isn't already in the dependency list
+        for dependency in dependencies:
+            requirements.add(dependency.get_formatted_requirement(version_conditional))
+        self.pyproject.project.dependencies = list(requirements)
+
+    def update_changelog(self) -> bool:
+        """Add a section for the current version to `CHANGELOG.md` with the commits made since the last tag.
+
+        Returns `False` if there weren't any new changes.
+        If `hassle_config.toml` doesn't exist, an empty tag prefix will be assumed."""
+        from hassle import changelog
 
-    def _generate_changelog(self) -> list[str]:
         if HassleConfig.exists():
             tag_prefix = HassleConfig.load().git.tag_prefix
         else:
             HassleConfig.warn()
             print("Assuming no tag prefix.")
             tag_prefix = ""
-        raw_changelog = [
-            line
-            for line in subprocess.run(
-                [
-                    "auto-changelog",
-                    "-p",
-                    self.projectdir,
-                    "--tag-prefix",
-                    tag_prefix,
-                    "--stdout",
-                ],
-                stdout=subprocess.PIPE,
-                text=True,
-            ).stdout.splitlines(True)
-            if not line.startswith(
-                (
-                    "Full set of changes:",
-                    f"* build {tag_prefix}",
-                    "* update changelog",
-                )
-            )
-        ]
-        return raw_changelog
-
-    def update_changelog(self):
-        """Update `CHANGELOG.md` by invoking the `auto-changelog` module.
-
-        If `hassle_config.toml` doesn't exist, an empty tag prefix will be assumed."""
-        raw_changelog = self._generate_changelog()
-        # If there's no existing changelog, dump the generated one and get out of here.
-        if not self.changelog_path.exists():
-            self.changelog_path.join(raw_changelog)
-            return
-
-        # Don't want to overwrite previously existing manual changes/edits
-        existing_changelog = self.changelog_path.read_text().splitlines(True)[
-            2:
-        ]  # First two elements are "# Changelog\n" and "\n"
-        new_changes = raw_changelog
-        for line in existing_changelog:
-            # Release headers are prefixed with "## "
-            if line.startswith("## "):
-                new_changes = raw_changelog[: raw_changelog.index(line)]
-                break
-        changes = "".join(new_changes)
-        # "#### OTHERS" gets added to the changelog even when there's nothing for that category,
-        # so we'll get rid of it if that's the case
-        others = "#### Others"
-        if changes.strip("\n").endswith(others):
-            changes = changes.strip("\n").replace(others, "\n\n")
-        # If changes == "# Changelog\n\n" then there weren't actually any new changes
-        if not changes == "# Changelog\n\n":
-            self.changelog_path.write_text(changes + "".join(existing_changelog))
+        return changelog.update_changelog(
+            self.changelog_path,
+            self.projectdir,
+            f"{tag_prefix}{self.version}",
+            tag_prefix,
+        )
 
     # ====================================================================================
     # File/Project creation ==============================================================
@@ -551,7 +665,81 @@ class HassleProject:
                 getattr(self, func)()
         self.pyproject.dump(self.pyproject_path)
 
-    def generate_docs(self):
-        """Generate docs by invoking `pdoc`"""
-        self.docsdir.delete()
-        subprocess.run(["pdoc", "-o", self.docsdir, self.srcdir])
+    def generate_docs(self, workers: int | None = None):
+        """Generate docs with `pdoc`.
+
+        Only pages for modules that changed since the docs were last generated,
+        and the modules that import from them, are rendered.
+        They're rendered across `workers` processes (defaults to the cpu count)."""
+        from hassle.docs import generate_docs
+
+        report = generate_docs(
+            self.srcdir, self.docsdir, self.cachedir / "docs.json", workers
+        )
+        print(report)
+
+    def build(self, mode: str = "cached", rebuild: bool = False):
+        """Build this project's sdist and wheel into `self.distdir`.
+
+        Unless `mode` is `isolated` or `rebuild` is `True`, the artifacts of a previous build are reused
+        if the packaged files, the build backend version, and `SOURCE_DATE_EPOCH` are the same.
+        Artifacts are stored in `self.cachedir/artifacts` and pruned according to the `artifacts` settings
+        in `hassle_config.toml`.
+
+        See `hassle.building.build()` for the available `mode`s."""
+        from hassle import building
+
+        requires = self.pyproject.build_system.requires
+        backend = self.pyproject.build_system.build_backend
+        epoch = building.get_source_date_epoch(self.projectdir)
+        cache = building.ArtifactCache(self.cachedir / "artifacts")
+        key = None
+        if mode != "isolated":
+            files = self.files
+            entries = files.select_entries(
+                exclude=self.pyproject.tool.hatch.build.targets.sdist.exclude
+            )
+            # Packaged even if they match an exclude pattern
+            for name in ["pyproject.toml", self.pyproject.project.readme]:
+                if name in files:
+                    entries[name] = files[name]
+            key = building.get_build_key(
+                {name: entry.hash for name, entry in entries.items()},
+                building.get_backend_versions(requires, backend, mode),
+                epoch,
+                mode,
+            )
+            if not rebuild:
+                self.distdir.delete()
+                if names := cache.restore(key, self.distdir):
+                    print(f"Reusing {' and '.join(names)} from a previous build.")
+                    return
+        self.distdir.delete()
+        building.build(
+            self.projectdir, self.distdir, requires, backend, mode, epoch=epoch
+        )
+        if key:
+            cache.store(key, self.distdir)
+            retention = (
+                HassleConfig.load().artifacts if HassleConfig.exists() else Artifacts()
+            )
+            cache.prune(retention.keep, retention.max_age_days)
+
+    def publish(self, repository: str = "pypi", jobs: int = 4) -> list["UploadResult"]:
+        """Upload the files in `self.distdir` to `repository` from `~/.pypirc`, `jobs` at a time,
+        and return the result for each one.
+
+        Files that are already on the index with the same sha256 digest are skipped,
+        as are files recorded in `self.uploads_path` by an earlier, possibly interrupted, run.
+        See `hassle.upload.Uploader`."""
+        from hassle import upload
+
+        uploader = upload.Uploader(
+            upload.get_target(repository), self.uploads_path, jobs
+        )
+        try:
+            return uploader.upload(
+                sorted(path for path in self.distdir.iterdir() if path.is_file())
+            )
+        finally:
+            uploader.close()
@@ -1,3 +1,5 @@
+import argparse
+
 import argshell
 
 
@@ -49,6 +51,20 @@ def get_edit_config_parser() -> argshell.ArgShellParser:
         default=None,
         help=""" When using Hassle to do `git tag`, this will be prefixed to the front of the version number in the `pyproject.toml` file.""",
     )
+    parser.add_argument(
+        "-k",
+        "--keep_artifacts",
+        type=int,
+        default=None,
+        help=""" How many of the most recently used builds to keep in each project's artifact cache. Defaults to 5. """,
+    )
+    parser.add_argument(
+        "-a",
+        "--max_artifact_age",
+        type=int,
+        default=None,
+        help=""" Remove cached builds that haven't been used in this many days. Defaults to 30. """,
+    )
     return parser
 
 
@@ -124,6 +140,172 @@ def get_new_project_parser() -> argshell.ArgShellParser:
         action="store_true",
         help=""" Put source files in top level directory and delete tests folder. """,
     )
+    add_online_argument(parser)
+    return parser
+
+
+def add_workers_argument(parser: argshell.ArgShellParser):
+    """Add a `-w/--workers` argument to `parser`."""
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help=""" The number of processes to format files with. Defaults to the number of cpus. """,
+    )
+
+
+def get_format_parser() -> argshell.ArgShellParser:
+    """Returns a format parser."""
+    parser = argshell.ArgShellParser(
+        "format", description=""" Format all `.py` files with `isort` and `black`. """
+    )
+    add_workers_argument(parser)
+    return parser
+
+
+def add_jobs_argument(parser: argshell.ArgShellParser):
+    """Add a `-j/--jobs` argument to `parser`."""
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help=""" The number of processes to split the tests between. Shards are balanced by how long each test took on previous runs. """,
+    )
+
+
+def get_test_parser() -> argshell.ArgShellParser:
+    """Returns a test parser.
+
+    Arguments it doesn't recognize are meant for pytest, so use `parse_known_args()`."""
+    parser = argshell.ArgShellParser(
+        "test",
+        description=""" Run tests with `pytest -s` and `coverage`. Any other arguments are passed to pytest. """,
+        allow_abbrev=False,
+    )
+    parser.add_argument(
+        "--html",
+        action="store_true",
+        help=""" Write an html coverage report to `htmlcov`. Only pages for files whose coverage changed are rewritten. """,
+    )
+    parser.add_argument(
+        "--summary",
+        type=str,
+        default=None,
+        choices=["xml", "json"],
+        help=""" Also write the coverage report to `coverage.xml` or `coverage.json`. """,
+    )
+    parser.add_argument(
+        "--affected",
+        action="store_true",
+        help=""" Only run tests that executed a file that changed since the last passing run. """,
+    )
+    add_jobs_argument(parser)
+    return parser
+
+
+def add_online_argument(parser: argshell.ArgShellParser):
+    """Add an `--online` argument to `parser`."""
+    parser.add_argument(
+        "--online",
+        action="store_true",
+        help=""" Check pypi.org for the package name even if the local name index (`hassle index sync`) has been synced. """,
+    )
+
+
+def get_check_pypi_parser() -> argshell.ArgShellParser:
+    """Returns a check_pypi parser."""
+    parser = argshell.ArgShellParser(
+        "check_pypi",
+        description=""" Check if the given package names are taken on pypi.org or not. """,
+    )
+    parser.add_argument(
+        "names", nargs="*", type=str, help=""" The package names to check. """
+    )
+    parser.add_argument(
+        "-f",
+        "--file",
+        type=str,
+        default=None,
+        help=""" A file of package names to check, one per line. Blank lines and lines starting with `#` are ignored. """,
+    )
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        default=10,
+        help=""" The maximum number of requests to pypi.org at once. """,
+    )
+    add_online_argument(parser)
+    return parser
+
+
+def get_workspace_parser() -> argshell.ArgShellParser:
+    """Returns a workspace parser."""
+    parser = argshell.ArgShellParser(
+        "workspace",
+        description=""" Run `test`, `format`, or `build` in every hassle project under a directory. """,
+    )
+    parser.add_argument(
+        "command",
+        type=str,
+        choices=["test", "format", "build"],
+        help=""" The command to run in each project. """,
+    )
+    parser.add_argument(
+        "-d",
+        "--directory",
+        type=str,
+        default=".",
+        help=""" The directory to search for projects. Defaults to the current directory. """,
+    )
+    parser.add_argument(
+        "-a",
+        "--args",
+        nargs=argparse.REMAINDER,
+        default=[],
+        help=""" Arguments to pass to the command in each project.
+        Everything after this flag is passed along, so it has to come last, e.g. `-a -s -w 2`. """,
+    )
+    parser.add_argument(
+        "-p",
+        "--processes",
+        type=int,
+        default=None,
+        help=""" The number of projects to run at once. Defaults to the number of cpus. """,
+    )
+    parser.add_argument(
+        "-l",
+        "--logdir",
+        type=str,
+        default=None,
+        help=""" Where to write each project's output. Defaults to `.hassle/workspace` in the searched directory. """,
+    )
+    return parser
+
+
+def get_index_parser() -> argshell.ArgShellParser:
+    """Returns an index parser."""
+    parser = argshell.ArgShellParser(
+        "index",
+        description=""" Manage the local index of pypi.org package names used by `check_pypi` and `new`. """,
+    )
+    parser.add_argument(
+        "action",
+        nargs="?",
+        type=str,
+        default="info",
+        choices=("sync", "info"),
+        help=""" `sync` downloads every package name from the index. `info` shows the state of the local index. """,
+    )
+    parser.add_argument(
+        "-u",
+        "--url",
+        type=str,
+        default="https://pypi.org",
+        help=""" The package index to sync from. """,
+    )
     return parser
 
 
@@ -133,11 +315,11 @@ def get_build_parser() -> argshell.ArgShellParser:
         "build",
         description=""" 
 Run the build process:
-    * Run tests (abandoning build on failure)
+    * Run tests affected by changes since the last passing run (abandoning build on failure)
     * Sort imports and format with Black
     * Update dependencies
     * Generate docs
-    * Invoke `build` module""",
+    * Build the sdist and wheel""",
     )
     parser.add_argument(
         "-s", "--skip_tests", action="store_true", help=""" Skip running tests. """
@@ -154,6 +336,28 @@ Run the build process:
         action="store_true",
         help=""" Include versions when adding dependencies. """,
     )
+    parser.add_argument(
+        "--all_tests",
+        action="store_true",
+        help=""" Run every test instead of only the ones affected by changes since the last passing run. """,
+    )
+    parser.add_argument(
+        "-b",
+        "--build_mode",
+        type=str,
+        default="cached",
+        choices=("cached", "isolated", "in-process"),
+        help=""" `cached` reuses a build environment for as long as `build-system.requires` doesn't change,
+        `isolated` runs `python -m build`, and `in-process` calls the build backend from hassle's environment. """,
+    )
+    parser.add_argument(
+        "-r",
+        "--rebuild",
+        action="store_true",
+        help=""" Build even if the artifacts of a previous build with the same packaged files are cached. """,
+    )
+    add_workers_argument(parser)
+    add_jobs_argument(parser)
     return parser
 
 
@@ -191,6 +395,29 @@ Update this package:
     return parser
 
 
+def get_publish_parser() -> argshell.ArgShellParser:
+    """Returns a publish parser."""
+    parser = argshell.ArgShellParser(
+        "publish",
+        description=""" Upload the sdist and wheel in `dist` to a package index. Files that were already uploaded are skipped. """,
+    )
+    parser.add_argument(
+        "-r",
+        "--repository",
+        type=str,
+        default="pypi",
+        help=""" The section of `~/.pypirc` with the url and credentials to upload with. Defaults to `pypi`. """,
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=4,
+        help=""" The number of files to upload at a time. """,
+    )
+    return parser
+
+
 def get_add_script_parser() -> argshell.ArgShellParser:
     """Returns a add_script parser."""
     parser = argshell.ArgShellParser(
@@ -210,6 +437,63 @@ def get_add_script_parser() -> argshell.ArgShellParser:
     return parser
 
 
+def get_stats_parser() -> argshell.ArgShellParser:
+    """Returns a stats parser."""
+    parser = argshell.ArgShellParser(
+        "stats",
+        description=""" Show duration percentiles for each stage of previous builds and updates. """,
+    )
+    parser.add_argument(
+        "command",
+        nargs="?",
+        type=str,
+        default=None,
+        choices=("build", "update"),
+        help=""" Only show stats for this command. """,
+    )
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        type=float,
+        default=20,
+        help=""" Flag a stage if its latest duration is more than this percent slower than the median of its previous runs. """,
+    )
+    return parser
+
+
+def get_daemon_parser() -> argshell.ArgShellParser:
+    """Returns a daemon parser."""
+    parser = argshell.ArgShellParser(
+        "daemon",
+        description=""" Keep hassle loaded in the background so `hassle-client` commands start instantly. """,
+    )
+    parser.add_argument(
+        "action",
+        nargs="?",
+        type=str,
+        default="start",
+        choices=("start", "stop", "status"),
+        help=""" `start` runs the daemon in the foreground until it's stopped. `stop` and `status` talk to a running one. """,
+    )
+    parser.add_argument(
+        "-s",
+        "--socket",
+        type=str,
+        default=None,
+        help=""" The socket to listen on. Defaults to `$HASSLE_SOCKET` or a file in a directory only you can access. """,
+    )
+    return parser
+
+
+def add_names_from_file(args: argshell.Namespace) -> argshell.Namespace:
+    """Add the names in `args.file`, if given, to `args.names`."""
+    if args.file:
+        with open(args.file) as file:
+            lines = [line.strip() for line in file]
+        args.names += [line for line in lines if line and not line.startswith("#")]
+    return args
+
+
 def add_default_source_files(args: argshell.Namespace) -> argshell.Namespace:
     """Add `__init__.py` and `{args.name}.py` to `args.source_files`."""
     args.source_files += ["__init__.py", f"{args.name}.py"]
@@ -0,0 +1,157 @@
+import io
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, TextIO
+
+
+@dataclass
+class Stage:
+    """A named step in a `Pipeline` that runs once every stage in `requires` has succeeded."""
+
+    name: str
+    func: Callable[[], Any]
+    requires: list[str] = field(default_factory=list)
+
+
+@dataclass
+class StageResult:
+    name: str
+    output: str = ""
+    seconds: float = 0.0
+    error: BaseException | None = None
+
+
+class _ThreadOutput(io.TextIOBase):
+    """Stream that sends writes from a thread with a buffer set to that buffer
+    and everything else to the wrapped stream."""
+
+    def __init__(self, stream: TextIO, local: threading.local):
+        self.stream = stream
+        self.local = local
+
+    @property
+    def encoding(self) -> str:  # type: ignore
+        return self.stream.encoding
+
+    def write(self, s: str) -> int:
+        buffer: io.StringIO | None = getattr(self.local, "buffer", None)
+        return (self.stream if buffer is None else buffer).write(s)
+
+    def flush(self):
+        self.stream.flush()
+
+    def isatty(self) -> bool:
+        # Stage output is printed after the fact, so don't let anything assume a terminal
+        return getattr(self.local, "buffer", None) is None and self.stream.isatty()
+
+
+@contextmanager
+def _capture_threads(local: threading.local) -> Iterator[None]:
+    """Swap `sys.stdout` and `sys.stderr` for streams that capture output per thread."""
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout = _ThreadOutput(stdout, local)
+    sys.stderr = _ThreadOutput(stderr, local)
+    try:
+        yield
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+
+
+class Pipeline:
+    """Run a set of `Stage`s concurrently, respecting their dependencies.
+
+    Output from each stage is captured and printed in the order the stages were given.
+    After the first failure, no new stages are started and the error is raised
+    once the stages already running have finished."""
+
+    def __init__(self, stages: list[Stage], workers: int | None = None):
+        self.stages = stages
+        self.workers = workers
+        self._local = threading.local()
+        self._validate()
+
+    def _validate(self):
+        names = [stage.name for stage in self.stages]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Stage names must be unique: {names}")
+        resolved: set[str] = set()
+        remaining = list(self.stages)
+        while remaining:
+            ready = [stage for stage in remaining if set(stage.requires) <= resolved]
+            if not ready:
+                unknown = {
+                    name for stage in remaining for name in stage.requires
+                } - set(names)
+                if unknown:
+                    raise ValueError(f"Unknown stage dependencies: {sorted(unknown)}")
+                raise ValueError(
+                    f"Circular stage dependencies: {[stage.name for stage in remaining]}"
+                )
+            resolved.update(stage.name for stage in ready)
+            remaining = [stage for stage in remaining if stage not in ready]
+
+    def _run_stage(self, stage: Stage) -> StageResult:
+        buffer = io.StringIO()
+        self._local.buffer = buffer
+        start = time.perf_counter()
+        error = None
+        try:
+            stage.func()
+        except BaseException as e:
+            error = e
+        finally:
+            self._local.buffer = None
+        return StageResult(
+            stage.name, buffer.getvalue(), time.perf_counter() - start, error
+        )
+
+    def _print(self, result: StageResult):
+        status = "failed" if result.error else "done"
+        print(f"[{result.name}] {status} ({result.seconds:.2f}s)")
+        if result.output:
+            print(result.output, end="" if result.output.endswith("\n") else "\n")
+
+    def run(self) -> list[StageResult]:
+        """Run the pipeline and return the results of each stage in the order they were given."""
+        results: dict[str, StageResult] = {}
+        pending = list(self.stages)
+        running: dict[Future[StageResult], Stage] = {}
+        failure: StageResult | None = None
+        printed = 0
+        with (
+            _capture_threads(self._local),
+            ThreadPoolExecutor(self.workers) as executor,
+        ):
+            while pending or running:
+                if not failure:
+                    ready = [
+                        stage
+                        for stage in pending
+                        if all(name in results for name in stage.requires)
+                    ]
+                    for stage in ready:
+                        running[executor.submit(self._run_stage, stage)] = stage
+                        pending.remove(stage)
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    results[running.pop(future).name] = result
+                    failure = failure or (result if result.error else None)
+                # Print finished stages in order, stopping at the first one that hasn't finished
+                while (
+                    printed < len(self.stages) and self.stages[printed].name in results
+                ):
+                    self._print(results[self.stages[printed].name])
+                    printed += 1
+        if failure:
+            for stage in self.stages[printed:]:
+                if stage.name in results:
+                    self._print(results[stage.name])
+            raise failure.error  # type: ignore
+        return [results[stage.name] for stage in self.stages]
@@ -0,0 +1,77 @@
+import cProfile
+import pstats
+import sys
+from typing import Any, Callable
+
+from pathier import Pathier, Pathish
+
+# Where `hassle --profile` saves profiles, relative to the current directory
+PROFILES_DIR = Pathier(".hassle") / "profiles"
+# pstats function key: (file name, line number, function name)
+Func = tuple[str, int, str]
+
+
+def _frame_name(func: Func) -> str:
+    file, line, name = func
+    # Builtins have a file name of "~" and a line number of 0
+    frame = name if file == "~" else f"{Pathier(file).name}:{name}:{line}"
+    return frame.replace(";", ":").replace(" ", "_")
+
+
+def get_collapsed_stacks(stats: pstats.Stats, max_depth: int = 100) -> list[str]:
+    """Convert `stats` into collapsed stack lines (`frame;frame;frame microseconds`) that flamegraph tools accept.
+
+    cProfile only records caller/callee pairs, not whole stacks, so the time of a function
+    with several callers is split between them by how long each caller spent in it."""
+    # `stats.stats` isn't in the type stubs
+    entries: dict[Func, Any] = stats.stats  # type: ignore
+    callees: dict[Func, dict[Func, float]] = {}
+    for func, (*_, callers) in entries.items():
+        for caller, (*_, cumulative) in callers.items():
+            callees.setdefault(caller, {})[func] = cumulative
+    lines: dict[str, int] = {}
+
+    def walk(func: Func, stack: list[Func], seconds: float):
+        _, _, own, cumulative, _ = entries[func]
+        # Paths that round down to nothing would only bloat the output
+        if not cumulative or seconds < 1e-6:
+            return
+        stack = stack + [func]
+        share = seconds / cumulative
+        key = ";".join(_frame_name(frame) for frame in stack)
+        lines[key] = lines.get(key, 0) + int(own * share * 1_000_000)
+        if len(stack) >= max_depth:
+            return
+        for callee, edge_seconds in callees.get(func, {}).items():
+            # Skip recursive calls, their time is already included in the outer call
+            if callee not in stack:
+                walk(callee, stack, edge_seconds * share)
+
+    for func, (_, _, _, cumulative, callers) in entries.items():
+        if not callers:
+            walk(func, [], cumulative)
+    return [f"{stack} {micros}" for stack, micros in lines.items() if micros > 0]
+
+
+def profile_call(
+    func: Callable[..., Any], *args: Any, output_stem: Pathish, top: int = 25
+) -> Any:
+    """Call `func(*args)` under `cProfile` and return its result.
+
+    Afterwards, the raw stats are saved to `{output_stem}.pstats`,
+    the `top` functions by cumulative time are printed,
+    and collapsed stacks for flamegraph tools are saved to `{output_stem}.collapsed`."""
+    output_stem = Pathier(output_stem)
+    output_stem.parent.mkdir()
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args)
+    finally:
+        stats_path = output_stem.with_name(f"{output_stem.name}.pstats")
+        collapsed_path = output_stem.with_name(f"{output_stem.name}.collapsed")
+        profiler.dump_stats(stats_path)
+        stats = pstats.Stats(profiler, stream=sys.stdout)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+        collapsed_path.write_text("\n".join(get_collapsed_stacks(stats)) + "\n")
+        print(f"Profile saved to {stats_path}")
+        print(f"Collapsed stacks saved to {collapsed_path}")
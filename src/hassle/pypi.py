@@ -0,0 +1,259 @@
+import mmap
+import os
+import re
+from functools import cache
+from typing import TYPE_CHECKING, Any, Iterable
+
+from pathier import Pathier, Pathish
+from typing_extensions import Self
+
+from hassle import utilities
+
+if TYPE_CHECKING:
+    import requests
+
+PYPI_URL = "https://pypi.org"
+SIMPLE_JSON = "application/vnd.pypi.simple.v1+json"
+# Project links in the html version of the simple index
+SIMPLE_LINK = re.compile(r"<a [^>]*>([^<]+)</a>")
+
+
+class PypiClient:
+    """Client for the pypi.org JSON API.
+
+    Requests go through a pooled `requests.Session` with timeouts and retries (with exponential backoff).
+    Successful responses are cached in `cachedir` and revalidated with `ETag`/`Last-Modified` headers
+    on later requests, so unchanged projects come back as a `304` with no body."""
+
+    def __init__(
+        self,
+        base_url: str = PYPI_URL,
+        cachedir: Pathish | None = None,
+        timeout: float = 10,
+        retries: int = 3,
+        backoff: float = 0.5,
+        pool_size: int = 10,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.cachedir = Pathier(cachedir or utilities.get_cachedir() / "pypi")
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self._session: "requests.Session | None" = None
+
+    @property
+    def session(self) -> "requests.Session":
+        """The session requests are made with, created on first use."""
+        if not self._session:
+            import requests
+
+            self._session = requests.Session()
+            self._mount_adapter(self._session)
+            self._session.headers["Accept"] = "application/json"
+        return self._session
+
+    def _mount_adapter(self, session: "requests.Session"):
+        """Mount an adapter that keeps up to `self.pool_size` connections per host on `session`."""
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(
+            total=self.retries,
+            backoff_factor=self.backoff,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET", "HEAD"],
+            # Return the last response instead of raising so callers get the status code
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+            max_retries=retry,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+    def _get_cache_path(self, path: str) -> Pathier:
+        return self.cachedir / f"{path.strip('/').replace('/', '_')}.json"
+
+    def get_json(self, path: str) -> Any | None:
+        """Return the decoded JSON response for `{self.base_url}/{path}`.
+
+        Returns `None` if the resource doesn't exist.
+        Raises a `RuntimeError` for any other unsuccessful response."""
+        cache_path = self._get_cache_path(path)
+        cached = cache_path.loads() if cache_path.exists() else None
+        headers: dict[str, str] = {}
+        if cached:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+        url = f"{self.base_url}/{path.strip('/')}"
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and cached:
+            return cached["data"]
+        if response.status_code == 404:
+            cache_path.delete()
+            return None
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} returned status code {response.status_code} :/")
+        data = response.json()
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if etag or last_modified:
+            cache_path.dumps(
+                {"etag": etag, "last_modified": last_modified, "data": data}
+            )
+        return data
+
+    def get_project(self, name: str) -> dict[str, Any] | None:
+        """Return the JSON API data for project `name` or `None` if it doesn't exist."""
+        return self.get_json(f"pypi/{utilities.normalize_name(name)}/json")
+
+    def exists(self, name: str) -> bool:
+        """Returns `True` if a project called `name` exists on the index."""
+        return self.get_project(name) is not None
+
+    def exists_many(
+        self, names: list[str], concurrency: int | None = None
+    ) -> dict[str, bool | Exception]:
+        """Check which of `names` exist on the index, with up to `concurrency` requests in flight at once.
+
+        Defaults to `self.pool_size` concurrent requests.
+        Returns a mapping of each name to whether it exists or the exception raised while checking it.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        concurrency = concurrency or self.pool_size
+        session = self.session
+        # Otherwise the connections beyond `pool_size` are thrown away after each request
+        if concurrency > self.pool_size:
+            self.pool_size = concurrency
+            self._mount_adapter(session)
+        with ThreadPoolExecutor(concurrency) as executor:
+            futures = {name: executor.submit(self.exists, name) for name in names}
+        results: dict[str, bool | Exception] = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                results[name] = e
+        return results
+
+    def version_exists(self, name: str, version: str) -> bool:
+        """Returns `True` if `version` of project `name` has been published."""
+        project = self.get_project(name)
+        return project is not None and version in project.get("releases", {})
+
+    def get_simple_index(self) -> Iterable[str]:
+        """Yield the name of every project in the simple index (PEP 503/691).
+
+        The JSON format is requested, but the html format is accepted too."""
+        url = f"{self.base_url}/simple/"
+        accept = f"{SIMPLE_JSON}, text/html;q=0.1"
+        with self.session.get(
+            url, headers={"Accept": accept}, timeout=self.timeout, stream=True
+        ) as response:
+            if response.status_code != 200:
+                raise RuntimeError(
+                    f"{url} returned status code {response.status_code} :/"
+                )
+            if response.headers.get("Content-Type", "").startswith(SIMPLE_JSON):
+                for project in response.json()["projects"]:
+                    yield project["name"]
+            else:
+                for line in response.iter_lines(decode_unicode=True):
+                    yield from SIMPLE_LINK.findall(line)
+
+    def close(self):
+        if self._session:
+            self._session.close()
+            self._session = None
+
+
+class NameIndex:
+    """Local index of every project name on the package index, for lookups without network access.
+
+    Names are stored PEP 503 normalized, sorted, and one per line
+    so lookups are a binary search over a memory-mapped file."""
+
+    def __init__(self, path: Pathish):
+        self.path = Pathier(path)
+        self._file = None
+        self._map: mmap.mmap | None = None
+
+    @classmethod
+    def default(cls) -> Self:
+        """The index `hassle index sync` writes to."""
+        return cls(utilities.get_cachedir() / "index" / "names.txt")
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    @property
+    def synced_at(self) -> float:
+        """When this index was last synced, as a timestamp."""
+        return self.path.stat().st_mtime
+
+    def _open(self) -> mmap.mmap | None:
+        if self._map is None and self.path.stat().st_size:
+            self._file = self.path.open("rb")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def __contains__(self, name: str) -> bool:
+        names = self._open()
+        if names is None:
+            return False
+        target = utilities.normalize_name(name).encode()
+        # `low` and `high` are always at the start of a line
+        low, high = 0, len(names)
+        while low < high:
+            middle = (low + high) // 2
+            start = names.rfind(b"\n", 0, middle) + 1
+            end = names.find(b"\n", start)
+            end = len(names) if end == -1 else end
+            line = names[start:end]
+            if line == target:
+                return True
+            if line < target:
+                low = end + 1
+            else:
+                high = start
+        return False
+
+    def __len__(self) -> int:
+        return self.path.read_bytes().count(b"\n") if self.exists() else 0
+
+    def write(self, names: Iterable[str]) -> int:
+        """Replace the contents of this index with `names` and return how many unique names were written."""
+        self.close()
+        normalized = {utilities.normalize_name(name.strip()).encode() for name in names}
+        normalized.discard(b"")
+        content = b"".join(name + b"\n" for name in sorted(normalized))
+        self.path.parent.mkdir()
+        # Write to a temporary file first so an interrupted sync doesn't leave a partial index
+        temp_path = self.path.with_suffix(".tmp")
+        temp_path.write_bytes(content)
+        os.replace(temp_path, self.path)
+        return len(normalized)
+
+    def sync(self, client: PypiClient) -> int:
+        """Download every project name from `client`'s index and return how many there are."""
+        return self.write(client.get_simple_index())
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+@cache
+def get_client() -> PypiClient:
+    """Return the `PypiClient` shared by this process."""
+    return PypiClient()
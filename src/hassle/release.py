@@ -0,0 +1,85 @@
+import subprocess
+from functools import cached_property
+
+from pathier import Pathier, Pathish
+
+PRIMARY_BRANCHES = ["main", "master"]
+# `%(HEAD)` is `*` for the checked out branch
+BRANCHES_FORMAT = "%(HEAD)%(refname:short)%00%(upstream:remotename)"
+
+
+class Repository:
+    """The git repository at `projectdir`.
+
+    The branch and its remote are looked up once, with a single `git` call, and cached,
+    so create a new instance for each command instead of keeping one around."""
+
+    def __init__(self, projectdir: Pathish):
+        self.projectdir = Pathier(projectdir)
+        # Number of `git` processes this instance has run
+        self.calls = 0
+
+    def git(self, *args: str, check: bool = True) -> subprocess.CompletedProcess[str]:
+        """Run `git` with `args` in `projectdir`.
+
+        Raises `subprocess.CalledProcessError` if it fails and `check` is `True`."""
+        self.calls += 1
+        result = subprocess.run(
+            ["git", *args], cwd=self.projectdir, capture_output=True, text=True
+        )
+        if check:
+            result.check_returncode()
+        return result
+
+    @cached_property
+    def _head(self) -> tuple[str, str]:
+        output = self.git("for-each-ref", f"--format={BRANCHES_FORMAT}", "refs/heads")
+        for line in output.stdout.splitlines():
+            if line.startswith("*"):
+                branch, _, remote = line[1:].partition("\0")
+                return branch, remote
+        # Nothing has been committed yet or `HEAD` is detached
+        return "", ""
+
+    @property
+    def branch(self) -> str:
+        """The checked out branch or an empty string if `HEAD` isn't on one."""
+        return self._head[0]
+
+    @property
+    def remote(self) -> str:
+        """The remote `branch` tracks, defaulting to `origin`."""
+        return self._head[1] or "origin"
+
+    def on_primary_branch(self) -> bool:
+        return self.branch in PRIMARY_BRANCHES
+
+    def commit(self, message: str, paths: list[Pathish] = []):
+        """Commit the changes to every tracked file along with the files in `paths`,
+        which can be new, with two `git` calls.
+
+        Paths that don't exist are skipped."""
+        paths = [str(path) for path in paths if Pathier(path).exists()]
+        if paths:
+            self.git("add", "--", *paths)
+        self.git("commit", "--all", "--quiet", "--message", message)
+
+    def tag(self, tag: str):
+        self.git("tag", tag)
+
+    def push(self, tags: list[str] = []):
+        """Push `branch` and `tags` to `remote` in one atomic push.
+
+        If the remote has commits this repository doesn't, they're pulled and the push is tried once more.
+        """
+        refspecs = [
+            f"HEAD:refs/heads/{self.branch}",
+            *(f"refs/tags/{tag}" for tag in tags),
+        ]
+        result = self.git("push", "--atomic", self.remote, *refspecs, check=False)
+        if result.returncode == 0:
+            return
+        if "[rejected]" not in result.stderr:
+            result.check_returncode()
+        self.git("pull", "--no-rebase", "--no-edit", self.remote, self.branch)
+        self.git("push", "--atomic", self.remote, *refspecs)
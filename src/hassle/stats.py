@@ -0,0 +1,139 @@
+import math
+import sqlite3
+import time
+from contextlib import closing, contextmanager
+from dataclasses import dataclass
+from statistics import median
+from typing import Iterator
+
+from pathier import Pathier, Pathish
+
+# Slowdowns smaller than this are treated as noise when checking for regressions.
+MIN_REGRESSION_SECONDS = 0.1
+
+
+class StageTimer:
+    """Collects how long each stage of a command takes."""
+
+    def __init__(self):
+        self.durations: dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float):
+        """Record `seconds` for `stage`, adding to any time already recorded for it."""
+        self.durations[stage] = self.durations.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        """Record how long the body of this context takes as `stage`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """Return the nearest-rank `percent` percentile of `values`."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+@dataclass
+class StageStats:
+    command: str
+    stage: str
+    runs: int
+    p50: float
+    p90: float
+    p99: float
+    latest: float
+    baseline: float | None
+    """Median duration of every run before the latest, if there were any."""
+
+    def regressed(self, threshold: float) -> bool:
+        """Returns `True` if the latest run took more than `threshold` (e.g. `0.2` for 20%) longer than the baseline."""
+        if self.baseline is None:
+            return False
+        return (
+            self.latest > self.baseline * (1 + threshold)
+            and self.latest - self.baseline > MIN_REGRESSION_SECONDS
+        )
+
+
+class BuildHistory:
+    """SQLite backed history of stage durations for hassle commands."""
+
+    def __init__(self, path: Pathish):
+        self.path = Pathier(path)
+        self.path.parent.mkdir()
+        with closing(sqlite3.connect(self.path)) as connection, connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS timings (run_id INTEGER, command TEXT, stage TEXT, seconds REAL, timestamp REAL);"
+            )
+
+    def record(self, command: str, durations: dict[str, float]):
+        """Save `durations` as a single run of `command`."""
+        timestamp = time.time()
+        with closing(sqlite3.connect(self.path)) as connection, connection:
+            run_id = connection.execute(
+                "SELECT COALESCE(MAX(run_id), 0) + 1 FROM timings;"
+            ).fetchone()[0]
+            connection.executemany(
+                "INSERT INTO timings VALUES (?, ?, ?, ?, ?);",
+                [
+                    (run_id, command, stage, seconds, timestamp)
+                    for stage, seconds in durations.items()
+                ],
+            )
+
+    def get_durations(self, command: str) -> dict[str, list[float]]:
+        """Returns a mapping of each stage of `command` to its durations, oldest first."""
+        with closing(sqlite3.connect(self.path)) as connection:
+            rows = connection.execute(
+                "SELECT stage, seconds FROM timings WHERE command = ? ORDER BY run_id;",
+                (command,),
+            ).fetchall()
+        durations: dict[str, list[float]] = {}
+        for stage, seconds in rows:
+            durations.setdefault(stage, []).append(seconds)
+        return durations
+
+    def get_commands(self) -> list[str]:
+        """Returns the commands that have a recorded history."""
+        with closing(sqlite3.connect(self.path)) as connection:
+            rows = connection.execute(
+                "SELECT DISTINCT command FROM timings ORDER BY command;"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def get_stats(self, command: str) -> list[StageStats]:
+        """Returns duration statistics for each stage of `command`."""
+        return [
+            StageStats(
+                command,
+                stage,
+                len(durations),
+                percentile(durations, 50),
+                percentile(durations, 90),
+                percentile(durations, 99),
+                durations[-1],
+                median(durations[:-1]) if len(durations) > 1 else None,
+            )
+            for stage, durations in self.get_durations(command).items()
+        ]
+
+
+def format_stats(stats: list[StageStats], threshold: float) -> str:
+    """Returns `stats` as a table, marking stages that regressed past `threshold`."""
+    header = f"{'stage':<16}{'runs':>6}{'p50':>10}{'p90':>10}{'p99':>10}{'latest':>10}"
+    lines = [header, "-" * len(header)]
+    for stat in stats:
+        line = f"{stat.stage:<16}{stat.runs:>6}" + "".join(
+            f"{seconds:>9.2f}s"
+            for seconds in [stat.p50, stat.p90, stat.p99, stat.latest]
+        )
+        if stat.regressed(threshold):
+            line += f"  REGRESSED (+{stat.latest / stat.baseline - 1:.0%} vs. median)"  # type: ignore
+        lines.append(line)
+    return "\n".join(lines)
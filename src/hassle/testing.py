@@ -0,0 +1,262 @@
+import multiprocessing
+import os
+import sys
+import tempfile
+from typing import TYPE_CHECKING
+
+import pytest
+from pathier import Pathier, Pathish
+
+if TYPE_CHECKING:
+    import coverage
+
+    from hassle.stats import StageTimer
+
+DATA_FILE = ".coverage"
+SUMMARY_FORMATS = ["xml", "json"]
+# Relative to the project directory
+DURATIONS_PATH = Pathier(".hassle") / "cache" / "test_durations.json"
+IMPACT_PATH = Pathier(".hassle") / "impact.db"
+
+
+def assign_shards(
+    nodeids: list[str], durations: dict[str, float], shards: int
+) -> list[list[str]]:
+    """Split `nodeids` into `shards` groups with about the same total duration.
+
+    Tests without a recorded duration are assumed to take the average of the others.
+    The same arguments always give the same split, so workers can each find theirs."""
+    known = [durations[nodeid] for nodeid in nodeids if nodeid in durations]
+    default = sum(known) / len(known) if known else 1.0
+    totals = [0.0] * shards
+    groups: list[list[str]] = [[] for _ in range(shards)]
+    # Longest first, each to whichever shard has the least so far
+    for nodeid in sorted(
+        nodeids, key=lambda nodeid: (-durations.get(nodeid, default), nodeid)
+    ):
+        shard = totals.index(min(totals))
+        groups[shard].append(nodeid)
+        totals[shard] += durations.get(nodeid, default)
+    return groups
+
+
+class WorkerPlugin:
+    """Pytest plugin that deselects the collected tests that aren't in shard `shard` of `shards`
+    or are in `skip`, records how long each test that runs takes,
+    and switches the coverage context of `cov` to the id of each test as it runs."""
+
+    def __init__(
+        self,
+        shard: int = 0,
+        shards: int = 1,
+        durations: dict[str, float] = {},
+        skip: set[str] = set(),
+        cov: "coverage.Coverage | None" = None,
+    ):
+        self.shard = shard
+        self.shards = shards
+        self.durations = durations
+        self.skip = skip
+        self.cov = cov
+        self.recorded: dict[str, float] = {}
+
+    # After other plugins (e.g. `-k`) have deselected tests
+    @pytest.hookimpl(trylast=True)
+    def pytest_collection_modifyitems(
+        self, config: pytest.Config, items: list[pytest.Item]
+    ):
+        selected = [item for item in items if item.nodeid not in self.skip]
+        if self.shards > 1:
+            shards = assign_shards(
+                [item.nodeid for item in selected], self.durations, self.shards
+            )
+            shard = set(shards[self.shard])
+            selected = [item for item in selected if item.nodeid in shard]
+        if len(selected) < len(items):
+            keep = set(selected)
+            config.hook.pytest_deselected(
+                items=[item for item in items if item not in keep]
+            )
+            items[:] = selected
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_protocol(self, item: pytest.Item):
+        if self.cov:
+            self.cov.switch_context(item.nodeid)
+        yield
+        if self.cov:
+            self.cov.switch_context("")
+
+    def pytest_runtest_logreport(self, report: pytest.TestReport):
+        # Setup, call, and teardown each get a report
+        self.recorded[report.nodeid] = (
+            self.recorded.get(report.nodeid, 0.0) + report.duration
+        )
+
+
+def run_pytest(
+    projectdir: str,
+    pytest_args: list[str],
+    data_file: str,
+    shard: int = 0,
+    shards: int = 1,
+    durations: dict[str, float] = {},
+    skip: set[str] = set(),
+    log_path: str | None = None,
+) -> tuple[int, dict[str, float]]:
+    """Run `pytest -s` in `projectdir` with coverage measurement in this process.
+    Lines are recorded with the id of the test that executed them as their coverage context.
+
+    Tests in `skip` aren't run.
+    If `shards` is more than 1, only shard number `shard` of the remaining tests is run
+    and the coverage data is saved to `{data_file}.shard{shard}` instead of `data_file`.
+    Output is redirected to `log_path` if it's given.
+
+    Returns pytest's exit code and the duration of each test that ran."""
+    import coverage
+
+    if log_path:
+        log = open(log_path, "w")
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+    os.chdir(projectdir)
+    # Match `python -m pytest`, which puts the current directory on the path
+    if projectdir not in sys.path:
+        sys.path.insert(0, projectdir)
+    cov = coverage.Coverage(
+        data_file=data_file, data_suffix=f"shard{shard}" if shards > 1 else None
+    )
+    plugin = WorkerPlugin(shard, shards, durations, skip, cov)
+    cov.start()
+    try:
+        exit_code = int(pytest.main(["-s", *pytest_args], plugins=[plugin]))
+    finally:
+        cov.stop()
+        cov.save()
+        sys.stdout.flush()
+        sys.stderr.flush()
+    return exit_code, plugin.recorded
+
+
+def run_tests(
+    projectdir: Pathish | None = None,
+    pytest_args: list[str] = [],
+    html: bool = False,
+    summary: str | None = None,
+    timer: "StageTimer | None" = None,
+    jobs: int = 1,
+    affected: bool = False,
+) -> bool:
+    """Run the tests in `projectdir` (defaults to the current directory) with `pytest -s` and `coverage`.
+
+    Tests run in fresh processes so the project's modules are imported under coverage,
+    even if hassle itself has already imported them.
+    If `jobs` is more than 1, the tests are split into that many shards, balanced by how long
+    each test took on previous runs, and the shards run in parallel.
+    Each shard's output is printed once they've all finished
+    and their coverage data is combined into `.coverage`.
+
+    The files and lines each test executes are recorded in `.hassle/impact.db`.
+    If `affected` is `True`, tests that didn't execute any file that changed since the last
+    passing run are skipped (see `hassle.impact.ImpactDatabase.select()`).
+
+    The coverage data is then loaded once for the terminal report,
+    an html report if `html` is `True` (only pages for files whose coverage changed are rewritten),
+    and an xml or json report if `summary` is one of `SUMMARY_FORMATS`.
+    Reports only include files in `projectdir`.
+
+    If `timer` is given, the test run and each report are timed as separate stages.
+
+    Returns `True` if all tests passed or if no tests were found."""
+    import coverage
+
+    from hassle.dependencies import get_site_packages_key
+    from hassle.impact import ImpactDatabase, Selection, get_footprints, hash_files
+    from hassle.stats import StageTimer
+
+    projectdir = Pathier(projectdir or Pathier.cwd())
+    timer = timer or StageTimer()
+    data_file = str(projectdir / DATA_FILE)
+    durations_path = projectdir / DURATIONS_PATH
+    durations: dict[str, float] = (
+        durations_path.loads() if durations_path.exists() else {}
+    )
+    with timer.time("test impact"):
+        impact = ImpactDatabase(projectdir / IMPACT_PATH)
+        # Hashed before the tests run in case anything changes the files while they do
+        hashes = hash_files(projectdir)
+        dependency_key = get_site_packages_key()
+        selection = Selection(True)
+        if affected:
+            selection = impact.select(hashes, dependency_key)
+            print(selection)
+    cov = coverage.Coverage(data_file=data_file)
+    cov.erase()
+    with timer.time("tests"), tempfile.TemporaryDirectory() as logdir:
+        logs = [
+            str(Pathier(logdir) / f"shard{shard}.log") if jobs > 1 else None
+            for shard in range(jobs)
+        ]
+        # Spawn, rather than fork, so nothing imported by this process carries over,
+        # and only run one shard per process so no shard inherits another's imports
+        with multiprocessing.get_context("spawn").Pool(
+            jobs, maxtasksperchild=1
+        ) as pool:
+            results = pool.starmap(
+                run_pytest,
+                [
+                    (
+                        str(projectdir),
+                        pytest_args,
+                        data_file,
+                        shard,
+                        jobs,
+                        durations,
+                        selection.skip,
+                        log,
+                    )
+                    for shard, log in enumerate(logs)
+                ],
+                chunksize=1,
+            )
+        for shard, log in enumerate(logs):
+            if log:
+                print(f"[shard {shard + 1}/{jobs}]")
+                print(Pathier(log).read_text())
+    passed = all(exit_code in [0, 5] for exit_code, _ in results)
+    for _, recorded in results:
+        durations.update(recorded)
+    durations_path.dumps(durations)
+    if jobs > 1:
+        with timer.time("coverage combine"):
+            cov.combine([f"{data_file}.shard{shard}" for shard in range(jobs)])
+            cov.save()
+    else:
+        cov.load()
+    with timer.time("test impact"):
+        # Extra pytest arguments may have deselected tests, so only a plain run counts as complete
+        complete = not selection.skip and not pytest_args
+        impact.record_footprints(
+            [nodeid for _, recorded in results for nodeid in recorded],
+            get_footprints(cov.get_data(), projectdir),
+            replace_all=complete,
+        )
+        if passed and not pytest_args:
+            impact.record_passing_run(hashes, dependency_key, complete)
+    include = [f"{projectdir}/*"]
+    try:
+        with timer.time("coverage report"):
+            cov.report(include=include)
+        if html:
+            with timer.time("coverage html"):
+                cov.html_report(include=include, directory=str(projectdir / "htmlcov"))
+        if summary:
+            with timer.time(f"coverage {summary}"):
+                outfile = str(projectdir / f"coverage.{summary}")
+                if summary == "xml":
+                    cov.xml_report(include=include, outfile=outfile)
+                else:
+                    cov.json_report(include=include, outfile=outfile)
+    except coverage.exceptions.NoDataError as e:
+        print(e)
+    return passed
@@ -0,0 +1,419 @@
+import configparser
+import email.parser
+import hashlib
+import os
+import tarfile
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from email.message import Message
+from functools import cached_property
+from typing import TYPE_CHECKING, Any, Iterator
+from urllib.parse import urlsplit
+
+from pathier import Pathier, Pathish
+
+from hassle import utilities
+
+if TYPE_CHECKING:
+    import requests
+
+DEFAULT_REPOSITORY = "https://upload.pypi.org/legacy/"
+CHUNK_SIZE = 64 * 1024
+# Metadata fields that can be given more than once and the form field they're uploaded as
+MULTIPLE_USE = {
+    "classifier": "classifiers",
+    "dynamic": "dynamic",
+    "license_file": "license_file",
+    "obsoletes_dist": "obsoletes_dist",
+    "platform": "platform",
+    "project_url": "project_urls",
+    "provides_dist": "provides_dist",
+    "provides_extra": "provides_extra",
+    "requires_dist": "requires_dist",
+    "requires_external": "requires_external",
+    "supported_platform": "supported_platform",
+}
+# Status codes worth trying an upload again for
+RETRY_STATUSES = [408, 429, 500, 502, 503, 504]
+
+
+@dataclass
+class UploadTarget:
+    name: str
+    url: str
+    username: str
+    password: str
+
+    @property
+    def index_url(self) -> str:
+        """The root of the JSON API of the index this target uploads to,
+        e.g. `https://pypi.org` for `https://upload.pypi.org/legacy/`."""
+        url = urlsplit(self.url)
+        netloc = url.netloc.removeprefix("upload.")
+        path = url.path.rstrip("/").removesuffix("/legacy")
+        return f"{url.scheme}://{netloc}{path}"
+
+
+def get_target(repository: str = "pypi", pypirc: Pathish | None = None) -> UploadTarget:
+    """Returns the upload target for `repository` from `pypirc` (defaults to `~/.pypirc`).
+
+    Like twine, `$TWINE_USERNAME` and `$TWINE_PASSWORD` take precedence over the file,
+    the username defaults to `__token__`, and `pypi` doesn't need to be in the file if they're set.
+    """
+    config = configparser.RawConfigParser()
+    config.read(pypirc or Pathier.home() / ".pypirc")
+    if not config.has_section(repository) and repository != "pypi":
+        raise ValueError(f"There's no `[{repository}]` section in `.pypirc`.")
+    section = config[repository] if config.has_section(repository) else {}
+    url = section.get("repository") or (
+        DEFAULT_REPOSITORY if repository == "pypi" else ""
+    )
+    if not url:
+        raise ValueError(
+            f"`[{repository}]` in `.pypirc` doesn't have a `repository` url."
+        )
+    password = os.environ.get("TWINE_PASSWORD") or section.get("password")
+    if not password:
+        raise ValueError(
+            f"No password for `{repository}` in `.pypirc` or `$TWINE_PASSWORD`."
+        )
+    return UploadTarget(
+        repository,
+        url,
+        os.environ.get("TWINE_USERNAME") or section.get("username") or "__token__",
+        password,
+    )
+
+
+def read_metadata(path: Pathish) -> Message:
+    """Returns the core metadata of the wheel or sdist at `path`."""
+    path = Pathier(path)
+    if path.suffix == ".whl":
+        with zipfile.ZipFile(path) as wheel:
+            name = next(
+                name
+                for name in wheel.namelist()
+                if name.count("/") == 1 and name.endswith(".dist-info/METADATA")
+            )
+            content = wheel.read(name)
+    elif path.name.endswith(".zip"):
+        with zipfile.ZipFile(path) as sdist:
+            name = min(
+                (name for name in sdist.namelist() if name.endswith("/PKG-INFO")),
+                key=len,
+            )
+            content = sdist.read(name)
+    else:
+        with tarfile.open(path) as sdist:
+            member = min(
+                (member for member in sdist if member.name.endswith("/PKG-INFO")),
+                key=lambda member: len(member.name),
+            )
+            content = sdist.extractfile(member).read()  # type: ignore
+    return email.parser.BytesParser().parsebytes(content)
+
+
+def get_form_fields(path: Pathish, metadata: Message) -> list[tuple[str, str]]:
+    """Returns the fields, other than the file and its digests, to upload `path` with."""
+    path = Pathier(path)
+    if path.suffix == ".whl":
+        filetype, pyversion = "bdist_wheel", path.stem.split("-")[-3]
+    else:
+        filetype, pyversion = "sdist", "source"
+    fields = [
+        (":action", "file_upload"),
+        ("protocol_version", "1"),
+        ("filetype", filetype),
+        ("pyversion", pyversion),
+    ]
+    for key, value in metadata.items():
+        field = key.lower().replace("-", "_")
+        fields.append((MULTIPLE_USE.get(field, field), value))
+    if description := metadata.get_payload():
+        fields.append(("description", description))  # type: ignore
+    return fields
+
+
+class MultipartUpload:
+    """A `multipart/form-data` body for uploading `path` with `fields`, read like a file.
+
+    The file is streamed from disk in chunks and hashed as it's read,
+    with its digests sent as the last fields, so the file is only read once.
+    The total length is known up front because the digests have a fixed length."""
+
+    def __init__(self, path: Pathish, fields: list[tuple[str, str]]):
+        self.path = Pathier(path)
+        self.boundary = uuid.uuid4().hex
+        self.hashes = {
+            "md5_digest": hashlib.md5(usedforsecurity=False),
+            "sha256_digest": hashlib.sha256(),
+            "blake2_256_digest": hashlib.blake2b(digest_size=32),
+        }
+        self._head = (
+            b"".join(self._field(name, value) for name, value in fields)
+            + (
+                f'--{self.boundary}\r\nContent-Disposition: form-data; name="content"; filename="{self.path.name}"\r\n'
+                "Content-Type: application/octet-stream\r\n\r\n"
+            ).encode()
+        )
+        self._length = (
+            len(self._head) + self.path.stat().st_size + len(self._get_tail())
+        )
+        self._chunks = self._iter_chunks()
+        self._buffer = bytearray()
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    @property
+    def digests(self) -> dict[str, str]:
+        """The digests of the file, complete once the whole body has been read."""
+        return {name: hash.hexdigest() for name, hash in self.hashes.items()}
+
+    def _field(self, name: str, value: str) -> bytes:
+        return (
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+        ).encode()
+
+    def _get_tail(self) -> bytes:
+        return (
+            b"\r\n"
+            + b"".join(self._field(name, value) for name, value in self.digests.items())
+            + f"--{self.boundary}--\r\n".encode()
+        )
+
+    def _iter_chunks(self) -> Iterator[bytes]:
+        yield self._head
+        with self.path.open("rb") as file:
+            while chunk := file.read(CHUNK_SIZE):
+                for hash in self.hashes.values():
+                    hash.update(chunk)
+                yield chunk
+        yield self._get_tail()
+
+    def __len__(self) -> int:
+        return self._length
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+@dataclass
+class UploadResult:
+    path: Pathier
+    # `uploaded`, `skipped` if it was already on the index, or `failed`
+    status: str
+    attempts: int = 0
+    error: Exception | None = None
+
+
+class UploadProgress:
+    """Record in the json file `path` of the files that have been uploaded to each repository,
+    with their modification time, size, and sha256 digest, so an interrupted upload can be resumed
+    without checking them again."""
+
+    def __init__(self, path: Pathish):
+        self.path = Pathier(path)
+        self._lock = threading.Lock()
+        self._data: dict[str, dict[str, dict[str, Any]]] = (
+            self.path.loads() if self.path.exists() else {}
+        )
+
+    def get_sha256(self, url: str, path: Pathier) -> str | None:
+        """Returns the sha256 digest of `path` if it was recorded for `url` and hasn't been modified since."""
+        entry = self._data.get(url, {}).get(path.name)
+        if entry and tuple(entry["key"]) == utilities.get_file_key(path):
+            return entry["sha256"]
+        return None
+
+    def is_uploaded(self, url: str, path: Pathier) -> bool:
+        return self.get_sha256(url, path) is not None
+
+    def record(self, url: str, path: Pathier, sha256: str):
+        with self._lock:
+            self._data.setdefault(url, {})[path.name] = {
+                "key": utilities.get_file_key(path),
+                "sha256": sha256,
+            }
+            self.path.parent.mkdir()
+            utilities.atomic_dumps(self.path, self._data)
+
+
+class Uploader:
+    """Uploads distributions to `target` through the legacy upload API, up to `jobs` at a time.
+
+    Files that already exist on the index with the same sha256 digest are skipped
+    and failed attempts are retried up to `retries` times with exponential backoff.
+    If `progress_path` is given, uploaded files are recorded there so they're skipped on a later run.
+    """
+
+    def __init__(
+        self,
+        target: UploadTarget,
+        progress_path: Pathish | None = None,
+        jobs: int = 4,
+        retries: int = 3,
+        backoff: float = 1.0,
+        timeout: float = 60,
+    ):
+        self.target = target
+        self.progress = UploadProgress(progress_path) if progress_path else None
+        self.jobs = jobs
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+    @cached_property
+    def session(self) -> "requests.Session":
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.jobs, pool_maxsize=self.jobs)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def get_existing(self, name: str, version: str) -> dict[str, str] | None:
+        """Returns the sha256 digest of each file already uploaded for `version` of project `name`,
+        keyed by file name, or `None` if the index can't be asked.
+
+        The JSON API can be on a different host than the upload url, so no credentials are sent.
+        """
+        url = f"{self.target.index_url}/pypi/{utilities.normalize_name(name)}/{version}/json"
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+        except Exception:
+            return None
+        if response.status_code == 404:
+            return {}
+        if response.status_code != 200:
+            return None
+        try:
+            return {
+                file["filename"]: file["digests"]["sha256"]
+                for file in response.json().get("urls", [])
+            }
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return None
+
+    def _get_sha256(self, path: Pathier) -> str:
+        if self.progress and (
+            sha256 := self.progress.get_sha256(self.target.url, path)
+        ):
+            return sha256
+        return hashlib.sha256(path.read_bytes()).hexdigest()
+
+    def _record(self, path: Pathier, sha256: str):
+        if self.progress:
+            self.progress.record(self.target.url, path, sha256)
+
+    def _compare(
+        self, path: Pathier, sha256: str, existing: dict[str, str] | None
+    ) -> UploadResult:
+        """Returns a `skipped` result, and records `path` as uploaded, only if `existing` has it with `sha256`."""
+        if existing is None or path.name not in existing:
+            error = RuntimeError(
+                f"{path.name} already exists on {self.target.name}, but its sha256 digest couldn't be checked."
+            )
+            return UploadResult(path, "failed", error=error)
+        if existing[path.name] != sha256:
+            error = RuntimeError(
+                f"A different {path.name} has already been uploaded to {self.target.name}."
+            )
+            return UploadResult(path, "failed", error=error)
+        self._record(path, sha256)
+        return UploadResult(path, "skipped")
+
+    def upload_file(
+        self, path: Pathish, metadata: Message, existing: dict[str, str] | None
+    ) -> UploadResult:
+        """Upload `path` unless it's in `existing` (see `get_existing()`) with the same sha256 digest."""
+        path = Pathier(path)
+        if existing and path.name in existing:
+            return self._compare(path, self._get_sha256(path), existing)
+        fields = get_form_fields(path, metadata)
+        attempts = 0
+        while True:
+            attempts += 1
+            body = MultipartUpload(path, fields)
+            error: Exception | None = None
+            try:
+                response = self.session.post(
+                    self.target.url,
+                    data=body,
+                    auth=(self.target.username, self.target.password),
+                    headers={"Content-Type": body.content_type},
+                    timeout=self.timeout,
+                )
+            except Exception as e:
+                error = e
+            else:
+                if response.status_code == 200:
+                    self._record(path, body.digests["sha256_digest"])
+                    return UploadResult(path, "uploaded", attempts)
+                # An index accepts the same file again, so this means either a different file
+                # has the same name or `existing` was out of date, which only the index can tell apart
+                if (
+                    response.status_code in [400, 409]
+                    and "already exists" in response.text
+                ):
+                    result = self._compare(
+                        path,
+                        body.digests["sha256_digest"],
+                        self.get_existing(metadata["Name"], metadata["Version"]),
+                    )
+                    result.attempts = attempts
+                    return result
+                error = RuntimeError(
+                    f"{self.target.url} returned status code {response.status_code}: {response.reason}"
+                )
+                if response.status_code not in RETRY_STATUSES:
+                    return UploadResult(path, "failed", attempts, error)
+            if attempts > self.retries:
+                return UploadResult(path, "failed", attempts, error)
+            time.sleep(self.backoff * 2 ** (attempts - 1))
+
+    def upload(self, paths: list[Pathish]) -> list[UploadResult]:
+        """Upload `paths` and return the result for each one, in the same order."""
+        pending: list[Pathier] = []
+        results: dict[Pathier, UploadResult] = {}
+        for path in map(Pathier, paths):
+            if self.progress and self.progress.is_uploaded(self.target.url, path):
+                results[path] = UploadResult(path, "skipped")
+            else:
+                pending.append(path)
+        metadata = {path: read_metadata(path) for path in pending}
+        # Usually the sdist and wheel of one version, so this is one request
+        releases = {(data["Name"], data["Version"]) for data in metadata.values()}
+        existing = {release: self.get_existing(*release) for release in releases}
+        with ThreadPoolExecutor(self.jobs) as executor:
+            for result in executor.map(
+                lambda path: self.upload_file(
+                    path,
+                    metadata[path],
+                    existing[(metadata[path]["Name"], metadata[path]["Version"])],
+                ),
+                pending,
+            ):
+                results[result.path] = result
+        return [results[Pathier(path)] for path in paths]
+
+    def close(self):
+        if "session" in self.__dict__:
+            self.session.close()
+            del self.__dict__["session"]
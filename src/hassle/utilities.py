@@ -1,14 +1,26 @@
+import os
 import re
 import subprocess
-from typing import Any
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Iterator
 
-import requests
-from bs4 import BeautifulSoup
-from gitbetter import Git
-from pathier import Pathier
+from pathier import Pathier, Pathish
+
+if TYPE_CHECKING:
+    import pathspec
 
 root = Pathier(__file__).parent
 
+# Patterns that are never part of a project's source, regardless of ignore files.
+ALWAYS_IGNORE = [
+    ".git/",
+    ".hassle/",
+    ".pytest_cache/",
+    "__pycache__/",
+    "dist/",
+    "htmlcov/",
+]
+
 
 def swap_keys(data: dict[str, Any], keys: tuple[str, str]) -> dict[str, Any]:
     """Convert between keys in `data`.
@@ -30,32 +42,124 @@ def swap_keys(data: dict[str, Any], keys: tuple[str, str]) -> dict[str, Any]:
     return data
 
 
-def run_tests(pytest_args: list[str] = []) -> bool:
-    """Invoke `coverage` and `pytest -s`.
+def get_file_key(path: Pathish) -> tuple[int, int]:
+    """Returns the modification time in nanoseconds and the size of `path`."""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def atomic_dumps(path: Pathish, data: Any):
+    """Dump `data` to the json or toml file `path` by writing a temporary file and renaming it,
+    so an interrupted write never leaves `path` half written."""
+    path = Pathier(path)
+    temp_path = path.with_name(f".{path.stem}.tmp{path.suffix}")
+    temp_path.dumps(data)
+    os.replace(temp_path, path)
+
+
+@contextmanager
+def file_lock(path: Pathish) -> Iterator[None]:
+    """Hold an exclusive lock on the file `path`, creating it if it doesn't exist, until the context exits.
+
+    Waits for other processes holding the lock to release it first."""
+    path = Pathier(path)
+    path.parent.mkdir()
+    with open(path, "a+b") as file:
+        if os.name == "nt":
+            import msvcrt
+
+            file.seek(0)
+            # Retries for 10 seconds before raising
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+def get_ignore_spec(
+    projectdir: Pathish, exclude: list[str] = []
+) -> "pathspec.GitIgnoreSpec":
+    """Return a spec matching paths, relative to `projectdir`, that should be ignored.
 
-    Returns `True` if all tests passed or if no tests were found."""
-    results = subprocess.run(["coverage", "run", "-m", "pytest", "-s"] + pytest_args)
-    subprocess.run(["coverage", "report", f"--include={Pathier.cwd()}/*"])
-    subprocess.run(["coverage", "html", f"--include={Pathier.cwd()}/*"])
-    return results.returncode in [0, 5]
+    Combines `ALWAYS_IGNORE`, `exclude` (e.g. the sdist `exclude` list in `pyproject.toml`),
+    and `{projectdir}/.gitignore` if it exists."""
+    import pathspec
 
+    lines = ALWAYS_IGNORE + exclude
+    gitignore = Pathier(projectdir) / ".gitignore"
+    if gitignore.exists():
+        lines += gitignore.read_text().splitlines()
+    return pathspec.GitIgnoreSpec.from_lines(lines)
 
-def check_pypi(package_name: str) -> bool:
+
+def run_and_print(command: list[Any]) -> str:
+    """Run `command`, print its combined stdout and stderr through `sys.stdout`, and return it.
+
+    Unlike letting the subprocess inherit the terminal, this lets the caller capture the output.
+    Raises `subprocess.CalledProcessError` if `command` fails."""
+    result = subprocess.run(
+        command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+    )
+    print(result.stdout, end="")
+    result.check_returncode()
+    return result.stdout
+
+
+def check_pypi(package_name: str, online: bool = False) -> bool:
     """Check if a package with package_name already exists on `pypi.org`.
     Returns `True` if package name exists.
-    Only checks the first page of results."""
-    url = f"https://pypi.org/search/?q={package_name.lower()}"
-    response = requests.get(url)
-    if response.status_code != 200:
-        raise RuntimeError(
-            f"Error: pypi.org returned status code: {response.status_code}"
-        )
-    soup = BeautifulSoup(response.text, "html.parser")
-    pypi_packages = [
-        span.text.lower()
-        for span in soup.find_all("span", class_="package-snippet__name")
-    ]
-    return package_name in pypi_packages
+
+    If the local name index has been synced (`hassle index sync`), it's used instead of the network
+    unless `online` is `True`."""
+    from hassle import pypi
+
+    index = pypi.NameIndex.default()
+    if index.exists() and not online:
+        return package_name in index
+    return pypi.get_client().exists(package_name)
+
+
+def check_pypi_many(
+    package_names: list[str], online: bool = False, concurrency: int | None = None
+) -> dict[str, bool | Exception]:
+    """Check which of `package_names` already exist on `pypi.org`.
+
+    Like `check_pypi`, the local name index is used if it has been synced, unless `online` is `True`.
+    Otherwise, up to `concurrency` names are checked at a time.
+
+    Returns a mapping of each name to whether it exists,
+    or the exception raised while checking it."""
+    from hassle import pypi
+
+    index = pypi.NameIndex.default()
+    if index.exists() and not online:
+        return {name: name in index for name in package_names}
+    return pypi.get_client().exists_many(package_names, concurrency)
+
+
+def normalize_name(name: str) -> str:
+    """Normalize a distribution name according to PEP 503."""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def get_cachedir() -> Pathier:
+    """Returns the directory hassle caches data in that isn't specific to a project.
+
+    Uses `$XDG_CACHE_HOME/hassle`, defaulting to `~/.cache/hassle`."""
+    return (
+        Pathier(os.environ.get("XDG_CACHE_HOME") or Pathier.home() / ".cache")
+        / "hassle"
+    )
 
 
 def get_answer(question: str) -> bool | None:
@@ -111,7 +215,6 @@ def bump_version(current_version: str, bump_type: str) -> str:
 
 def on_primary_branch() -> bool:
     """Returns `False` if repo is not currently on `main` or `master` branch."""
-    git = Git(True)
-    if git.current_branch not in ["main", "master"]:
-        return False
-    return True
+    from hassle.release import Repository
+
+    return Repository(Pathier.cwd()).on_primary_branch()
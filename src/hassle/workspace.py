@@ -0,0 +1,134 @@
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+
+from pathier import Pathier, Pathish
+
+# Directories that never contain projects
+SKIP_DIRS = ["__pycache__", "node_modules", "dist", "build", "docs"]
+
+
+@dataclass
+class ProjectResult:
+    projectdir: Pathier
+    log_path: Pathier
+    returncode: int
+    seconds: float
+
+    @property
+    def passed(self) -> bool:
+        return self.returncode == 0
+
+
+def discover_projects(root: Pathish) -> list[Pathier]:
+    """Return the directories under `root`, including `root` itself, that `HassleProject.load` can load.
+
+    Hidden directories, virtual environments, and project subdirectories aren't searched.
+    """
+    from hassle.models import HassleProject
+
+    projects: list[Pathier] = []
+    for directory, dirnames, filenames in os.walk(root):
+        if "pyproject.toml" in filenames:
+            try:
+                projects.append(HassleProject.load(directory).projectdir)
+            except Exception:
+                ...
+            else:
+                dirnames.clear()
+                continue
+        dirnames[:] = sorted(
+            name
+            for name in dirnames
+            if not name.startswith(".")
+            and name not in SKIP_DIRS
+            and not os.path.exists(os.path.join(directory, name, "pyvenv.cfg"))
+        )
+    return sorted(projects)
+
+
+def get_log_path(logdir: Pathier, root: Pathier, projectdir: Pathier) -> Pathier:
+    """Return where the output of `projectdir` is written, named after its path relative to `root`."""
+    name = projectdir.relative_to(root).as_posix().replace("/", "-")
+    return logdir / f"{name if name != '.' else projectdir.name}.log"
+
+
+def run_project(
+    projectdir: Pathier, command: list[str], log_path: Pathier
+) -> ProjectResult:
+    """Run the hassle `command` in `projectdir` in a new process with its output going to `log_path`."""
+    start = time.perf_counter()
+    log_path.parent.mkdir()
+    with log_path.open("w", encoding="utf-8") as log:
+        try:
+            returncode = subprocess.run(
+                [sys.executable, "-m", "hassle.hassle_cli", *command],
+                cwd=projectdir,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                # Nothing is there to answer prompts
+                stdin=subprocess.DEVNULL,
+            ).returncode
+        except Exception as e:
+            log.write(f"Could not run hassle: {type(e).__name__}: {e}\n")
+            returncode = -1
+    return ProjectResult(projectdir, log_path, returncode, time.perf_counter() - start)
+
+
+def run_workspace(
+    root: Pathish,
+    projects: list[Pathier],
+    command: list[str],
+    logdir: Pathish,
+    processes: int | None = None,
+) -> list[ProjectResult]:
+    """Run the hassle `command` in each of `projects`, with up to `processes` (defaults to the cpu count) at a time.
+
+    Each project's output goes to its own file in `logdir`.
+    A progress bar is shown and each project is reported as it finishes.
+    Returns the results in the same order as `projects`."""
+    from rich.progress import Progress
+
+    root = Pathier(root)
+    logdir = Pathier(logdir)
+    results: dict[Pathier, ProjectResult] = {}
+    with (
+        Progress() as progress,
+        ThreadPoolExecutor(processes or os.cpu_count() or 1) as executor,
+    ):
+        task = progress.add_task(f"hassle {command[0]}", total=len(projects))
+        futures = [
+            executor.submit(
+                run_project, projectdir, command, get_log_path(logdir, root, projectdir)
+            )
+            for projectdir in projects
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results[result.projectdir] = result
+            status = "[green]passed[/]" if result.passed else "[red]failed[/]"
+            progress.console.print(
+                f"{status} {result.projectdir.relative_to(root)} ({result.seconds:.1f}s)"
+            )
+            progress.advance(task)
+    return [results[projectdir] for projectdir in projects]
+
+
+def format_summary(root: Pathish, results: list[ProjectResult]) -> str:
+    """Returns `results` as a table followed by the number of projects that passed and failed."""
+    root = Pathier(root)
+    names = [str(result.projectdir.relative_to(root)) for result in results]
+    width = max([len("project"), *(len(name) for name in names)]) + 2
+    header = f"{'project':<{width}}{'result':<8}{'seconds':>9}  log"
+    lines = [header, "-" * len(header)]
+    for name, result in zip(names, results):
+        status = "passed" if result.passed else "failed"
+        lines.append(
+            f"{name:<{width}}{status:<8}{result.seconds:>8.1f}s  {result.log_path}"
+        )
+    failed = sum(not result.passed for result in results)
+    lines.append(f"{len(results) - failed} passed, {failed} failed")
+    return "\n".join(lines)
@@ -0,0 +1,41 @@
+from typing import Callable
+
+import pytest
+from pathier import Pathier
+
+from hassle.models import Pyproject
+
+
+@pytest.fixture
+def make_project() -> Callable[..., Pathier]:
+    """Returns a function that creates a hassle project named after `projectdir`
+    with a package in `src`, a test that passes if `passing` is `True`,
+    and `files`, a mapping of paths relative to `projectdir` to their content, which can replace the others.
+    """
+
+    def make(
+        projectdir: Pathier, passing: bool = True, files: dict[str, str] = {}
+    ) -> Pathier:
+        pyproject = Pyproject.from_template()
+        pyproject.project.name = projectdir.name
+        pyproject.dump(projectdir / "pyproject.toml")
+        (projectdir / "src" / projectdir.name).mkdir()
+        (projectdir / "src" / projectdir.name / "__init__.py").touch()
+        (projectdir / "tests").mkdir()
+        (projectdir / "tests" / "test_it.py").write_text(
+            f"def test__it():\n    assert {passing}\n"
+        )
+        for name, content in files.items():
+            (projectdir / name).parent.mkdir()
+            (projectdir / name).write_text(content)
+        return projectdir
+
+    return make
+
+
+@pytest.fixture
+def git_identity(monkeypatch: pytest.MonkeyPatch):
+    """Set the author and committer for commits made by git, so tests don't depend on the user's git config."""
+    for var in ["GIT_AUTHOR", "GIT_COMMITTER"]:
+        monkeypatch.setenv(f"{var}_NAME", "hassle")
+        monkeypatch.setenv(f"{var}_EMAIL", "hassle@example.com")
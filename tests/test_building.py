@@ -0,0 +1,114 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from pathier import Pathier
+
+from hassle import building
+from hassle.models import HassleProject, Pyproject
+
+BACKEND = """import os
+
+
+def build_sdist(directory, config_settings=None):
+    return write(directory, "fake-1.0.tar.gz")
+
+
+def build_wheel(directory, config_settings=None, metadata_directory=None):
+    return write(directory, "fake-1.0-py3-none-any.whl")
+
+
+def write(directory, name):
+    with open(os.path.join(directory, name), "w") as file:
+        file.write(f"{os.getcwd()} {os.environ['SOURCE_DATE_EPOCH']}")
+    return name
+"""
+
+
+# Builds with the fake backend in an isolated environment
+FILES = {
+    "pyproject.toml": '[build-system]\nrequires = []\nbuild-backend = "fake_backend"\nbackend-path = ["."]\n',
+    "fake_backend.py": BACKEND,
+}
+
+
+def test__build_cached(tmp_path, make_project):
+    projectdir = make_project(Pathier(tmp_path) / "fake", files=FILES)
+    envsdir = Pathier(tmp_path) / "envs"
+    for _ in range(2):
+        (projectdir / "dist").delete()
+        building.build(
+            projectdir, projectdir / "dist", [], "fake_backend", envsdir=envsdir
+        )
+        assert sorted(path.name for path in (projectdir / "dist").iterdir()) == [
+            "fake-1.0-py3-none-any.whl",
+            "fake-1.0.tar.gz",
+        ]
+    # The environment is reused
+    assert [path.name for path in envsdir.iterdir()] == [building.get_env_key([])]
+
+
+def test__get_build_env_concurrently(tmp_path):
+    envsdir = Pathier(tmp_path) / "envs"
+    with ThreadPoolExecutor(4) as executor:
+        envdirs = set(
+            executor.map(lambda _: building.get_build_env([], envsdir), range(4))
+        )
+    assert envdirs == {envsdir / building.get_env_key([])}
+    # The environments of the callers that lost the race are removed
+    assert [path.name for path in envsdir.iterdir()] == [building.get_env_key([])]
+    assert (envdirs.pop() / building.ENV_MARKER).exists()
+
+
+def test__build_in_process(tmp_path, monkeypatch, make_project):
+    projectdir = make_project(Pathier(tmp_path) / "fake", files=FILES)
+    monkeypatch.syspath_prepend(str(projectdir))
+    monkeypatch.delenv("SOURCE_DATE_EPOCH", raising=False)
+    cwd = os.getcwd()
+    building.build(projectdir, projectdir / "dist", [], "fake_backend", "in-process")
+    # The hooks ran in the project directory with a fixed timestamp
+    assert (
+        projectdir / "dist" / "fake-1.0.tar.gz"
+    ).read_text() == f"{projectdir} {building.DEFAULT_EPOCH}"
+    assert (projectdir / "dist" / "fake-1.0-py3-none-any.whl").exists()
+    assert os.getcwd() == cwd
+
+
+def test__artifact_cache(tmp_path):
+    cache = building.ArtifactCache(Pathier(tmp_path) / "artifacts")
+    distdir = Pathier(tmp_path) / "dist"
+    for key in ["old", "new"]:
+        (distdir / f"{key}.whl").write_text(key)
+        cache.store(key, distdir)
+        (distdir / f"{key}.whl").delete()
+    assert cache.restore("missing", distdir) is None
+    assert cache.restore("old", distdir) == ["old.whl"]
+    assert (distdir / "old.whl").read_text() == "old"
+    # Restoring "old" made it the most recently used
+    assert cache.prune(1, 30) == ["new"]
+    assert cache.prune(1, -1) == ["old"]
+
+
+def test__hassleproject_build_reuses_artifacts(
+    tmp_path, monkeypatch, capsys, make_project
+):
+    projectdir = make_project(
+        Pathier(tmp_path) / "fake",
+        files={"src/fake/__init__.py": "x = 1\n", "fake_backend.py": BACKEND},
+    )
+    pyproject = Pyproject.load(projectdir / "pyproject.toml")
+    pyproject.build_system.requires = []
+    pyproject.build_system.build_backend = "fake_backend"
+    pyproject.dump(projectdir / "pyproject.toml")
+    monkeypatch.syspath_prepend(str(projectdir))
+    project = HassleProject.load(projectdir)
+    project.build("in-process")
+    project.build("in-process")
+    assert (
+        "Reusing fake-1.0-py3-none-any.whl and fake-1.0.tar.gz"
+        in capsys.readouterr().out
+    )
+    assert len(list((project.cachedir / "artifacts").iterdir())) == 1
+    (projectdir / "src" / "fake" / "__init__.py").write_text("x = 2\n")
+    project.build("in-process")
+    assert "Reusing" not in capsys.readouterr().out
+    assert (project.distdir / "fake-1.0.tar.gz").exists()
@@ -0,0 +1,81 @@
+import subprocess
+from datetime import date
+
+import pytest
+from pathier import Pathier
+
+from hassle import changelog
+
+
+def commit(repo: Pathier, message: str):
+    subprocess.run(
+        ["git", "commit", "--allow-empty", "-q", "-m", message], cwd=repo, check=True
+    )
+
+
+@pytest.fixture
+def repo(tmp_path, git_identity) -> Pathier:
+    repo = Pathier(tmp_path)
+    subprocess.run(["git", "init", "-q"], cwd=repo, check=True)
+    commit(repo, "feat: first feature")
+    subprocess.run(["git", "tag", "v0.0.1"], cwd=repo, check=True)
+    for message in [
+        "fix(cli): handle empty args",
+        "chore: build v0.0.2",
+        "refactor!: rename everything",
+        "update readme",
+        "docs: add usage",
+        "chore: update changelog",
+    ]:
+        commit(repo, message)
+    return repo
+
+
+def test__commit_parse():
+    commit = changelog.Commit.parse("abc", "feat(parser)!: support tabs")
+    assert (commit.type, commit.scope, commit.breaking) == ("feat", "parser", True)
+    assert commit.format() == "* **parser:** support tabs (BREAKING)"
+    commit = changelog.Commit.parse("abc", "did: a thing: yes")
+    assert commit.section == changelog.OTHERS
+    assert changelog.Commit.parse("abc", "no type here").format() == "* no type here"
+
+
+def test__get_commits(repo: Pathier):
+    assert changelog.get_last_tag(repo, "v") == "v0.0.1"
+    assert changelog.get_last_tag(repo, "release-") is None
+    commits = changelog.get_commits(repo, "v0.0.1")
+    assert [commit.subject for commit in commits][::2] == [
+        "chore: update changelog",
+        "update readme",
+        "chore: build v0.0.2",
+    ]
+    assert len(changelog.get_commits(repo)) == 7
+
+
+def test__update_changelog(repo: Pathier):
+    path = repo / "CHANGELOG.md"
+    path.write_text(
+        "# Changelog\n\n## v0.0.1 (2024-01-01)\n\n#### New Features\n\n* first feature\n\n\n"
+    )
+    assert changelog.update_changelog(path, repo, "v0.0.2", "v")
+    today = date.today().isoformat()
+    assert path.read_text() == (
+        "# Changelog\n\n"
+        f"## v0.0.2 ({today})\n\n"
+        "#### Fixes\n\n* **cli:** handle empty args\n"
+        "#### Refactorings\n\n* rename everything (BREAKING)\n"
+        "#### Docs\n\n* add usage\n"
+        "#### Others\n\n* update readme\n\n\n"
+        "## v0.0.1 (2024-01-01)\n\n#### New Features\n\n* first feature\n\n\n"
+    )
+    assert not (repo / "CHANGELOG.md.tmp").exists()
+    # Nothing new since the latest tag
+    subprocess.run(["git", "tag", "v0.0.2"], cwd=repo, check=True)
+    commit(repo, "chore: update changelog")
+    assert not changelog.update_changelog(path, repo, "v0.0.3", "v")
+
+
+def test__prepend_section_creates_file(tmp_path):
+    path = Pathier(tmp_path) / "CHANGELOG.md"
+    changelog.prepend_section(path, "## v1 (2024-01-01)\n\n")
+    assert path.read_text() == "# Changelog\n\n## v1 (2024-01-01)\n\n"
@@ -0,0 +1,112 @@
+import io
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+from pathier import Pathier
+
+from hassle import daemon
+from hassle.models import HassleProject
+
+
+def send(path: str, message: dict) -> tuple[int, str]:
+    output = io.BytesIO()
+    exit_code = daemon.request(daemon.connect(path), message, output)
+    return exit_code, output.getvalue().decode()
+
+
+def test__daemon(tmp_path, make_project):
+    projectdir = Pathier(tmp_path) / "warm"
+    make_project(projectdir)
+    path = str(Pathier(tmp_path) / "hassle.sock")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "hassle.hassle_cli", "daemon", "-s", path],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        for _ in range(100):
+            if daemon.is_running(path):
+                break
+            time.sleep(0.1)
+        command = {
+            "argv": ["test"],
+            "cwd": str(projectdir),
+            "env": daemon.get_forwarded_env(os.environ),
+        }
+        exit_code, output = send(path, command)
+        # The tests run in another process, so this is output from it
+        assert exit_code == 0 and "1 passed" in output
+        assert send(path, command | {"argv": ["format"]})[0] == 0
+        assert (
+            "2 commands run, 1 projects loaded" in send(path, {"control": "status"})[1]
+        )
+        (projectdir / "tests" / "test_it.py").write_text(
+            "def test__it():\n    assert False\n"
+        )
+        assert send(path, command)[0] == 1
+        assert "0 projects loaded" in send(path, {"control": "status"})[1]
+        assert send(path, {"control": "stop"})[0] == 0
+        process.wait(10)
+        assert not daemon.is_running(path) and not os.path.exists(path)
+    finally:
+        process.kill()
+
+
+def test__daemon_project_invalidation(tmp_path, make_project):
+    projectdir = Pathier(tmp_path) / "warm"
+    make_project(projectdir)
+    server = daemon.Daemon(str(Pathier(tmp_path) / "hassle.sock"))
+    try:
+        project = HassleProject.load(projectdir)
+        server.projects[str(projectdir)] = (
+            daemon.get_pyproject_key(str(projectdir)),
+            project,
+        )
+        assert server.get_project(str(projectdir)) is project
+        project.pyproject.project.description = "changed"
+        project.save()
+        assert server.get_project(str(projectdir)) is None
+        assert not server.projects
+    finally:
+        server.server_close()
+
+
+def test__daemon_socket_dir(tmp_path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    monkeypatch.delenv("HASSLE_SOCKET", raising=False)
+    assert daemon.get_socket_path() == str(Pathier(tmp_path) / "hassle" / "hassle.sock")
+    assert os.stat(Pathier(tmp_path) / "hassle").st_mode & 0o777 == 0o700
+    os.chmod(Pathier(tmp_path) / "hassle", 0o755)
+    with pytest.raises(PermissionError):
+        daemon.get_socket_dir()
+
+
+def test__daemon_refuses_other_users(tmp_path, monkeypatch: pytest.MonkeyPatch):
+    path = str(Pathier(tmp_path) / "hassle.sock")
+    server = daemon.Daemon(path)
+    try:
+        assert daemon.is_running(path)
+        uid = os.getuid()
+        monkeypatch.setattr(os, "getuid", lambda: uid + 1)
+        with pytest.raises(PermissionError):
+            daemon.connect(path)
+        assert not daemon.is_running(path)
+    finally:
+        server.server_close()
+
+
+def test__get_forwarded_env():
+    env = {
+        "PATH": "/bin",
+        "LC_ALL": "C",
+        "HASSLE_SOCKET": "here",
+        "TWINE_PASSWORD": "secret",
+        "GITHUB_TOKEN": "secret",
+    }
+    assert daemon.get_forwarded_env(env) == {
+        "PATH": "/bin",
+        "LC_ALL": "C",
+        "HASSLE_SOCKET": "here",
+    }
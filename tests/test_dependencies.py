@@ -0,0 +1,128 @@
+import importlib.metadata
+import os
+from dataclasses import asdict
+
+from pathier import Pathier
+
+from hassle import dependencies
+from hassle.dependencies import DistributionIndex, RequirementSet
+
+SOURCE = """
+import os, sys
+import pathier.pathier
+from typing_extensions import Self
+from . import sibling
+from .sibling import thing
+from dummy import more_dummy
+import not_an_installed_package
+
+def lazy():
+    import pytest
+"""
+
+
+def test__get_imports():
+    assert dependencies.get_imports(SOURCE) == [
+        "dummy",
+        "not_an_installed_package",
+        "os",
+        "pathier",
+        "pytest",
+        "sys",
+        "typing_extensions",
+    ]
+
+
+def test__get_dependencies(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    srcdir = Pathier(tmp_path) / "src" / "dummy"
+    (srcdir / "dummy.py").write_text(SOURCE)
+    (srcdir / "more_dummy.py").write_text("import requests\n")
+    cache_path = Pathier(tmp_path) / ".hassle" / "cache" / "imports.json"
+    found = dependencies.get_dependencies(srcdir, cache_path)
+    assert [dependency.import_name for dependency in found] == [
+        "pathier",
+        "pytest",
+        "requests",
+        "typing_extensions",
+    ]
+    assert found[0].get_formatted_requirement() == "pathier"
+    assert found[0].get_formatted_requirement(">=").startswith("pathier>=")
+    assert cache_path.exists()
+
+
+def test__scan_imports_cache(tmp_path, monkeypatch):
+    projectdir = Pathier(tmp_path)
+    file = projectdir / "thing.py"
+    file.write_text("import requests\n")
+    cache_path = projectdir / "imports.json"
+    assert dependencies.scan_imports([file], cache_path) == {str(file): ["requests"]}
+
+    parsed: list[str] = []
+    scan_file = dependencies.scan_file
+    monkeypatch.setattr(
+        dependencies, "scan_file", lambda path: parsed.append(path) or scan_file(path)
+    )
+    # Unchanged
+    assert dependencies.scan_imports([file], cache_path) == {str(file): ["requests"]}
+    # Touched, but the content is the same
+    os.utime(file, ns=(0, 0))
+    assert dependencies.scan_imports([file], cache_path) == {str(file): ["requests"]}
+    assert parsed == []
+    file.write_text("import pathier\n")
+    assert dependencies.scan_imports([file], cache_path) == {str(file): ["pathier"]}
+    assert parsed == [str(file)]
+
+
+def test__scan_imports_in_parallel(tmp_path):
+    projectdir = Pathier(tmp_path)
+    files = []
+    for i in range(dependencies.MIN_PARALLEL_FILES):
+        file = projectdir / f"module{i}.py"
+        file.write_text(f"import package{i}\n")
+        files.append(file)
+    (projectdir / "broken.py").write_text("import (\n")
+    files.append(projectdir / "broken.py")
+    imports = dependencies.scan_imports(files, projectdir / "imports.json", 2)
+    assert len(imports) == dependencies.MIN_PARALLEL_FILES
+    assert imports[str(files[3])] == ["package3"]
+
+
+def test__requirement_set():
+    requirements = RequirementSet(
+        ["beautifulsoup4>=4.0", "pipx", "Typing.Extensions", "requests[socks]~=2.0"]
+    )
+    assert len(requirements) == 4
+    # Substring matches aren't matches
+    assert "bs4" not in requirements
+    assert "pip" not in requirements
+    assert "typing_extensions" in requirements
+    assert "requests" in requirements
+    assert not requirements.add("typing-extensions>=4.0")
+    assert requirements.add("pip")
+    assert requirements.add("requests>=2.31", replace=True)
+    assert requirements.get("REQUESTS") == "requests>=2.31"
+    assert list(requirements) == [
+        "beautifulsoup4>=4.0",
+        "pipx",
+        "Typing.Extensions",
+        "requests>=2.31",
+        "pip",
+    ]
+
+
+def test__distribution_index(tmp_path):
+    path = Pathier(tmp_path) / "distributions.json"
+    index = DistributionIndex.load(path)
+    assert path.exists()
+    assert index.get_distribution("pathier") == "pathier"
+    assert index.get_distribution("not_an_installed_package") is None
+    assert index.get_version("Pathier") == importlib.metadata.version("pathier")
+    # Reused while site-packages is unchanged
+    index.versions["pathier"] = "cached"
+    path.dumps(asdict(index))
+    assert DistributionIndex.load(path).get_version("pathier") == "cached"
+    # Rebuilt when it isn't
+    index.key = "stale"
+    path.dumps(asdict(index))
+    assert DistributionIndex.load(path).get_version("pathier") != "cached"
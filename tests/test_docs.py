@@ -0,0 +1,64 @@
+from pathier import Pathier
+
+from hassle.docs import generate_docs, get_modules, get_project_imports
+
+MODULES = [
+    "docspkg",
+    "docspkg.core",
+    "docspkg.extra",
+    "docspkg.sub",
+    "docspkg.sub.deep",
+]
+
+
+def make_package(root: Pathier) -> Pathier:
+    package = root / "src" / "docspkg"
+    (package / "sub").mkdir()
+    (package / "__init__.py").write_text(
+        '"""Top level."""\nfrom .core import thing\n\n__all__ = ["thing"]\n'
+    )
+    (package / "core.py").write_text('def thing():\n    """Do a thing."""\n')
+    (package / "extra.py").write_text('def other():\n    """Do another thing."""\n')
+    (package / "_private.py").write_text("")
+    (package / "sub" / "__init__.py").write_text("")
+    (package / "sub" / "deep.py").write_text("from docspkg.extra import other\n")
+    return package
+
+
+def test__get_modules(tmp_path):
+    assert list(get_modules(make_package(Pathier(tmp_path)))) == MODULES
+
+
+def test__get_project_imports():
+    source = (
+        "import os\nfrom . import core\nfrom ..extra import other\nimport docspkg.sub"
+    )
+    assert get_project_imports(source, "docspkg.sub.deep", False, MODULES) == {
+        "docspkg.extra",
+        "docspkg.sub",
+    }
+    assert get_project_imports(source, "docspkg", True, MODULES) == {
+        "docspkg.core",
+        "docspkg.sub",
+    }
+
+
+def test__generate_docs(tmp_path):
+    root = Pathier(tmp_path)
+    package = make_package(root)
+    docsdir = root / "docs"
+    manifest = root / ".hassle" / "cache" / "docs.json"
+    report = generate_docs(package, docsdir, manifest, workers=1)
+    assert (report.rendered, report.total) == (5, 5)
+    assert "Do a thing." in (docsdir / "docspkg" / "core.html").read_text()
+    assert (docsdir / "index.html").exists() and (docsdir / "search.js").exists()
+    assert generate_docs(package, docsdir, manifest, workers=1).rendered == 0
+    # `docspkg` re-exports from `core`
+    (package / "core.py").write_text('def thing():\n    """Do a new thing."""\n')
+    assert generate_docs(package, docsdir, manifest, workers=1).rendered == 2
+    assert "Do a new thing." in (docsdir / "docspkg.html").read_text()
+    (package / "extra.py").unlink()
+    (package / "sub" / "deep.py").write_text("")
+    report = generate_docs(package, docsdir, manifest, workers=1)
+    assert (report.rendered, report.removed) == (4, 1)
+    assert not (docsdir / "docspkg" / "extra.html").exists()
@@ -0,0 +1,79 @@
+import os
+import re
+
+from pathier import Pathier
+
+from hassle.files import FileIndex, iter_text, search
+
+
+def test__file_index(tmp_path):
+    projectdir = Pathier(tmp_path)
+    for path in [
+        "src/thing/__init__.py",
+        "src/thing/data.json",
+        "tests/test_thing.py",
+        "docs/conf.py",
+        "dist/leftover.py",
+        "htmlcov/index.html",
+        "scratch/notes.py",
+        ".venv/lib/site.py",
+        "src/thing/__pycache__/cached.py",
+    ]:
+        (projectdir / path).touch()
+    (projectdir / ".venv" / "pyvenv.cfg").touch()
+    (projectdir / ".gitignore").write_text("scratch\n")
+    index = FileIndex(projectdir)
+    assert sorted(index.entries) == [
+        ".gitignore",
+        "docs/conf.py",
+        "src/thing/__init__.py",
+        "src/thing/data.json",
+        "tests/test_thing.py",
+    ]
+    assert index.select(".py", exclude=["docs"]) == [
+        projectdir / "src/thing/__init__.py",
+        projectdir / "tests/test_thing.py",
+    ]
+    assert index.select(directory=projectdir / "src" / "thing") == [
+        projectdir / "src/thing/__init__.py",
+        projectdir / "src/thing/data.json",
+    ]
+
+
+def test__file_index_refresh(tmp_path):
+    projectdir = Pathier(tmp_path)
+    (projectdir / "src" / "a.py").write_text("a = 1\n")
+    (projectdir / "src" / "b.py").write_text("b = 1\n")
+    index = FileIndex(projectdir)
+    entry = index["src/a.py"]
+    hash_ = entry.hash
+    assert index.refresh() == set()
+    assert index["src/a.py"] is entry
+    (projectdir / "src" / "a.py").write_text("a = 22\n")
+    (projectdir / "src" / "b.py").delete()
+    (projectdir / "src" / "c.py").touch()
+    assert index.refresh() == {"src/a.py", "src/b.py", "src/c.py"}
+    assert index["src/a.py"].hash != hash_ and "src/b.py" not in index
+    # Ignoring a file takes effect without the directory changing
+    stat = os.stat(projectdir / "src")
+    (projectdir / ".gitignore").write_text("c.py\n")
+    os.utime(projectdir / "src", ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert index.refresh() == {".gitignore", "src/c.py"}
+
+
+def test__search(tmp_path):
+    projectdir = Pathier(tmp_path)
+    (projectdir / "a.py").write_text(
+        "import os\n\n\ndef thing():\n    return 'thing'\n"
+    )
+    (projectdir / "empty.py").touch()
+    matches = list(
+        search([projectdir / "a.py", projectdir / "empty.py"], re.compile(r"thing\w*"))
+    )
+    assert [(match.line, match.offset, match.text) for match in matches] == [
+        (4, 16, "thing"),
+        (5, 37, "thing"),
+    ]
+    assert [path for path, _ in iter_text([projectdir / "a.py"])] == [
+        projectdir / "a.py"
+    ]
@@ -0,0 +1,66 @@
+from pathier import Pathier
+
+from hassle import formatting
+
+UNFORMATTED = "import sys\nimport os\nx = {  'a':1 }\n"
+
+
+def test__format_files_skips_unchanged(tmp_path):
+    projectdir = Pathier(tmp_path)
+    file = projectdir / "thing.py"
+    file.write_text(UNFORMATTED)
+    cache_path = projectdir / ".hassle" / "cache" / "format.json"
+
+    report = formatting.format_files(projectdir, [file], cache_path)
+    assert report.formatted == 1 and report.skipped == 0
+    formatted = file.read_text()
+    assert formatted == 'import os\nimport sys\n\nx = {"a": 1}\n'
+    assert cache_path.exists()
+
+    report = formatting.format_files(projectdir, [file], cache_path)
+    assert report.formatted == 0 and report.skipped == 1
+    assert report.hit_rate == 1.0
+    assert file.read_text() == formatted
+
+    file.write_text(UNFORMATTED)
+    report = formatting.format_files(projectdir, [file], cache_path)
+    assert report.formatted == 1
+
+
+def test__format_file_isort_skip_file(tmp_path):
+    file = Pathier(tmp_path) / "thing.py"
+    file.write_text(f"# isort: skip_file\n{UNFORMATTED}")
+    result = formatting.format_file(str(file), str(tmp_path))
+    assert not result.error and result.changed
+    # The imports are left alone, but black still runs
+    assert (
+        file.read_text()
+        == '# isort: skip_file\nimport sys\nimport os\n\nx = {"a": 1}\n'
+    )
+
+
+def test__format_cache_key_mismatch(tmp_path):
+    cache_path = Pathier(tmp_path) / "format.json"
+    formatting.FormatCache("old", {"thing.py": "abc"}).dump(cache_path)
+    assert formatting.FormatCache.load(cache_path, "old").files
+    assert not formatting.FormatCache.load(cache_path, "new").files
+
+
+def test__format_files_in_parallel(tmp_path):
+    projectdir = Pathier(tmp_path)
+    files = [projectdir / f"thing{i}.py" for i in range(formatting.MIN_PARALLEL_FILES)]
+    for file in files:
+        file.write_text(UNFORMATTED)
+    (projectdir / "broken.py").write_text("def oops(:\n")
+    files.append(projectdir / "broken.py")
+    report = formatting.format_files(projectdir, files, projectdir / "format.json", 2)
+    assert report.formatted == len(files)
+    assert report.changed == len(files) - 1
+    assert list(report.errors) == ["broken.py"]
+    assert all(
+        file.read_text() == 'import os\nimport sys\n\nx = {"a": 1}\n'
+        for file in files[:-1]
+    )
+    # Files that failed to format aren't cached
+    report = formatting.format_files(projectdir, files, projectdir / "format.json", 2)
+    assert report.formatted == 1 and "broken.py" in report.errors
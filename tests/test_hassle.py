@@ -2,7 +2,7 @@ import pytest
 from pathier import Pathier
 
 from hassle import utilities
-from hassle.models import HassleConfig, HassleProject, Pyproject
+from hassle.models import HassleConfig, HassleProject, Pyproject, TomlModel
 
 root = Pathier(__file__).parent
 
@@ -77,6 +77,81 @@ def test__hassleproject(dummy_projectdir: Pathier, config_path: Pathier):
     print((dummy_projectdir / "pyproject.toml").read_text())
 
 
+def test__pyproject_load_cache(tmp_path):
+    path = Pathier(tmp_path) / "pyproject.toml"
+    Pyproject.from_template().dump(path)
+    first = Pyproject.load(path)
+    second = Pyproject.load(path)
+    assert first == second and first is not second
+    first.project.keywords.append("changed")
+    assert not first.is_saved(path) and second.is_saved(path)
+    assert "changed" not in Pyproject.load(path).project.keywords
+    # Edits made outside of hassle are picked up
+    path.write_text(path.read_text().replace('version = "0.0.0"', 'version = "10.0.0"'))
+    assert Pyproject.load(path).project.version == "10.0.0"
+    assert not list(Pathier(tmp_path).glob(".*tmp*"))
+
+
+def test__hassleproject_save_if_changed(tmp_path):
+    projectdir = Pathier(tmp_path)
+    pyproject = Pyproject.from_template()
+    pyproject.project.name = "saved"
+    pyproject.dump(projectdir / "pyproject.toml")
+    project = HassleProject.load(projectdir)
+    project.pyproject_path.write_text(project.pyproject_path.read_text() + "\n")
+    key = utilities.get_file_key(project.pyproject_path)
+    project.save()
+    assert utilities.get_file_key(project.pyproject_path) == key
+    project.version = "1.0.0"
+    project.save()
+    assert HassleProject.load(projectdir).version == "1.0.0"
+
+
+def test__hassleproject_source(tmp_path):
+    projectdir = Pathier(tmp_path)
+    pyproject = Pyproject.from_template()
+    pyproject.project.name = "source"
+    pyproject.dump(projectdir / "pyproject.toml")
+    (projectdir / "src" / "source" / "__init__.py").write_text("x = 1\n")
+    project = HassleProject.load(projectdir)
+    assert project.source_code == "x = 1\n"
+    assert project.source_code is project.source_code
+    (projectdir / "src" / "source" / "more.py").write_text("y = 2\n")
+    assert project.source_code == "x = 1\n\ny = 2\n"
+    assert [match.text for match in project.search_source("[xy] =")] == ["x =", "y ="]
+    assert len(list(project.iter_source())) == 2
+
+
+def test__toml_model_requires_methods():
+    with pytest.raises(TypeError, match="from_data"):
+
+        class Incomplete(TomlModel):
+            def to_data(self) -> dict:
+                return {}
+
+
+def test__utilities_file_lock(tmp_path):
+    import threading
+    import time
+
+    path = Pathier(tmp_path) / "lock"
+    order: list[str] = []
+
+    def hold():
+        with utilities.file_lock(path):
+            order.append("first")
+            time.sleep(0.2)
+            order.append("released")
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    time.sleep(0.05)
+    with utilities.file_lock(path):
+        order.append("second")
+    thread.join()
+    assert order == ["first", "released", "second"]
+
+
 def test__utilities_bump_version():
     version = "0.0.0"
     version = utilities.bump_version(version, "major")
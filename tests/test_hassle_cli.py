@@ -0,0 +1,73 @@
+import subprocess
+import sys
+
+from pathier import Pathier
+
+from hassle import hassle_cli
+
+# Cumulative import time, in seconds, `hassle help` is allowed to spend.
+IMPORT_BUDGET = 0.5
+HEAVY_MODULES = [
+    "black",
+    "isort",
+    "requests",
+    "bs4",
+    "dacite",
+    "packagelister",
+    "gitbetter",
+    "pip",
+]
+
+
+def get_import_times(*args: str) -> list[tuple[str, int, bool]]:
+    """Run `python -X importtime -m hassle.hassle_cli {args}`.
+
+    Returns a list of `(module, cumulative microseconds, is_top_level)` tuples."""
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "hassle.hassle_cli", *args],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    ).stderr
+    times: list[tuple[str, int, bool]] = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, package = line.split("|")
+        # Skip the header line
+        if not cumulative.strip().isdigit():
+            continue
+        # Nested imports are indented and already included in their parent's cumulative time
+        times.append((package.strip(), int(cumulative), not package.startswith("  ")))
+    return times
+
+
+def test__hassle_cli_help_import_budget():
+    times = get_import_times("help")
+    modules = [module for module, *_ in times]
+    assert "hassle" in modules
+    for module in HEAVY_MODULES:
+        assert module not in modules
+    total = sum(cumulative for _, cumulative, top_level in times if top_level)
+    assert total / 1_000_000 < IMPORT_BUDGET
+
+
+def test__workspace_passes_args_through(tmp_path, make_project):
+    root = Pathier(tmp_path)
+    make_project(root / "project")
+    args = ["workspace", "test", "-d", str(root), "-p", "1", "-a", "-k", "nothing"]
+    assert hassle_cli.run(args) == 0
+    # `-k nothing` reached pytest in the project
+    assert (
+        "1 deselected" in (root / ".hassle" / "workspace" / "project.log").read_text()
+    )
+
+
+def test__profile_output(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    assert hassle_cli.run(["help", "--profile"]) == 0
+    stats_path = Pathier(tmp_path) / ".hassle" / "profiles" / "hassle_help.pstats"
+    assert stats_path.exists()
+    assert f"Profile saved to {stats_path}" in capsys.readouterr().out
+    # Nothing is left in the project root
+    assert [path.name for path in Pathier(tmp_path).iterdir()] == [".hassle"]
@@ -0,0 +1,48 @@
+from pathier import Pathier
+
+from hassle.impact import FULL_RUN_INTERVAL, ImpactDatabase
+
+FOOTPRINTS = {
+    "tests/test_a.py::test__a": {"a.py": [1, 2], "tests/test_a.py": [4]},
+    "tests/test_b.py::test__b": {"b.py": [1], "tests/test_b.py": [4]},
+}
+HASHES = {"a.py": "1", "b.py": "1", "tests/test_a.py": "1", "tests/test_b.py": "1"}
+
+
+def make_database(path: Pathier) -> ImpactDatabase:
+    database = ImpactDatabase(path / "impact.db")
+    database.record_footprints(list(FOOTPRINTS), FOOTPRINTS, replace_all=True)
+    database.record_passing_run(HASHES, "deps", full=True)
+    return database
+
+
+def test__impact_select(tmp_path):
+    database = make_database(Pathier(tmp_path))
+    selection = database.select(HASHES | {"b.py": "2", "c.py": "1"}, "deps")
+    assert not selection.full
+    assert selection.changed == {"b.py", "c.py"}
+    assert selection.skip == {"tests/test_a.py::test__a"}
+    assert database.select(HASHES, "deps").skip == set(FOOTPRINTS)
+
+
+def test__impact_safety_valve(tmp_path):
+    database = make_database(Pathier(tmp_path))
+    assert database.select(HASHES, "other deps").full
+    assert database.select(HASHES | {"tests/conftest.py": "1"}, "deps").full
+    for _ in range(FULL_RUN_INTERVAL):
+        assert not database.select(HASHES, "deps").full
+        database.record_passing_run(HASHES, "deps", full=False)
+    assert database.select(HASHES, "deps").full
+    assert ImpactDatabase(Pathier(tmp_path) / "new.db").select(HASHES, "deps").full
+
+
+def test__impact_untracked_files(tmp_path):
+    database = make_database(Pathier(tmp_path))
+    database.record_passing_run(HASHES | {"constants.py": "1"}, "deps", full=True)
+    # Only ran at import, so no test's footprint has it
+    selection = database.select(HASHES | {"constants.py": "2"}, "deps")
+    assert selection.full and "constants.py" in selection.reason
+    assert database.select(HASHES, "deps").full
+    assert not database.select(
+        HASHES | {"constants.py": "1", "new.py": "1"}, "deps"
+    ).full
@@ -0,0 +1,66 @@
+import threading
+import time
+
+import pytest
+
+from hassle.pipeline import Pipeline, Stage
+
+
+def test__pipeline_runs_independent_stages_concurrently(capsys):
+    # Both stages have to be running at the same time to get past the barrier
+    barrier = threading.Barrier(2, timeout=5)
+    order: list[str] = []
+
+    def stage(name: str, delay: float = 0):
+        def func():
+            if name in ["docs", "dependencies"]:
+                barrier.wait()
+            time.sleep(delay)
+            print(f"output from {name}")
+            order.append(name)
+
+        return func
+
+    results = Pipeline(
+        [
+            Stage("format", stage("format")),
+            Stage("dependencies", stage("dependencies", 0.1), ["format"]),
+            Stage("docs", stage("docs"), ["format"]),
+            Stage("build", stage("build"), ["dependencies", "docs"]),
+        ]
+    ).run()
+    assert [result.name for result in results] == [
+        "format",
+        "dependencies",
+        "docs",
+        "build",
+    ]
+    assert order == ["format", "docs", "dependencies", "build"]
+    assert results[1].output == "output from dependencies\n"
+    # Output is printed in declaration order, not completion order
+    output = capsys.readouterr().out
+    assert output.index("output from dependencies") < output.index("output from docs")
+
+
+def test__pipeline_stops_on_failure():
+    ran: list[str] = []
+
+    def fail():
+        raise RuntimeError("nope")
+
+    with pytest.raises(RuntimeError, match="nope"):
+        Pipeline(
+            [
+                Stage("format", lambda: ran.append("format")),
+                Stage("dependencies", fail, ["format"]),
+                Stage("save", lambda: ran.append("save"), ["dependencies"]),
+            ]
+        ).run()
+    assert ran == ["format"]
+
+
+def test__pipeline_validation():
+    with pytest.raises(ValueError, match="Unknown"):
+        Pipeline([Stage("build", print, ["save"])])
+    with pytest.raises(ValueError, match="Circular"):
+        Pipeline([Stage("a", print, ["b"]), Stage("b", print, ["a"])])
@@ -0,0 +1,33 @@
+import pstats
+
+from pathier import Pathier
+
+from hassle import profiling
+
+
+def fib(n: int) -> int:
+    return n if n < 2 else fib(n - 1) + fib(n - 2)
+
+
+def outer() -> int:
+    return fib(15) + sum(range(100_000))
+
+
+def test__profile_call(tmp_path, capsys):
+    stem = Pathier(tmp_path) / "hassle_test"
+    assert profiling.profile_call(outer, output_stem=stem, top=5) == outer()
+    output = capsys.readouterr().out
+    assert "cumulative" in output
+    stats_path = stem.with_name("hassle_test.pstats")
+    assert stats_path.exists()
+    assert pstats.Stats(str(stats_path)).total_calls  # type: ignore
+    lines = stem.with_name("hassle_test.collapsed").read_text().splitlines()
+    assert lines
+    for line in lines:
+        stack, micros = line.rsplit(" ", 1)
+        assert int(micros) > 0
+        assert " " not in stack
+    # fib is only ever reached through outer, and its recursion is folded into one frame
+    fib_stacks = [line for line in lines if ":fib:" in line]
+    assert fib_stacks
+    assert all(":outer:" in line and line.count(":fib:") == 1 for line in fib_stacks)
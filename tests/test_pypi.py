@@ -0,0 +1,190 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator
+
+import pytest
+from pathier import Pathier
+
+from hassle import utilities
+from hassle.pypi import SIMPLE_JSON, NameIndex, PypiClient
+
+PROJECTS = {"hassle": ["3.1.8", "3.1.9"]}
+SIMPLE_NAMES = ["hassle", "Zope.Interface", "pathier", "a", "typing_extensions"]
+
+
+class FakePypi(BaseHTTPRequestHandler):
+    """Stand-in for the pypi.org JSON API."""
+
+    requests: list[tuple[str, str | None]] = []
+    # Number of `503`s to respond with before behaving normally
+    failures = 0
+    # Serve the simple index as html even if json is requested
+    simple_html = False
+    # Seconds to wait before responding to a project request
+    delay = 0.0
+
+    def log_message(self, *args: object): ...
+
+    def send_body(self, body: bytes, content_type: str):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_simple_index(self):
+        if SIMPLE_JSON in self.headers.get("Accept", "") and not self.simple_html:
+            projects = [{"name": name} for name in SIMPLE_NAMES]
+            self.send_body(json.dumps({"projects": projects}).encode(), SIMPLE_JSON)
+        else:
+            links = "\n".join(
+                f'<a href="/simple/{name}/">{name}</a>' for name in SIMPLE_NAMES
+            )
+            self.send_body(
+                f"<!DOCTYPE html><html><body>\n{links}\n</body></html>".encode(),
+                "text/html",
+            )
+
+    def send_json(self, data: object, etag: str):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers.get("If-None-Match")))
+        if FakePypi.failures:
+            FakePypi.failures -= 1
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path == "/simple/":
+            self.send_simple_index()
+            return
+        time.sleep(FakePypi.delay)
+        parts = self.path.strip("/").split("/")
+        name = parts[1]
+        if name not in PROJECTS:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        etag = f'"{name}-{len(PROJECTS[name])}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_json(
+            {
+                "info": {"name": name, "version": PROJECTS[name][-1]},
+                "releases": {version: [] for version in PROJECTS[name]},
+            },
+            etag,
+        )
+
+
+@pytest.fixture(scope="module")
+def server() -> Iterator[str]:
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), FakePypi)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+
+
+@pytest.fixture
+def client(server: str, tmp_path) -> Iterator[PypiClient]:
+    FakePypi.requests.clear()
+    client = PypiClient(server, Pathier(tmp_path), timeout=5, backoff=0)
+    yield client
+    client.close()
+
+
+def test__pypi_exists(client: PypiClient):
+    assert client.exists("hassle")
+    assert client.exists("HASSLE")
+    assert not client.exists("hassles")
+    assert client.version_exists("hassle", "3.1.9")
+    assert not client.version_exists("hassle", "9.9.9")
+
+
+def test__pypi_revalidates_cache(client: PypiClient):
+    assert client.get_project("hassle")["info"] == {  # type: ignore
+        "name": "hassle",
+        "version": "3.1.9",
+    }
+    assert client.get_project("hassle")["info"]["version"] == "3.1.9"  # type: ignore
+    assert FakePypi.requests == [
+        ("/pypi/hassle/json", None),
+        ("/pypi/hassle/json", '"hassle-2"'),
+    ]
+
+
+def test__pypi_retries(client: PypiClient):
+    FakePypi.failures = 2
+    assert client.exists("hassle")
+    assert len(FakePypi.requests) == 3
+    FakePypi.failures = client.retries + 1
+    with pytest.raises(RuntimeError, match="503"):
+        client.exists("hassle")
+
+
+@pytest.mark.parametrize("simple_html", [False, True])
+def test__name_index_sync(client: PypiClient, tmp_path, simple_html: bool):
+    FakePypi.simple_html = simple_html
+    index = NameIndex(Pathier(tmp_path) / "index" / "names.txt")
+    assert not index.exists()
+    assert index.sync(client) == len(SIMPLE_NAMES)
+    assert index.path.read_text().splitlines() == [
+        "a",
+        "hassle",
+        "pathier",
+        "typing-extensions",
+        "zope-interface",
+    ]
+    for name in SIMPLE_NAMES + ["zope_interface", "Typing.Extensions"]:
+        assert name in index
+    for name in ["b", "hass", "hassles", "zzz", ""]:
+        assert name not in index
+    index.close()
+    FakePypi.simple_html = False
+
+
+def test__name_index_empty(tmp_path):
+    index = NameIndex(Pathier(tmp_path) / "names.txt")
+    index.write([])
+    assert "hassle" not in index
+    assert len(index) == 0
+
+
+def test__check_pypi_uses_index(tmp_path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    NameIndex.default().write(["hassle"])
+    assert utilities.check_pypi("hassle")
+    assert not utilities.check_pypi("not-a-real-package-name-probably")
+
+
+def test__pypi_exists_many(client: PypiClient):
+    FakePypi.delay = 0.2
+    names = ["hassle"] + [f"not-hassle-{i}" for i in range(19)]
+    start = time.perf_counter()
+    # More than the default executor's threads and the client's pool size
+    results = client.exists_many(names, concurrency=20)
+    elapsed = time.perf_counter() - start
+    FakePypi.delay = 0
+    assert results == {name: name == "hassle" for name in names}
+    # All twenty requests are in flight together, so this takes about as long as one
+    assert elapsed < 0.2 * 3
+    assert client.session.get_adapter(client.base_url)._pool_maxsize >= 20  # type: ignore
+
+
+def test__pypi_exists_many_errors(client: PypiClient):
+    FakePypi.failures = client.retries + 1
+    results = client.exists_many(["hassle"], concurrency=1)
+    assert isinstance(results["hassle"], RuntimeError)
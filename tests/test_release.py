@@ -0,0 +1,67 @@
+import subprocess
+
+import pytest
+from pathier import Pathier
+
+from hassle.release import Repository
+
+
+def git(repo: Pathier, *args: str) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=repo, capture_output=True, text=True, check=True
+    ).stdout.strip()
+
+
+@pytest.fixture
+def remote(tmp_path, git_identity) -> Pathier:
+    remote = Pathier(tmp_path) / "remote.git"
+    subprocess.run(
+        ["git", "init", "-q", "--bare", "-b", "main", str(remote)], check=True
+    )
+    seed = Pathier(tmp_path) / "seed"
+    git(Pathier(tmp_path), "clone", "-q", str(remote), str(seed))
+    (seed / "README.md").write_text("hello\n")
+    git(seed, "add", "README.md")
+    git(seed, "commit", "-q", "-m", "feat: first feature")
+    git(seed, "push", "-q", "origin", "HEAD:main")
+    return remote
+
+
+def clone(remote: Pathier, name: str) -> Pathier:
+    repo = remote.parent / name
+    git(remote.parent, "clone", "-q", str(remote), str(repo))
+    return repo
+
+
+def test__repository_release(remote: Pathier):
+    repo = clone(remote, "project")
+    repository = Repository(repo)
+    assert repository.branch == "main" and repository.remote == "origin"
+    assert repository.on_primary_branch()
+    (repo / "README.md").write_text("changed\n")
+    (repo / "dist").mkdir()
+    (repo / "dist" / "project-0.0.2.tar.gz").write_text("sdist")
+    repository.commit("chore: build v0.0.2", [repo / "dist", repo / "docs"])
+    repository.tag("v0.0.2")
+    repository.push(["v0.0.2"])
+    # One lookup for the branch and remote, then add, commit, tag, and push
+    assert repository.calls == 5
+    assert git(remote, "rev-parse", "main") == git(repo, "rev-parse", "HEAD")
+    assert git(remote, "rev-parse", "v0.0.2^{commit}") == git(repo, "rev-parse", "HEAD")
+    assert git(remote, "show", "main:dist/project-0.0.2.tar.gz") == "sdist"
+    assert git(repo, "status", "--porcelain") == ""
+
+
+def test__repository_push_pulls_when_behind(remote: Pathier):
+    repo = clone(remote, "project")
+    other = clone(remote, "other")
+    git(other, "commit", "-q", "--allow-empty", "-m", "fix: from elsewhere")
+    git(other, "push", "-q", "origin", "main")
+    repository = Repository(repo)
+    (repo / "README.md").write_text("changed\n")
+    repository.commit("chore: build v0.0.2")
+    repository.tag("v0.0.2")
+    repository.push(["v0.0.2"])
+    assert git(remote, "rev-parse", "main") == git(repo, "rev-parse", "HEAD")
+    assert "fix: from elsewhere" in git(remote, "log", "--format=%s", "main")
+    assert git(remote, "tag") == "v0.0.2"
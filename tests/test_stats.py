@@ -0,0 +1,43 @@
+from pathier import Pathier
+
+from hassle import stats
+
+
+def test__stage_timer():
+    timer = stats.StageTimer()
+    with timer.time("tests"):
+        ...
+    timer.add("git commit", 1.0)
+    timer.add("git commit", 2.0)
+    assert list(timer.durations) == ["tests", "git commit"]
+    assert timer.durations["git commit"] == 3.0
+
+
+def test__percentile():
+    values = [float(i) for i in range(1, 101)]
+    assert stats.percentile(values, 50) == 50
+    assert stats.percentile(values, 90) == 90
+    assert stats.percentile([3.0], 99) == 3.0
+
+
+def test__build_history(tmp_path):
+    history = stats.BuildHistory(Pathier(tmp_path) / ".hassle" / "history.db")
+    for seconds in [1.0, 1.1, 0.9, 1.0]:
+        history.record("build", {"format": seconds, "docs": 2.0})
+    history.record("build", {"format": 1.5, "docs": 2.1})
+    history.record("update", {"git push": 3.0})
+    assert history.get_commands() == ["build", "update"]
+    assert history.get_durations("build")["format"] == [1.0, 1.1, 0.9, 1.0, 1.5]
+
+    build = {stat.stage: stat for stat in history.get_stats("build")}
+    assert build["format"].runs == 5
+    assert build["format"].latest == 1.5
+    assert build["format"].baseline == 1.0
+    assert build["format"].regressed(0.2)
+    assert not build["docs"].regressed(0.2)
+    (push,) = history.get_stats("update")
+    assert push.baseline is None and not push.regressed(0.2)
+
+    table = stats.format_stats(list(build.values()), 0.2)
+    assert "REGRESSED" in table.splitlines()[2]
+    assert "REGRESSED" not in table.splitlines()[3]
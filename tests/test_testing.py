@@ -0,0 +1,113 @@
+import json
+import subprocess
+import sys
+
+from pathier import Pathier
+
+from hassle.impact import ImpactDatabase
+from hassle.stats import StageTimer
+from hassle.testing import DURATIONS_PATH, IMPACT_PATH, assign_shards, run_tests
+
+
+def get_files(passing: bool = True) -> dict[str, str]:
+    """A module with an untested function and a test for the other one."""
+    return {
+        "calc.py": "def add(a, b):\n    return a + b\n\n\ndef sub(a, b):\n    return a - b\n",
+        "tests/test_calc.py": f"import calc\n\n\ndef test__add():\n    assert calc.add(1, 1) == {2 if passing else 3}\n",
+    }
+
+
+def test__run_tests(tmp_path, capfd, make_project):
+    projectdir = make_project(Pathier(tmp_path), files=get_files())
+    timer = StageTimer()
+    assert run_tests(projectdir, summary="json", timer=timer)
+    assert list(timer.durations) == [
+        "test impact",
+        "tests",
+        "coverage report",
+        "coverage json",
+    ]
+    assert "calc.py" in capfd.readouterr().out
+    summary = json.loads((projectdir / "coverage.json").read_text())
+    # `sub` is never called
+    assert summary["files"][str(projectdir / "calc.py")]["missing_lines"] == [6]
+    assert not (projectdir / "htmlcov").exists()
+    assert run_tests(projectdir, ["-k", "nothing_matches"])
+
+
+def test__run_tests_html(tmp_path, make_project):
+    projectdir = make_project(Pathier(tmp_path), False, get_files(False))
+    assert not run_tests(projectdir, html=True)
+    assert (projectdir / "htmlcov" / "index.html").exists()
+
+
+def test__assign_shards():
+    durations = {"a": 4.0, "b": 3.0, "c": 2.0, "d": 1.0}
+    assert assign_shards(["d", "c", "b", "a"], durations, 2) == [["a", "d"], ["b", "c"]]
+    # Unknown tests are assumed to take the average (2.5s)
+    assert assign_shards(["a", "e", "d"], durations, 2) == [["a"], ["e", "d"]]
+    assert assign_shards([], {}, 3) == [[], [], []]
+
+
+def test__run_tests_sharded(tmp_path, capfd, make_project):
+    projectdir = make_project(Pathier(tmp_path), files=get_files())
+    (projectdir / "tests" / "test_more.py").write_text(
+        "import calc\n\n\ndef test__sub():\n    assert calc.sub(2, 1) == 1\n\n\n"
+        "def test__both():\n    assert calc.sub(calc.add(1, 1), 1) == 1\n"
+    )
+    timer = StageTimer()
+    assert run_tests(projectdir, summary="json", timer=timer, jobs=2)
+    assert "coverage combine" in timer.durations
+    output = capfd.readouterr().out
+    assert "[shard 1/2]" in output and "[shard 2/2]" in output
+    assert not list(projectdir.glob(".coverage.shard*"))
+    summary = json.loads((projectdir / "coverage.json").read_text())
+    assert summary["files"][str(projectdir / "calc.py")]["missing_lines"] == []
+    durations = (projectdir / DURATIONS_PATH).loads()
+    assert sorted(durations) == [
+        "tests/test_calc.py::test__add",
+        "tests/test_it.py::test__it",
+        "tests/test_more.py::test__both",
+        "tests/test_more.py::test__sub",
+    ]
+
+
+def test__run_tests_affected(tmp_path, capfd, make_project):
+    projectdir = make_project(Pathier(tmp_path), files=get_files())
+    (projectdir / "other.py").write_text("def mul(a, b):\n    return a * b\n")
+    (projectdir / "tests" / "test_other.py").write_text(
+        "import other\n\n\ndef test__mul():\n    assert other.mul(2, 2) == 4\n"
+    )
+    assert run_tests(projectdir, affected=True)
+    assert "Running all tests: no previous passing run." in capfd.readouterr().out
+    footprints = ImpactDatabase(projectdir / IMPACT_PATH)
+    (projectdir / "other.py").write_text("def mul(a, b):\n    return b * a\n")
+    assert run_tests(projectdir, affected=True)
+    output = capfd.readouterr().out
+    assert (
+        "1 files changed since the last passing run, skipping 2 unaffected tests."
+        in output
+    )
+    assert "1 passed, 2 deselected" in output
+    assert footprints.get_state("runs_since_full") == "1"
+    # Nothing changed since the last passing run
+    assert run_tests(projectdir, affected=True)
+    assert "3 deselected" in capfd.readouterr().out
+    (projectdir / "conftest.py").write_text("")
+    assert run_tests(projectdir, affected=True)
+    assert "Running all tests: test configuration changed." in capfd.readouterr().out
+    assert footprints.get_state("runs_since_full") == "0"
+
+
+def test__run_tests_affected_from_cli(tmp_path, make_project):
+    projectdir = make_project(Pathier(tmp_path) / "project", files=get_files())
+    # The project directory is on `sys.path` and running the tests changes its mtime
+    for _ in range(2):
+        output = subprocess.run(
+            [sys.executable, "-m", "hassle.hassle_cli", "test", "--affected"],
+            cwd=projectdir,
+            capture_output=True,
+            text=True,
+        ).stdout
+    assert "0 files changed since the last passing run" in output
+    assert "2 deselected" in output
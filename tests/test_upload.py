@@ -0,0 +1,213 @@
+import email.parser
+import hashlib
+import io
+import json
+import tarfile
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator
+
+import pytest
+from pathier import Pathier
+
+from hassle import upload
+from hassle.upload import Uploader, UploadTarget
+
+METADATA = "Metadata-Version: 2.1\nName: dummy\nVersion: 0.0.1\nClassifier: A\nClassifier: B\n\nLong description\n"
+
+
+class FakeIndex(BaseHTTPRequestHandler):
+    """Stand-in for the legacy upload API and the JSON API of a package index."""
+
+    # File name to the fields it was uploaded with
+    files: dict[str, dict[str, list[str]]] = {}
+    uploads = 0
+    # Number of `503`s to respond to uploads with before behaving normally
+    failures = 0
+    # Number of JSON API requests to answer with a `404`, like a stale cache
+    stale_reads = 0
+    # Answer JSON API requests with html
+    html = False
+    # Whether any JSON API request had credentials
+    authorized_reads = False
+
+    def log_message(self, *args: object): ...
+
+    def respond(self, status: int, body: bytes = b""):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.headers["Authorization"]:
+            FakeIndex.authorized_reads = True
+        if FakeIndex.html:
+            self.respond(200, b"<!DOCTYPE html><html></html>")
+            return
+        if FakeIndex.stale_reads:
+            FakeIndex.stale_reads -= 1
+            self.respond(404)
+            return
+        _, name, version, _ = self.path.strip("/").split("/")
+        urls = [
+            {"filename": filename, "digests": {"sha256": fields["sha256_digest"][0]}}
+            for filename, fields in self.files.items()
+            if fields["name"] == [name] and fields["version"] == [version]
+        ]
+        if not urls:
+            self.respond(404)
+            return
+        self.respond(200, json.dumps({"urls": urls}).encode())
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        FakeIndex.uploads += 1
+        if FakeIndex.failures:
+            FakeIndex.failures -= 1
+            self.respond(503)
+            return
+        assert self.headers["Authorization"]
+        message = email.parser.BytesParser().parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body
+        )
+        fields: dict[str, list[str]] = {}
+        content = b""
+        filename = ""
+        for part in message.get_payload():  # type: ignore
+            name = part.get_param("name", header="Content-Disposition")
+            if name == "content":
+                filename = part.get_filename()
+                content = part.get_payload(decode=True)
+            else:
+                fields.setdefault(name, []).append(part.get_payload())
+        if filename in self.files:
+            self.respond(400, b"File already exists.")
+            return
+        assert fields["sha256_digest"] == [hashlib.sha256(content).hexdigest()]
+        self.files[filename] = fields
+        self.respond(200)
+
+
+@pytest.fixture(scope="module")
+def server() -> Iterator[str]:
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), FakeIndex)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+
+
+@pytest.fixture
+def target(server: str) -> UploadTarget:
+    FakeIndex.files.clear()
+    FakeIndex.uploads = 0
+    FakeIndex.authorized_reads = False
+    return UploadTarget("local", f"{server}/legacy/", "__token__", "pypi-token")
+
+
+def make_distributions(distdir: Pathier, readme: str = "") -> list[Pathier]:
+    distdir.mkdir()
+    wheel = distdir / "dummy-0.0.1-py3-none-any.whl"
+    with zipfile.ZipFile(wheel, "w") as archive:
+        archive.writestr("dummy/__init__.py", readme)
+        archive.writestr("dummy-0.0.1.dist-info/METADATA", METADATA)
+    sdist = distdir / "dummy-0.0.1.tar.gz"
+    with tarfile.open(sdist, "w:gz") as archive:
+        for name, content in [("README.md", readme), ("PKG-INFO", METADATA)]:
+            info = tarfile.TarInfo(f"dummy-0.0.1/{name}")
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content.encode()))
+    return [sdist, wheel]
+
+
+def test__get_target(tmp_path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.delenv("TWINE_USERNAME", raising=False)
+    monkeypatch.delenv("TWINE_PASSWORD", raising=False)
+    pypirc = Pathier(tmp_path) / ".pypirc"
+    pypirc.write_text(
+        "[distutils]\nindex-servers =\n    pypi\n    testpypi\n\n"
+        "[pypi]\npassword = pypi-one\n\n"
+        "[testpypi]\nrepository = https://test.pypi.org/legacy/\nusername = me\npassword = pypi-two\n"
+    )
+    target = upload.get_target("pypi", pypirc)
+    assert target.url == upload.DEFAULT_REPOSITORY
+    assert target.username == "__token__" and target.password == "pypi-one"
+    assert target.index_url == "https://pypi.org"
+    target = upload.get_target("testpypi", pypirc)
+    assert target.username == "me" and target.index_url == "https://test.pypi.org"
+    with pytest.raises(ValueError):
+        upload.get_target("elsewhere", pypirc)
+    monkeypatch.setenv("TWINE_PASSWORD", "pypi-env")
+    assert upload.get_target("pypi", pypirc).password == "pypi-env"
+
+
+def test__uploader(target: UploadTarget, tmp_path):
+    paths = make_distributions(Pathier(tmp_path) / "dist")
+    progress = Pathier(tmp_path) / "uploads.json"
+    uploader = Uploader(target, progress, backoff=0)
+    results = uploader.upload(paths)
+    assert [result.status for result in results] == ["uploaded", "uploaded"]
+    sdist = FakeIndex.files["dummy-0.0.1.tar.gz"]
+    assert sdist["filetype"] == ["sdist"] and sdist["pyversion"] == ["source"]
+    assert sdist["classifiers"] == ["A", "B"]
+    assert sdist["description"] == ["Long description\n"]
+    wheel = FakeIndex.files["dummy-0.0.1-py3-none-any.whl"]
+    assert wheel["filetype"] == ["bdist_wheel"] and wheel["pyversion"] == ["py3"]
+    assert wheel["sha256_digest"] == [hashlib.sha256(paths[1].read_bytes()).hexdigest()]
+    # Resumed from the progress record without asking the index
+    results = Uploader(target, progress).upload(paths)
+    assert [result.status for result in results] == ["skipped", "skipped"]
+    assert FakeIndex.uploads == 2
+    # Found on the index with the same hashes
+    results = Uploader(target).upload(paths)
+    assert [result.status for result in results] == ["skipped", "skipped"]
+    assert FakeIndex.uploads == 2
+    assert not FakeIndex.authorized_reads
+    uploader.close()
+
+
+def test__uploader_retries(target: UploadTarget, tmp_path):
+    paths = make_distributions(Pathier(tmp_path) / "dist")
+    FakeIndex.failures = 1
+    result = Uploader(target, jobs=1, backoff=0).upload(paths[:1])[0]
+    assert result.status == "uploaded" and result.attempts == 2
+    FakeIndex.failures = 2
+    result = Uploader(target, jobs=1, retries=1, backoff=0).upload(paths[1:])[0]
+    assert result.status == "failed" and "503" in str(result.error)
+    FakeIndex.failures = 0
+
+
+def test__uploader_different_file(target: UploadTarget, tmp_path):
+    paths = make_distributions(Pathier(tmp_path) / "dist")
+    Uploader(target).upload(paths)
+    paths = make_distributions(Pathier(tmp_path) / "other", "changed")
+    results = Uploader(target).upload(paths)
+    assert [result.status for result in results] == ["failed", "failed"]
+    assert "different" in str(results[0].error)
+
+
+def test__uploader_already_exists(target: UploadTarget, tmp_path):
+    paths = make_distributions(Pathier(tmp_path) / "dist")
+    Uploader(target).upload(paths)
+    # The index said they weren't there, but the upload says they are, and the hashes match
+    FakeIndex.stale_reads = 1
+    progress = Pathier(tmp_path) / "uploads.json"
+    results = Uploader(target, progress).upload(paths)
+    assert [result.status for result in results] == ["skipped", "skipped"]
+    assert FakeIndex.uploads == 4
+    # Same names, different content, and the index can't be checked
+    paths = make_distributions(Pathier(tmp_path) / "other", "changed")
+    FakeIndex.html = True
+    results = Uploader(target, progress).upload(paths)
+    FakeIndex.html = False
+    assert [result.status for result in results] == ["failed", "failed"]
+    assert "couldn't be checked" in str(results[0].error)
+    FakeIndex.stale_reads = 1
+    results = Uploader(target, progress).upload(paths)
+    assert [result.status for result in results] == ["failed", "failed"]
+    assert "different" in str(results[0].error)
+    assert not any(
+        upload.UploadProgress(progress).is_uploaded(target.url, path) for path in paths
+    )
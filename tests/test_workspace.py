@@ -0,0 +1,21 @@
+from pathier import Pathier
+
+from hassle import workspace
+
+
+def test__workspace(tmp_path, make_project):
+    root = Pathier(tmp_path)
+    make_project(root / "good", True)
+    make_project(root / "group" / "bad", False)
+    # Not a hassle project
+    (root / "other").mkdir()
+    (root / "other" / "pyproject.toml").write_text("[tool.black]\n")
+    # Inside a project
+    make_project(root / "good" / "nested", True)
+    projects = workspace.discover_projects(root)
+    assert projects == [root / "good", root / "group" / "bad"]
+    results = workspace.run_workspace(root, projects, ["test"], root / "logs", 2)
+    assert [result.passed for result in results] == [True, False]
+    assert "2 passed" in (root / "logs" / "good.log").read_text()
+    assert "1 failed" in (root / "logs" / "group-bad.log").read_text()
+    assert workspace.format_summary(root, results).endswith("1 passed, 1 failed")